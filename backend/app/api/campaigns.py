@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import case, select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime, date
 from ..core.database import get_db
+from ..core.etag import row_version_etag
+from ..core.response_cache import add_response_cache_tags, cache_response
+from ..core.pagination import apply_keyset, keyset_page
 from ..models.models import Campaign, CampaignDonation, User, Fund
 from ..schemas.schemas import CampaignCreate, CampaignUpdate, Campaign as CampaignSchema
 
@@ -11,7 +16,9 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[CampaignSchema])
+@cache_response(ttl="cache_ttl_campaign_data", tags=["campaigns:list"])
 async def get_campaigns(
+    response: Response,
     country_code: Optional[str] = Query(None, description="Фильтр по стране"),
     category: Optional[str] = Query(None, description="Фильтр по категории"),
     status: Optional[str] = Query("active", description="Фильтр по статусу"),
@@ -19,19 +26,20 @@ async def get_campaigns(
     sort_order: str = Query("desc", description="Порядок: asc, desc"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (из заголовка X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить список кампаний с фильтрацией"""
-    query = db.query(Campaign)
+    query = select(Campaign)
     
     if country_code:
-        query = query.filter(Campaign.country_code == country_code)
+        query = query.where(Campaign.country_code == country_code)
     
     if category:
-        query = query.filter(Campaign.category == category)
+        query = query.where(Campaign.category == category)
     
     if status:
-        query = query.filter(Campaign.status == status)
+        query = query.where(Campaign.status == status)
     
     # Сортировка
     if sort_by == "goal_amount":
@@ -41,19 +49,27 @@ async def get_campaigns(
     else:
         order_column = Campaign.created_at
     
-    if sort_order == "asc":
-        query = query.order_by(order_column.asc())
-    else:
-        query = query.order_by(order_column.desc())
+    # Keyset-пагинация по (колонка сортировки, id)
+    descending = sort_order != "asc"
+    columns = (order_column, Campaign.id)
+    sort_key = f"{order_column.key}:{'desc' if descending else 'asc'}"
+    query = apply_keyset(query, columns, descending, cursor, limit, sort_key)
+    if not cursor:
+        query = query.offset(offset)
     
-    campaigns = query.offset(offset).limit(limit).all()
-    return campaigns
+    campaigns = (await db.scalars(query)).all()
+    return keyset_page(campaigns, columns, limit, sort_key, response)
 
 
-@router.get("/{campaign_id}", response_model=CampaignSchema)
-async def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
+@router.get(
+    "/{campaign_id}",
+    response_model=CampaignSchema,
+    dependencies=[Depends(row_version_etag(Campaign, "campaign_id"))]
+)
+@cache_response(ttl="cache_ttl_campaign_data", tags=["campaign:{campaign_id}", "campaigns"])
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_db)):
     """Получить кампанию по ID"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.scalar(select(Campaign).where(Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -66,11 +82,11 @@ async def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
 async def create_campaign(
     campaign: CampaignCreate,
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать новую кампанию"""
     # Проверяем существование пользователя
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -79,7 +95,7 @@ async def create_campaign(
     
     # Проверяем фонд, если указан
     if campaign.fund_id:
-        fund = db.query(Fund).filter(Fund.id == campaign.fund_id).first()
+        fund = await db.scalar(select(Fund).where(Fund.id == campaign.fund_id))
         if not fund:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -91,8 +107,8 @@ async def create_campaign(
         **campaign.model_dump()
     )
     db.add(db_campaign)
-    db.commit()
-    db.refresh(db_campaign)
+    await db.commit()
+    await db.refresh(db_campaign)
     return db_campaign
 
 
@@ -100,10 +116,10 @@ async def create_campaign(
 async def update_campaign(
     campaign_id: int,
     campaign_update: CampaignUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить кампанию (только для владельца или админа)"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.scalar(select(Campaign).where(Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -114,61 +130,76 @@ async def update_campaign(
     for field, value in update_data.items():
         setattr(campaign, field, value)
     
-    db.commit()
-    db.refresh(campaign)
+    await db.commit()
+    await db.refresh(campaign)
     return campaign
 
 
+async def add_campaign_donation(db: AsyncSession, campaign_id: int, amount: Decimal):
+    """
+    Атомарно прибавляет пожертвование к счетчикам активной кампании
+
+    Один UPDATE ... RETURNING вместо чтения и записи в Python: параллельные
+    пожертвования не теряют обновления, а строка кампании блокируется только
+    до конца транзакции. Кампания завершается в том же UPDATE, поэтому цель
+    достигает ровно одно пожертвование, а следующие получают None.
+    """
+    collected = func.coalesce(Campaign.collected_amount, 0) + amount
+    result = await db.execute(
+        update(Campaign)
+        .where(Campaign.id == campaign_id, Campaign.status == "active")
+        .values(
+            collected_amount=collected,
+            participants_count=func.coalesce(Campaign.participants_count, 0) + 1,
+            status=case((collected >= Campaign.goal_amount, "completed"), else_=Campaign.status),
+        )
+        .returning(Campaign.collected_amount, Campaign.goal_amount, Campaign.status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.one_or_none()
+
+
 @router.post("/{campaign_id}/donate", response_model=dict)
 async def donate_to_campaign(
     campaign_id: int,
     donation_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Сделать пожертвование в кампанию"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-    if not campaign:
+    # Проверяем пользователя
+    user = await db.scalar(select(User).where(User.id == donation_data["user_id"]))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Campaign not found"
+            detail="User not found"
         )
     
-    if campaign.status != "active":
+    progress = await add_campaign_donation(db, campaign_id, Decimal(str(donation_data["amount"])))
+    if progress is None:
+        exists = await db.scalar(select(Campaign.id).where(Campaign.id == campaign_id))
+        if not exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Campaign not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Campaign is not active"
         )
     
-    # Проверяем пользователя
-    user = db.query(User).filter(User.id == donation_data["user_id"]).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     # Создаем пожертвование
     db_donation = CampaignDonation(
         campaign_id=campaign_id,
         **donation_data
     )
     db.add(db_donation)
-    
-    # Обновляем статистику кампании
-    campaign.collected_amount += Decimal(str(donation_data["amount"]))
-    campaign.participants_count += 1
-    
-    # Проверяем, достигнута ли цель
-    if campaign.collected_amount >= campaign.goal_amount:
-        campaign.status = "completed"
-    
-    db.commit()
+    await db.commit()
     
     return {
         "donation_id": db_donation.id,
         "amount": float(donation_data["amount"]),
         "currency": donation_data["currency"],
-        "campaign_progress": float(campaign.collected_amount / campaign.goal_amount * 100),
+        "campaign_progress": float(progress.collected_amount / progress.goal_amount * 100),
         "status": "pending"
     }
 
@@ -176,21 +207,43 @@ async def donate_to_campaign(
 @router.get("/{campaign_id}/donations", response_model=List[dict])
 async def get_campaign_donations(
     campaign_id: int,
+    response: Response,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (из заголовка X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить пожертвования кампании"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.scalar(select(Campaign).where(Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Campaign not found"
         )
     
-    donations = db.query(CampaignDonation).filter(
-        CampaignDonation.campaign_id == campaign_id
-    ).offset(offset).limit(limit).all()
+    # Один запрос с JOIN вместо подгрузки донора для каждого пожертвования,
+    # keyset-пагинация по (created_at, id) от новых к старым
+    columns = (CampaignDonation.created_at, CampaignDonation.id)
+    query = apply_keyset(
+        select(
+            CampaignDonation.id,
+            CampaignDonation.amount,
+            CampaignDonation.currency,
+            CampaignDonation.status,
+            CampaignDonation.created_at,
+            User.first_name,
+            User.last_name
+        )
+        .join(User, CampaignDonation.user_id == User.id)
+        .where(CampaignDonation.campaign_id == campaign_id),
+        columns, True, cursor, limit, "created_at:desc"
+    )
+    if not cursor:
+        query = query.offset(offset)
+    
+    donations = keyset_page(
+        (await db.execute(query)).all(), columns, limit, "created_at:desc", response
+    )
     
     return [
         {
@@ -199,7 +252,7 @@ async def get_campaign_donations(
             "currency": donation.currency,
             "status": donation.status,
             "created_at": donation.created_at,
-            "user_name": f"{donation.user.first_name} {donation.user.last_name}".strip()
+            "user_name": f"{donation.first_name} {donation.last_name}".strip()
         }
         for donation in donations
     ]
@@ -208,10 +261,10 @@ async def get_campaign_donations(
 @router.post("/{campaign_id}/complete", response_model=dict)
 async def complete_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Завершить кампанию (только для владельца или админа)"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.scalar(select(Campaign).where(Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -219,7 +272,7 @@ async def complete_campaign(
         )
     
     campaign.status = "completed"
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Campaign completed successfully",
@@ -230,22 +283,33 @@ async def complete_campaign(
 
 
 @router.get("/{campaign_id}/report", response_model=dict)
+@cache_response(ttl="cache_ttl_campaign_data", tags=["campaign:{campaign_id}"])
 async def get_campaign_report(
     campaign_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить отчет по кампании"""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.scalar(
+        select(Campaign)
+        .options(joinedload(Campaign.fund))
+        .where(Campaign.id == campaign_id)
+    )
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Campaign not found"
         )
+    # В отчете есть название фонда: запись сбрасывается и при изменении фонда
+    if campaign.fund_id is not None:
+        add_response_cache_tags(request, f"fund:{campaign.fund_id}")
     
-    total_donations = db.query(CampaignDonation).filter(
-        CampaignDonation.campaign_id == campaign_id,
-        CampaignDonation.status == "completed"
-    ).count()
+    total_donations = await db.scalar(
+        select(func.count()).select_from(CampaignDonation).where(
+            CampaignDonation.campaign_id == campaign_id,
+            CampaignDonation.status == "completed"
+        )
+    )
     
     return {
         "campaign_id": campaign_id,
@@ -260,3 +324,4 @@ async def get_campaign_report(
         "end_date": campaign.end_date,
         "fund_name": campaign.fund.name if campaign.fund else None
     }
+
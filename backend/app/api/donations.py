@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
 from ..core.database import get_db
+from ..core.pagination import apply_keyset, keyset_page
 from ..core.config import settings
 from ..models.models import Donation, User, Fund
 from ..schemas.schemas import (
@@ -26,7 +28,7 @@ cloudpayments_service = CloudPaymentsService(
 @router.post("/simple-request", response_model=dict)
 async def create_simple_donation_request(
     request: SimpleDonationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Создать простую заявку на пожертвование (без реальной оплаты)
@@ -47,7 +49,7 @@ async def create_simple_donation_request(
     
     # Валидация фонда если указан
     if request.fund_id is not None:
-        fund = db.query(Fund).filter(Fund.id == request.fund_id).first()
+        fund = await db.scalar(select(Fund).where(Fund.id == request.fund_id))
         if not fund:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -68,8 +70,8 @@ async def create_simple_donation_request(
     )
     
     db.add(donation_request)
-    db.commit()
-    db.refresh(donation_request)
+    await db.commit()
+    await db.refresh(donation_request)
     
     return {
         "success": True,
@@ -89,21 +91,21 @@ async def create_simple_donation_request(
 
 
 @router.post("/init", response_model=dict)
-async def init_donation(donation: DonationCreate, db: Session = Depends(get_db)):
+async def init_donation(donation: DonationCreate, db: AsyncSession = Depends(get_db)):
     """
     Инициализировать разовое пожертвование
     
     Поддерживает CloudPayments для обработки платежей
     """
     # Проверяем существование пользователя и фонда
-    user = db.query(User).filter(User.id == donation.user_id).first()
+    user = await db.scalar(select(User).where(User.id == donation.user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    fund = db.query(Fund).filter(Fund.id == donation.fund_id).first()
+    fund = await db.scalar(select(Fund).where(Fund.id == donation.fund_id))
     if not fund:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -113,8 +115,8 @@ async def init_donation(donation: DonationCreate, db: Session = Depends(get_db))
     # Создаем запись о пожертвовании
     db_donation = Donation(**donation.dict())
     db.add(db_donation)
-    db.commit()
-    db.refresh(db_donation)
+    await db.commit()
+    await db.refresh(db_donation)
     
     # Если выбран CloudPayments, формируем параметры для виджета
     if donation.payment_method == "cloudpayments":
@@ -154,10 +156,10 @@ async def init_donation(donation: DonationCreate, db: Session = Depends(get_db))
 async def confirm_donation(
     donation_id: int, 
     payment_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Подтвердить успешное пожертвование"""
-    donation = db.query(Donation).filter(Donation.id == donation_id).first()
+    donation = await db.scalar(select(Donation).where(Donation.id == donation_id))
     if not donation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -169,7 +171,7 @@ async def confirm_donation(
     donation.payment_id = payment_data.get("payment_id")
     donation.transaction_id = payment_data.get("transaction_id")
     
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Donation confirmed successfully",
@@ -179,9 +181,9 @@ async def confirm_donation(
 
 
 @router.get("/{donation_id}", response_model=DonationSchema)
-async def get_donation(donation_id: int, db: Session = Depends(get_db)):
+async def get_donation(donation_id: int, db: AsyncSession = Depends(get_db)):
     """Получить информацию о пожертвовании"""
-    donation = db.query(Donation).filter(Donation.id == donation_id).first()
+    donation = await db.scalar(select(Donation).where(Donation.id == donation_id))
     if not donation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,22 +195,30 @@ async def get_donation(donation_id: int, db: Session = Depends(get_db)):
 @router.get("/user/{user_id}", response_model=List[DonationSchema])
 async def get_user_donations(
     user_id: int,
+    response: Response,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (из заголовка X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить пожертвования пользователя"""
-    donations = db.query(Donation).filter(
-        Donation.user_id == user_id
-    ).offset(offset).limit(limit).all()
+    # Keyset-пагинация по (created_at, id) от новых к старым
+    columns = (Donation.created_at, Donation.id)
+    query = apply_keyset(
+        select(Donation).where(Donation.user_id == user_id),
+        columns, True, cursor, limit, "created_at:desc"
+    )
+    if not cursor:
+        query = query.offset(offset)
     
-    return donations
+    donations = (await db.scalars(query)).all()
+    return keyset_page(donations, columns, limit, "created_at:desc", response)
 
 
 @router.post("/{donation_id}/refund", response_model=dict)
-async def refund_donation(donation_id: int, db: Session = Depends(get_db)):
+async def refund_donation(donation_id: int, db: AsyncSession = Depends(get_db)):
     """Возврат пожертвования (только для админов)"""
-    donation = db.query(Donation).filter(Donation.id == donation_id).first()
+    donation = await db.scalar(select(Donation).where(Donation.id == donation_id))
     if not donation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -223,7 +233,7 @@ async def refund_donation(donation_id: int, db: Session = Depends(get_db)):
     
     # Здесь должна быть логика возврата в платежной системе
     donation.status = "refunded"
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Donation refunded successfully",
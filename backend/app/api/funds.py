@@ -1,46 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import Select, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from ..core.database import get_db
-from ..models.models import Fund
+from ..core.etag import row_version_etag
+from ..core.response_cache import cache_response
+from ..core.pagination import apply_keyset, keyset_page
+from ..models.models import Fund, FUND_SEARCH_CONFIG, fund_search_vector
 from ..schemas.schemas import FundCreate, FundUpdate, Fund as FundSchema
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[FundSchema])
+@cache_response(ttl="cache_ttl_fund_data", tags=["funds:list"])
 async def get_funds(
+    response: Response,
     country_code: Optional[str] = Query(None, description="Фильтр по стране"),
     purpose: Optional[str] = Query(None, description="Фильтр по цели"),
     verified_only: bool = Query(False, description="Только верифицированные фонды"),
     active_only: bool = Query(True, description="Только активные фонды"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (из заголовка X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить список фондов с фильтрацией"""
-    query = db.query(Fund)
+    query = select(Fund)
     
     if country_code:
-        query = query.filter(Fund.country_code == country_code)
+        query = query.where(Fund.country_code == country_code)
     
     if purpose:
-        query = query.filter(Fund.purposes.contains([purpose]))
+        query = query.where(Fund.purposes.contains([purpose]))
     
     if verified_only:
-        query = query.filter(Fund.verified == True)
+        query = query.where(Fund.verified == True)
     
     if active_only:
-        query = query.filter(Fund.active == True)
+        query = query.where(Fund.active == True)
     
-    funds = query.offset(offset).limit(limit).all()
-    return funds
+    # Keyset-пагинация по id: глубокие страницы не сканируют пропущенные строки
+    columns = (Fund.id,)
+    query = apply_keyset(query, columns, False, cursor, limit, "id:asc")
+    if not cursor:
+        query = query.offset(offset)
+    
+    funds = (await db.scalars(query)).all()
+    return keyset_page(funds, columns, limit, "id:asc", response)
 
 
-@router.get("/{fund_id}", response_model=FundSchema)
-async def get_fund(fund_id: int, db: Session = Depends(get_db)):
+@router.get(
+    "/{fund_id}",
+    response_model=FundSchema,
+    dependencies=[Depends(row_version_etag(Fund, "fund_id"))]
+)
+@cache_response(ttl="cache_ttl_fund_data", tags=["fund:{fund_id}", "funds"])
+async def get_fund(fund_id: int, db: AsyncSession = Depends(get_db)):
     """Получить фонд по ID"""
-    fund = db.query(Fund).filter(Fund.id == fund_id).first()
+    fund = await db.scalar(select(Fund).where(Fund.id == fund_id))
     if not fund:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -50,19 +68,19 @@ async def get_fund(fund_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=FundSchema)
-async def create_fund(fund: FundCreate, db: Session = Depends(get_db)):
+async def create_fund(fund: FundCreate, db: AsyncSession = Depends(get_db)):
     """Создать новый фонд (только для админов)"""
     db_fund = Fund(**fund.dict())
     db.add(db_fund)
-    db.commit()
-    db.refresh(db_fund)
+    await db.commit()
+    await db.refresh(db_fund)
     return db_fund
 
 
 @router.put("/{fund_id}", response_model=FundSchema)
-async def update_fund(fund_id: int, fund_update: FundUpdate, db: Session = Depends(get_db)):
+async def update_fund(fund_id: int, fund_update: FundUpdate, db: AsyncSession = Depends(get_db)):
     """Обновить данные фонда (только для админов)"""
-    fund = db.query(Fund).filter(Fund.id == fund_id).first()
+    fund = await db.scalar(select(Fund).where(Fund.id == fund_id))
     if not fund:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -73,26 +91,48 @@ async def update_fund(fund_id: int, fund_update: FundUpdate, db: Session = Depen
     for field, value in update_data.items():
         setattr(fund, field, value)
     
-    db.commit()
-    db.refresh(fund)
+    await db.commit()
+    await db.refresh(fund)
     return fund
 
 
+def build_search_query(q: str, dialect_name: str) -> Select:
+    """
+    Запрос поиска активных фондов
+
+    В PostgreSQL: полнотекстовый поиск (russian) по названию и описанию плюс
+    нечеткое совпадение по названию через pg_trgm, с ранжированием; оба условия
+    обслуживаются GIN-индексами. В остальных СУБД (SQLite в тестах) — ILIKE.
+    """
+    query = select(Fund).where(Fund.active == True)
+    
+    if dialect_name != "postgresql":
+        pattern = f"%{q}%"
+        return query.where(
+            or_(Fund.name.ilike(pattern), Fund.short_desc.ilike(pattern))
+        ).order_by(Fund.id)
+    
+    ts_query = func.websearch_to_tsquery(FUND_SEARCH_CONFIG, q)
+    # name %> q: слово из названия похоже на запрос (опечатки, ввод по буквам)
+    rank = func.ts_rank_cd(fund_search_vector, ts_query) + func.word_similarity(q, Fund.name)
+    return query.where(
+        or_(fund_search_vector.op("@@")(ts_query), Fund.name.op("%>")(q))
+    ).order_by(rank.desc(), Fund.id)
+
+
 @router.get("/search/", response_model=List[FundSchema])
+@cache_response(ttl="cache_ttl_fund_data", tags=["funds:list"])
 async def search_funds(
     q: str = Query(..., description="Поисковый запрос"),
     country_code: Optional[str] = Query(None),
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Поиск фондов по названию и описанию"""
-    query = db.query(Fund).filter(
-        Fund.active == True,
-        Fund.name.ilike(f"%{q}%")
-    )
+    """Поиск фондов по названию и описанию (без Elasticsearch)"""
+    query = build_search_query(q, db.bind.dialect.name)
     
     if country_code:
-        query = query.filter(Fund.country_code == country_code)
+        query = query.where(Fund.country_code == country_code)
     
-    funds = query.limit(limit).all()
+    funds = (await db.scalars(query.limit(limit))).all()
     return funds
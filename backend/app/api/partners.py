@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from ..core.database import get_db
+from ..core.pagination import apply_keyset, keyset_page
 from ..models.models import PartnerApplication
 from ..schemas.schemas import PartnerApplicationCreate, PartnerApplicationUpdate, PartnerApplication as PartnerSchema
 
@@ -11,42 +13,50 @@ router = APIRouter()
 @router.post("/applications", response_model=PartnerSchema)
 async def create_partner_application(
     application: PartnerApplicationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать заявку на партнерство"""
     db_application = PartnerApplication(**application.dict())
     db.add(db_application)
-    db.commit()
-    db.refresh(db_application)
+    await db.commit()
+    await db.refresh(db_application)
     return db_application
 
 
 @router.get("/applications", response_model=List[PartnerSchema])
 async def get_partner_applications(
+    response: Response,
     status_filter: str = None,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (из заголовка X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить список заявок на партнерство (только для админов)"""
-    query = db.query(PartnerApplication)
+    query = select(PartnerApplication)
     
     if status_filter:
-        query = query.filter(PartnerApplication.status == status_filter)
+        query = query.where(PartnerApplication.status == status_filter)
     
-    applications = query.offset(offset).limit(limit).all()
-    return applications
+    # Keyset-пагинация по (created_at, id) от новых к старым
+    columns = (PartnerApplication.created_at, PartnerApplication.id)
+    query = apply_keyset(query, columns, True, cursor, limit, "created_at:desc")
+    if not cursor:
+        query = query.offset(offset)
+    
+    applications = (await db.scalars(query)).all()
+    return keyset_page(applications, columns, limit, "created_at:desc", response)
 
 
 @router.get("/applications/{application_id}", response_model=PartnerSchema)
 async def get_partner_application(
     application_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить заявку на партнерство по ID"""
-    application = db.query(PartnerApplication).filter(
+    application = await db.scalar(select(PartnerApplication).where(
         PartnerApplication.id == application_id
-    ).first()
+    ))
     
     if not application:
         raise HTTPException(
@@ -62,12 +72,12 @@ async def update_partner_application(
     application_id: int,
     application_update: PartnerApplicationUpdate,
     reviewer_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить заявку на партнерство (только для админов)"""
-    application = db.query(PartnerApplication).filter(
+    application = await db.scalar(select(PartnerApplication).where(
         PartnerApplication.id == application_id
-    ).first()
+    ))
     
     if not application:
         raise HTTPException(
@@ -81,8 +91,8 @@ async def update_partner_application(
     
     application.reviewed_by = reviewer_id
     
-    db.commit()
-    db.refresh(application)
+    await db.commit()
+    await db.refresh(application)
     return application
 
 
@@ -90,12 +100,12 @@ async def update_partner_application(
 async def approve_partner_application(
     application_id: int,
     reviewer_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Одобрить заявку на партнерство"""
-    application = db.query(PartnerApplication).filter(
+    application = await db.scalar(select(PartnerApplication).where(
         PartnerApplication.id == application_id
-    ).first()
+    ))
     
     if not application:
         raise HTTPException(
@@ -106,7 +116,7 @@ async def approve_partner_application(
     application.status = "approved"
     application.reviewed_by = reviewer_id
     
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Partner application approved successfully",
@@ -120,12 +130,12 @@ async def reject_partner_application(
     application_id: int,
     reviewer_id: int,
     review_notes: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Отклонить заявку на партнерство"""
-    application = db.query(PartnerApplication).filter(
+    application = await db.scalar(select(PartnerApplication).where(
         PartnerApplication.id == application_id
-    ).first()
+    ))
     
     if not application:
         raise HTTPException(
@@ -137,7 +147,7 @@ async def reject_partner_application(
     application.reviewed_by = reviewer_id
     application.review_notes = review_notes
     
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Partner application rejected",
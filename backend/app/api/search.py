@@ -3,7 +3,8 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 import logging
 
-from ..core.database import get_db
+from ..core.database import get_sync_db
+from ..core.response_cache import cache_response
 from ..services.elasticsearch_service import ElasticsearchService
 from ..core.config import get_settings
 
@@ -15,6 +16,7 @@ settings = get_settings()
 es_service = ElasticsearchService(settings.elasticsearch_url)
 
 @router.get("/funds/search", response_model=Dict[str, Any])
+@cache_response(ttl="cache_ttl_fund_data", tags=["funds:list"])
 def search_funds(
     q: str = Query("", description="Поисковый запрос"),
     country_code: Optional[str] = Query(None, description="Код страны"),
@@ -22,7 +24,7 @@ def search_funds(
     verified_only: bool = Query(False, description="Только верифицированные фонды"),
     size: int = Query(20, ge=1, le=100, description="Количество результатов"),
     from_: int = Query(0, ge=0, description="Смещение"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """Поиск фондов через Elasticsearch"""
     try:
@@ -68,6 +70,7 @@ def search_funds(
         )
 
 @router.get("/campaigns/search", response_model=Dict[str, Any])
+@cache_response(ttl="cache_ttl_campaign_data", tags=["campaigns:list"])
 def search_campaigns(
     q: str = Query("", description="Поисковый запрос"),
     category: Optional[str] = Query(None, description="Категория кампании"),
@@ -75,7 +78,7 @@ def search_campaigns(
     status: str = Query("active", description="Статус кампании"),
     size: int = Query(20, ge=1, le=100, description="Количество результатов"),
     from_: int = Query(0, ge=0, description="Смещение"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """Поиск кампаний через Elasticsearch"""
     try:
@@ -122,7 +125,7 @@ def search_users(
     is_active: Optional[bool] = Query(None, description="Активность"),
     size: int = Query(20, ge=1, le=100, description="Количество результатов"),
     from_: int = Query(0, ge=0, description="Смещение"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """Поиск пользователей через Elasticsearch"""
     try:
@@ -161,7 +164,7 @@ def search_users(
         )
 
 @router.post("/index/fund/{fund_id}")
-def index_fund(fund_id: int, db: Session = Depends(get_db)):
+def index_fund(fund_id: int, db: Session = Depends(get_sync_db)):
     """Индексация фонда в Elasticsearch"""
     try:
         # Получаем данные фонда из БД
@@ -210,7 +213,7 @@ def index_fund(fund_id: int, db: Session = Depends(get_db)):
         )
 
 @router.post("/index/campaign/{campaign_id}")
-def index_campaign(campaign_id: int, db: Session = Depends(get_db)):
+def index_campaign(campaign_id: int, db: Session = Depends(get_sync_db)):
     """Индексация кампании в Elasticsearch"""
     try:
         # Получаем данные кампании из БД
@@ -274,7 +277,7 @@ def elasticsearch_health():
         )
 
 @router.post("/reindex/all")
-def reindex_all(db: Session = Depends(get_db)):
+def reindex_all(db: Session = Depends(get_sync_db)):
     """Полная переиндексация всех данных"""
     try:
         # Создаем индексы
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from decimal import Decimal
 from datetime import datetime, timedelta
@@ -11,17 +12,17 @@ router = APIRouter()
 
 
 @router.post("/init", response_model=dict)
-async def init_subscription(subscription: SubscriptionCreate, db: Session = Depends(get_db)):
+async def init_subscription(subscription: SubscriptionCreate, db: AsyncSession = Depends(get_db)):
     """Инициализировать подписку на регулярные пожертвования"""
     # Проверяем существование пользователя и фонда
-    user = db.query(User).filter(User.id == subscription.user_id).first()
+    user = await db.scalar(select(User).where(User.id == subscription.user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    fund = db.query(Fund).filter(Fund.id == subscription.fund_id).first()
+    fund = await db.scalar(select(Fund).where(Fund.id == subscription.fund_id))
     if not fund:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -37,8 +38,8 @@ async def init_subscription(subscription: SubscriptionCreate, db: Session = Depe
         next_payment_date=next_payment_date
     )
     db.add(db_subscription)
-    db.commit()
-    db.refresh(db_subscription)
+    await db.commit()
+    await db.refresh(db_subscription)
     
     return {
         "subscription_id": db_subscription.id,
@@ -51,9 +52,9 @@ async def init_subscription(subscription: SubscriptionCreate, db: Session = Depe
 
 
 @router.get("/{subscription_id}", response_model=SubscriptionSchema)
-async def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
+async def get_subscription(subscription_id: int, db: AsyncSession = Depends(get_db)):
     """Получить информацию о подписке"""
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.id == subscription_id))
     if not subscription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -66,10 +67,10 @@ async def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
 async def update_subscription(
     subscription_id: int,
     subscription_update: SubscriptionUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить подписку"""
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.id == subscription_id))
     if not subscription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -80,15 +81,15 @@ async def update_subscription(
     for field, value in update_data.items():
         setattr(subscription, field, value)
     
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    await db.refresh(subscription)
     return subscription
 
 
 @router.post("/{subscription_id}/pause", response_model=dict)
-async def pause_subscription(subscription_id: int, db: Session = Depends(get_db)):
+async def pause_subscription(subscription_id: int, db: AsyncSession = Depends(get_db)):
     """Приостановить подписку"""
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.id == subscription_id))
     if not subscription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,7 +97,7 @@ async def pause_subscription(subscription_id: int, db: Session = Depends(get_db)
         )
     
     subscription.status = "paused"
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Subscription paused successfully",
@@ -106,9 +107,9 @@ async def pause_subscription(subscription_id: int, db: Session = Depends(get_db)
 
 
 @router.post("/{subscription_id}/resume", response_model=dict)
-async def resume_subscription(subscription_id: int, db: Session = Depends(get_db)):
+async def resume_subscription(subscription_id: int, db: AsyncSession = Depends(get_db)):
     """Возобновить подписку"""
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.id == subscription_id))
     if not subscription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -117,7 +118,7 @@ async def resume_subscription(subscription_id: int, db: Session = Depends(get_db
     
     subscription.status = "active"
     subscription.next_payment_date = calculate_next_payment_date(subscription.frequency)
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Subscription resumed successfully",
@@ -128,9 +129,9 @@ async def resume_subscription(subscription_id: int, db: Session = Depends(get_db
 
 
 @router.post("/{subscription_id}/cancel", response_model=dict)
-async def cancel_subscription(subscription_id: int, db: Session = Depends(get_db)):
+async def cancel_subscription(subscription_id: int, db: AsyncSession = Depends(get_db)):
     """Отменить подписку"""
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.id == subscription_id))
     if not subscription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -138,7 +139,7 @@ async def cancel_subscription(subscription_id: int, db: Session = Depends(get_db
         )
     
     subscription.status = "cancelled"
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Subscription cancelled successfully",
@@ -151,15 +152,15 @@ async def cancel_subscription(subscription_id: int, db: Session = Depends(get_db
 async def get_user_subscriptions(
     user_id: int,
     status_filter: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить подписки пользователя"""
-    query = db.query(Subscription).filter(Subscription.user_id == user_id)
+    query = select(Subscription).where(Subscription.user_id == user_id)
     
     if status_filter:
-        query = query.filter(Subscription.status == status_filter)
+        query = query.where(Subscription.status == status_filter)
     
-    subscriptions = query.all()
+    subscriptions = (await db.scalars(query)).all()
     return subscriptions
 
 
@@ -1,18 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from ..core.database import get_db
-from ..models.models import User, Fund, Donation
+from ..models.models import User, Fund, Donation, Subscription
 from ..schemas.schemas import UserCreate, UserUpdate, User as UserSchema
 
 router = APIRouter()
 
 
 @router.post("/", response_model=UserSchema)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Создать нового пользователя"""
     # Проверяем, существует ли пользователь с таким telegram_id
-    existing_user = db.query(User).filter(User.telegram_id == user.telegram_id).first()
+    existing_user = await db.scalar(select(User).where(User.telegram_id == user.telegram_id))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -21,15 +22,15 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
     
     db_user = User(**user.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
 @router.get("/{user_id}", response_model=UserSchema)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """Получить пользователя по ID"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -39,9 +40,9 @@ async def get_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/telegram/{telegram_id}", response_model=UserSchema)
-async def get_user_by_telegram_id(telegram_id: int, db: Session = Depends(get_db)):
+async def get_user_by_telegram_id(telegram_id: int, db: AsyncSession = Depends(get_db)):
     """Получить пользователя по Telegram ID"""
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -51,9 +52,9 @@ async def get_user_by_telegram_id(telegram_id: int, db: Session = Depends(get_db
 
 
 @router.put("/{user_id}", response_model=UserSchema)
-async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db)):
+async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
     """Обновить данные пользователя"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -64,22 +65,35 @@ async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depen
     for field, value in update_data.items():
         setattr(user, field, value)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
 @router.get("/{user_id}/donations", response_model=List[dict])
-async def get_user_donations(user_id: int, db: Session = Depends(get_db)):
+async def get_user_donations(user_id: int, db: AsyncSession = Depends(get_db)):
     """Получить пожертвования пользователя"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    donations = db.query(Donation).filter(Donation.user_id == user_id).all()
+    # Один запрос с JOIN вместо подгрузки фонда для каждого пожертвования
+    donations = await db.execute(
+        select(
+            Donation.id,
+            Donation.amount,
+            Donation.currency,
+            Donation.purpose,
+            Donation.status,
+            Donation.created_at,
+            Fund.name.label("fund_name")
+        )
+        .join(Fund, Donation.fund_id == Fund.id)
+        .where(Donation.user_id == user_id)
+    )
     return [
         {
             "id": donation.id,
@@ -88,32 +102,45 @@ async def get_user_donations(user_id: int, db: Session = Depends(get_db)):
             "purpose": donation.purpose,
             "status": donation.status,
             "created_at": donation.created_at,
-            "fund_name": donation.fund.name
+            "fund_name": donation.fund_name
         }
         for donation in donations
     ]
 
 
 @router.get("/{user_id}/subscriptions", response_model=List[dict])
-async def get_user_subscriptions(user_id: int, db: Session = Depends(get_db)):
+async def get_user_subscriptions(user_id: int, db: AsyncSession = Depends(get_db)):
     """Получить подписки пользователя"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    subscriptions = db.query(User.subscriptions).filter(User.id == user_id).first()
+    # Фонд у подписки необязателен, поэтому LEFT JOIN
+    subscriptions = await db.execute(
+        select(
+            Subscription.id,
+            Subscription.amount,
+            Subscription.currency,
+            Subscription.period,
+            Subscription.status,
+            Subscription.next_payment_date,
+            Fund.name.label("fund_name")
+        )
+        .outerjoin(Fund, Subscription.fund_id == Fund.id)
+        .where(Subscription.user_id == user_id)
+    )
     return [
         {
             "id": sub.id,
             "amount": float(sub.amount),
             "currency": sub.currency,
-            "frequency": sub.frequency,
+            "frequency": sub.period,
             "status": sub.status,
             "next_payment_date": sub.next_payment_date,
-            "fund_name": sub.fund.name
+            "fund_name": sub.fund_name
         }
         for sub in subscriptions
     ]
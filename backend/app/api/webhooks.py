@@ -2,7 +2,8 @@
 Webhook endpoints для обработки уведомлений от платежных систем
 """
 from fastapi import APIRouter, Request, HTTPException, status, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 import logging
 
@@ -25,7 +26,7 @@ cloudpayments_service = CloudPaymentsService(
 @router.post("/cloudpayments")
 async def cloudpayments_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Webhook для обработки уведомлений от CloudPayments
@@ -62,15 +63,15 @@ async def cloudpayments_webhook(
         
         # Находим пожертвование
         if invoice_id:
-            donation = db.query(Donation).filter(Donation.id == int(invoice_id)).first()
+            donation = await db.scalar(select(Donation).where(Donation.id == int(invoice_id)))
             
             if donation:
                 # Обновляем статус пожертвования
                 donation.payment_id = str(transaction_id)
                 donation.status = cloudpayments_service.parse_payment_status(status_code)
                 
-                db.commit()
-                db.refresh(donation)
+                await db.commit()
+                await db.refresh(donation)
                 
                 logger.info(f"Updated donation {donation.id} with status {donation.status}")
             else:
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
 from ..core.database import get_db
+from ..core.response_cache import cache_response
 from ..models.models import ZakatCalculation, User
 from ..schemas.schemas import ZakatCalculationCreate, ZakatCalculationUpdate, ZakatCalculation as ZakatSchema
 
@@ -16,11 +18,11 @@ ZAKAT_RATE = Decimal("0.025")  # 2.5%
 async def calculate_zakat(
     zakat_data: ZakatCalculationCreate,
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Рассчитать закят"""
     # Проверяем существование пользователя
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -50,9 +52,9 @@ async def calculate_zakat(
         zakat_amount = zakatable_amount * ZAKAT_RATE
     
     # Создаем или обновляем расчет
-    existing_calc = db.query(ZakatCalculation).filter(
+    existing_calc = await db.scalar(select(ZakatCalculation).where(
         ZakatCalculation.user_id == user_id
-    ).first()
+    ))
     
     if existing_calc:
         # Обновляем существующий расчет
@@ -65,8 +67,8 @@ async def calculate_zakat(
         existing_calc.nisab_amount = CURRENT_NISAB
         existing_calc.zakat_amount = zakat_amount
         
-        db.commit()
-        db.refresh(existing_calc)
+        await db.commit()
+        await db.refresh(existing_calc)
         return existing_calc
     else:
         # Создаем новый расчет
@@ -81,8 +83,8 @@ async def calculate_zakat(
         )
         
         db.add(db_calc)
-        db.commit()
-        db.refresh(db_calc)
+        await db.commit()
+        await db.refresh(db_calc)
         return db_calc
 
 
@@ -90,10 +92,10 @@ async def calculate_zakat(
 async def pay_zakat(
     zakat_id: int,
     payment_method: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Оплатить закят"""
-    zakat_calc = db.query(ZakatCalculation).filter(ZakatCalculation.id == zakat_id).first()
+    zakat_calc = await db.scalar(select(ZakatCalculation).where(ZakatCalculation.id == zakat_id))
     if not zakat_calc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -129,10 +131,10 @@ async def pay_zakat(
 async def confirm_zakat_payment(
     zakat_id: int,
     payment_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Подтвердить успешную оплату закята"""
-    zakat_calc = db.query(ZakatCalculation).filter(ZakatCalculation.id == zakat_id).first()
+    zakat_calc = await db.scalar(select(ZakatCalculation).where(ZakatCalculation.id == zakat_id))
     if not zakat_calc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -142,7 +144,7 @@ async def confirm_zakat_payment(
     zakat_calc.is_paid = True
     zakat_calc.payment_id = payment_data.get("payment_id")
     
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Zakat payment confirmed successfully",
@@ -154,12 +156,14 @@ async def confirm_zakat_payment(
 @router.get("/user/{user_id}", response_model=list)
 async def get_user_zakat_history(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить историю расчетов закята пользователя"""
-    calculations = db.query(ZakatCalculation).filter(
-        ZakatCalculation.user_id == user_id
-    ).order_by(ZakatCalculation.created_at.desc()).all()
+    calculations = (await db.scalars(
+        select(ZakatCalculation).where(
+            ZakatCalculation.user_id == user_id
+        ).order_by(ZakatCalculation.created_at.desc())
+    )).all()
     
     return [
         {
@@ -178,6 +182,7 @@ async def get_user_zakat_history(
 
 
 @router.get("/nisab", response_model=dict)
+@cache_response()
 async def get_current_nisab():
     """Получить текущий нисаб"""
     return {
@@ -1,15 +1,39 @@
 import redis
+import redis.asyncio as aioredis
 import json
-import pickle
-import hashlib
-from typing import Any, Optional, Union, Dict, List
+import inspect
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import logging
-from functools import wraps
+from functools import partial, wraps
 import asyncio
 
+from .config import settings
+from .cache_codec import CacheCodec, decode_legacy, is_encoded
+from .cache_keys import CacheKeyBuilder
+from .cache_stampede import (
+    AsyncSingleFlight, FRESH, SingleFlight, entry_state, is_entry, wrap_entry
+)
+from .metrics import cache_metrics
+
 logger = logging.getLogger(__name__)
 
+# Снимает блокировку, только если она все еще принадлежит владельцу токена
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Операция кэша: генератор вызовов ввода-вывода (см. BaseRedisCache)
+Operation = Generator[Callable[[], Any], Any, Any]
+
 class CacheConfig:
     """Конфигурация кэша"""
     
@@ -19,7 +43,7 @@ class CacheConfig:
         port: int = 6379,
         db: int = 0,
         password: Optional[str] = None,
-        decode_responses: bool = True,
+        decode_responses: bool = False,
         max_connections: int = 20,
         socket_timeout: int = 5,
         socket_connect_timeout: int = 5,
@@ -35,376 +59,1375 @@ class CacheConfig:
         self.socket_connect_timeout = socket_connect_timeout
         self.retry_on_timeout = retry_on_timeout
 
-class RedisCache:
-    """Redis кэш с поддержкой различных типов данных"""
+class BaseRedisCache:
+    """Общая часть синхронного и асинхронного Redis кэша: ключи, кодек, пул"""
+    
+    # Подсказка COUNT для SCAN и размер пачки UNLINK
+    SCAN_COUNT = 500
     
-    def __init__(self, config: CacheConfig):
+    def __init__(self, config: CacheConfig, codec: Optional[CacheCodec] = None):
         self.config = config
-        self._client: Optional[redis.Redis] = None
-        self._connection_pool: Optional[redis.ConnectionPool] = None
+        self.codec = codec or CacheCodec(
+            settings.cache_serializer,
+            settings.cache_compression,
+            settings.cache_compression_threshold
+        )
     
-    def _get_client(self) -> redis.Redis:
-        """Получает клиент Redis"""
-        if self._client is None:
-            self._connection_pool = redis.ConnectionPool(
-                host=self.config.host,
-                port=self.config.port,
-                db=self.config.db,
-                password=self.config.password,
-                decode_responses=self.config.decode_responses,
-                max_connections=self.config.max_connections,
-                socket_timeout=self.config.socket_timeout,
-                socket_connect_timeout=self.config.socket_connect_timeout,
-                retry_on_timeout=self.config.retry_on_timeout
-            )
-            
-            self._client = redis.Redis(connection_pool=self._connection_pool)
-        
-        return self._client
+    def _pool_options(self) -> Dict[str, Any]:
+        """Параметры пула подключений из конфигурации"""
+        return {
+            "host": self.config.host,
+            "port": self.config.port,
+            "db": self.config.db,
+            "password": self.config.password,
+            "decode_responses": self.config.decode_responses,
+            "max_connections": self.config.max_connections,
+            "socket_timeout": self.config.socket_timeout,
+            "socket_connect_timeout": self.config.socket_connect_timeout,
+            "retry_on_timeout": self.config.retry_on_timeout,
+        }
     
     def _make_key(self, key: str, namespace: str = "default") -> str:
         """Создает ключ с namespace"""
         return f"{namespace}:{key}"
     
-    def _serialize(self, value: Any) -> str:
+    def _serialize(self, value: Any) -> bytes:
         """Сериализует значение"""
-        if isinstance(value, (str, int, float, bool)):
-            return json.dumps(value)
-        else:
-            return pickle.dumps(value).hex()
+        return self.codec.encode(value)
     
-    def _deserialize(self, value: str, original_type: type = None) -> Any:
-        """Десериализует значение"""
-        try:
-            return json.loads(value)
-        except (json.JSONDecodeError, TypeError):
-            try:
-                return pickle.loads(bytes.fromhex(value))
-            except (ValueError, pickle.PickleError):
-                return value
+    def _deserialize(self, value: Union[bytes, str]) -> Any:
+        """Десериализует значение (в т.ч. записанное в старом формате)"""
+        return self.codec.decode(value)
     
-    def set(
-        self,
-        key: str,
-        value: Any,
-        ttl: Optional[int] = None,
-        namespace: str = "default"
-    ) -> bool:
+    @staticmethod
+    def _decode_key(key: Union[bytes, str]) -> str:
+        """Ключ или поле hash из ответа Redis в виде строки"""
+        return key.decode() if isinstance(key, bytes) else key
+    
+    def _strip_namespace(self, keys: Iterable[Union[bytes, str]], namespace: str) -> List[str]:
+        """Ключи без префикса namespace; повторы из SCAN отбрасываются"""
+        prefix_length = len(namespace) + 1
+        return list(dict.fromkeys(self._decode_key(key)[prefix_length:] for key in keys))
+    
+    def _tag_key(self, tag: str) -> str:
+        """Ключ множества ключей кэша с тегом"""
+        return self._make_key(tag, "tags")
+    
+    def _lock_key(self, key: str, namespace: str) -> str:
+        """Ключ блокировки пересчета значения"""
+        return self._make_key(key, f"lock:{namespace}")
+    
+    def _decode_many(self, keys: List[str], values: List[Optional[bytes]], namespace: str) -> Dict[str, Any]:
+        """Результат MGET в виде словаря; отсутствующие ключи пропускаются"""
+        result = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                cache_metrics.record_lookup(namespace, "miss")
+                continue
+            cache_metrics.record_lookup(namespace, "l2")
+            result[key] = self._deserialize(value)
+        return result
+    
+    def _command(self, name: str, *args: Any, **kwargs: Any) -> Callable[[], Any]:
+        """Вызов команды клиента Redis для операции (выполняет _run подкласса)"""
+        return partial(getattr(self._get_client(), name), *args, **kwargs)
+    
+    def _new_pipeline(self, transaction: bool = False) -> "CachePipeline":
+        """Пустой пайплайн команд кэша"""
+        return CachePipeline(self, self._get_client().pipeline(transaction=transaction))
+    
+    # Операции кэша - генераторы, которые отдают вызовы ввода-вывода без
+    # аргументов и получают их результат (или исключение). Вся логика
+    # (ключи, кодек, теги, SCAN) здесь; RedisCache вызывает их синхронно,
+    # AsyncRedisCache - с await (см. redis_operation).
+    
+    def _set(self, key: str, value: Any, ttl: Optional[int] = None, namespace: str = "default") -> Operation:
         """Устанавливает значение в кэш"""
         try:
-            client = self._get_client()
             cache_key = self._make_key(key, namespace)
-            
             serialized_value = self._serialize(value)
             
             if ttl:
-                return client.setex(cache_key, ttl, serialized_value)
-            else:
-                return client.set(cache_key, serialized_value)
-                
+                return (yield self._command("setex", cache_key, ttl, serialized_value))
+            return (yield self._command("set", cache_key, serialized_value))
+        
         except Exception as e:
             logger.error(f"Error setting cache key {key}: {e}")
             return False
     
-    def get(
-        self,
-        key: str,
-        namespace: str = "default",
-        default: Any = None
-    ) -> Any:
+    def _get(self, key: str, namespace: str = "default", default: Any = None) -> Operation:
         """Получает значение из кэша"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            value = client.get(cache_key)
+            value = yield self._command("get", self._make_key(key, namespace))
             if value is None:
+                cache_metrics.record_lookup(namespace, "miss")
                 return default
             
+            cache_metrics.record_lookup(namespace, "l2")
             return self._deserialize(value)
-            
+        
         except Exception as e:
             logger.error(f"Error getting cache key {key}: {e}")
             return default
     
-    def delete(self, key: str, namespace: str = "default") -> bool:
+    def _delete(self, key: str, namespace: str = "default") -> Operation:
         """Удаляет значение из кэша"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return bool(client.delete(cache_key))
-            
+            return bool((yield self._command("delete", self._make_key(key, namespace))))
         except Exception as e:
             logger.error(f"Error deleting cache key {key}: {e}")
             return False
     
-    def exists(self, key: str, namespace: str = "default") -> bool:
+    def _get_many(self, keys: List[str], namespace: str = "default") -> Operation:
+        """Получает несколько значений одним MGET; отсутствующие ключи не попадают в результат"""
+        if not keys:
+            return {}
+        
+        try:
+            values = yield self._command("mget", [self._make_key(key, namespace) for key in keys])
+        except Exception as e:
+            logger.error(f"Error getting cache keys {keys}: {e}")
+            return {}
+        
+        return self._decode_many(keys, values, namespace)
+    
+    def _set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None, namespace: str = "default") -> Operation:
+        """Устанавливает несколько значений за один round trip"""
+        if not mapping:
+            return True
+        
+        pipe = self._new_pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, value, ttl, namespace)
+        yield partial(self._execute_pipeline, pipe)
+        return all(pipe.results)
+    
+    def _delete_many(self, keys: List[str], namespace: str = "default") -> Operation:
+        """Удаляет несколько значений одной командой; возвращает число удаленных"""
+        if not keys:
+            return 0
+        
+        pipe = self._new_pipeline().delete_many(keys, namespace)
+        yield partial(self._execute_pipeline, pipe)
+        return pipe.results[0] or 0
+    
+    def _invalidate_tags(self, tags: Iterable[str]) -> Operation:
+        """
+        Удаляет все значения с любым из тегов; возвращает число удаленных
+        
+        Из множеств тегов убираются только прочитанные ключи: значение,
+        записанное с тегом во время инвалидации, не потеряет тег.
+        """
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return 0
+        
+        pipe = self._new_pipeline().tag_members(tags)
+        yield partial(self._execute_pipeline, pipe)
+        members = dict(zip(tags, (keys or [] for keys in pipe.results)))
+        cache_keys = list(dict.fromkeys(key for keys in members.values() for key in keys))
+        if not cache_keys:
+            return 0
+        
+        pipe = self._new_pipeline().unlink_keys(cache_keys)
+        for tag, keys in members.items():
+            if keys:
+                pipe.forget_tag_members(tag, keys)
+        yield partial(self._execute_pipeline, pipe)
+        return pipe.results[0] or 0
+    
+    def _exists(self, key: str, namespace: str = "default") -> Operation:
         """Проверяет существование ключа"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return bool(client.exists(cache_key))
-            
+            return bool((yield self._command("exists", self._make_key(key, namespace))))
         except Exception as e:
             logger.error(f"Error checking cache key {key}: {e}")
             return False
     
-    def ttl(self, key: str, namespace: str = "default") -> int:
+    def _ttl(self, key: str, namespace: str = "default") -> Operation:
         """Получает TTL ключа"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return client.ttl(cache_key)
-            
+            return (yield self._command("ttl", self._make_key(key, namespace)))
         except Exception as e:
             logger.error(f"Error getting TTL for cache key {key}: {e}")
             return -1
     
-    def expire(self, key: str, ttl: int, namespace: str = "default") -> bool:
+    def _expire(self, key: str, ttl: int, namespace: str = "default") -> Operation:
         """Устанавливает TTL для ключа"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return bool(client.expire(cache_key, ttl))
-            
+            return bool((yield self._command("expire", self._make_key(key, namespace), ttl)))
         except Exception as e:
             logger.error(f"Error setting TTL for cache key {key}: {e}")
             return False
     
-    def clear_namespace(self, namespace: str = "default") -> bool:
-        """Очищает все ключи в namespace"""
+    def _clear_namespace(self, namespace: str = "default") -> Operation:
+        """Очищает все ключи в namespace: SCAN и UNLINK пачками, без блокировки Redis"""
         try:
-            client = self._get_client()
-            pattern = f"{namespace}:*"
-            
-            keys = client.keys(pattern)
-            if keys:
-                return bool(client.delete(*keys))
+            batch = []
+            cursor = None
+            while cursor != 0:
+                cursor, keys = yield self._command("scan", cursor or 0, match=f"{namespace}:*", count=self.SCAN_COUNT)
+                batch.extend(keys)
+                if len(batch) >= self.SCAN_COUNT:
+                    yield self._command("unlink", *batch)
+                    batch = []
+            if batch:
+                yield self._command("unlink", *batch)
             
             return True
-            
+        
         except Exception as e:
             logger.error(f"Error clearing namespace {namespace}: {e}")
             return False
     
-    def get_keys(self, pattern: str = "*", namespace: str = "default") -> List[str]:
-        """Получает список ключей"""
+    def _get_keys(self, pattern: str = "*", namespace: str = "default") -> Operation:
+        """Получает список ключей (через SCAN, без блокировки Redis)"""
         try:
-            client = self._get_client()
-            search_pattern = f"{namespace}:{pattern}"
-            
-            keys = client.keys(search_pattern)
-            return [key.replace(f"{namespace}:", "") for key in keys]
-            
+            keys = []
+            cursor = None
+            while cursor != 0:
+                cursor, page = yield self._command(
+                    "scan", cursor or 0, match=f"{namespace}:{pattern}", count=self.SCAN_COUNT
+                )
+                keys.extend(page)
+            return self._strip_namespace(keys, namespace)
+        
         except Exception as e:
             logger.error(f"Error getting keys with pattern {pattern}: {e}")
             return []
     
-    def increment(self, key: str, amount: int = 1, namespace: str = "default") -> int:
+    def _increment(self, key: str, amount: int = 1, namespace: str = "default") -> Operation:
         """Увеличивает числовое значение"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return client.incrby(cache_key, amount)
-            
+            return (yield self._command("incrby", self._make_key(key, namespace), amount))
         except Exception as e:
             logger.error(f"Error incrementing cache key {key}: {e}")
             return 0
     
-    def decrement(self, key: str, amount: int = 1, namespace: str = "default") -> int:
+    def _decrement(self, key: str, amount: int = 1, namespace: str = "default") -> Operation:
         """Уменьшает числовое значение"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            return client.decrby(cache_key, amount)
-            
+            return (yield self._command("decrby", self._make_key(key, namespace), amount))
         except Exception as e:
             logger.error(f"Error decrementing cache key {key}: {e}")
             return 0
     
-    def hash_set(self, key: str, field: str, value: Any, namespace: str = "default") -> bool:
+    def _hash_set(self, key: str, field: str, value: Any, namespace: str = "default") -> Operation:
         """Устанавливает поле в hash"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
             serialized_value = self._serialize(value)
-            return bool(client.hset(cache_key, field, serialized_value))
-            
+            return bool((yield self._command("hset", self._make_key(key, namespace), field, serialized_value)))
         except Exception as e:
             logger.error(f"Error setting hash field {field} for key {key}: {e}")
             return False
     
-    def hash_get(self, key: str, field: str, namespace: str = "default", default: Any = None) -> Any:
+    def _hash_get(self, key: str, field: str, namespace: str = "default", default: Any = None) -> Operation:
         """Получает поле из hash"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            value = client.hget(cache_key, field)
-            if value is None:
-                return default
-            
-            return self._deserialize(value)
-            
+            value = yield self._command("hget", self._make_key(key, namespace), field)
+            return default if value is None else self._deserialize(value)
         except Exception as e:
             logger.error(f"Error getting hash field {field} for key {key}: {e}")
             return default
     
-    def hash_get_all(self, key: str, namespace: str = "default") -> Dict[str, Any]:
+    def _hash_get_all(self, key: str, namespace: str = "default") -> Operation:
         """Получает все поля из hash"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            hash_data = client.hgetall(cache_key)
-            return {field: self._deserialize(value) for field, value in hash_data.items()}
-            
+            hash_data = yield self._command("hgetall", self._make_key(key, namespace))
+            return {self._decode_key(field): self._deserialize(value) for field, value in hash_data.items()}
         except Exception as e:
             logger.error(f"Error getting all hash fields for key {key}: {e}")
             return {}
     
-    def list_push(self, key: str, value: Any, namespace: str = "default") -> int:
+    def _list_push(self, key: str, value: Any, namespace: str = "default") -> Operation:
         """Добавляет значение в список"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
             serialized_value = self._serialize(value)
-            return client.lpush(cache_key, serialized_value)
-            
+            return (yield self._command("lpush", self._make_key(key, namespace), serialized_value))
         except Exception as e:
             logger.error(f"Error pushing to list {key}: {e}")
             return 0
     
-    def list_pop(self, key: str, namespace: str = "default", default: Any = None) -> Any:
+    def _list_pop(self, key: str, namespace: str = "default", default: Any = None) -> Operation:
         """Извлекает значение из списка"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            value = client.rpop(cache_key)
-            if value is None:
-                return default
-            
-            return self._deserialize(value)
-            
+            value = yield self._command("rpop", self._make_key(key, namespace))
+            return default if value is None else self._deserialize(value)
         except Exception as e:
             logger.error(f"Error popping from list {key}: {e}")
             return default
     
-    def list_get_all(self, key: str, namespace: str = "default") -> List[Any]:
+    def _list_get_all(self, key: str, namespace: str = "default") -> Operation:
         """Получает все значения из списка"""
         try:
-            client = self._get_client()
-            cache_key = self._make_key(key, namespace)
-            
-            values = client.lrange(cache_key, 0, -1)
+            values = yield self._command("lrange", self._make_key(key, namespace), 0, -1)
             return [self._deserialize(value) for value in values]
-            
         except Exception as e:
             logger.error(f"Error getting all list values for key {key}: {e}")
             return []
     
-    def health_check(self) -> bool:
+    def _acquire_lock(self, key: str, ttl: float, namespace: str = "default") -> Operation:
+        """
+        Берет блокировку (lease) на пересчет ключа на ttl секунд
+
+        Возвращает токен владельца или None, если блокировку держит другой
+        воркер. При недоступности Redis блокировка считается полученной.
+        """
+        token = uuid.uuid4().hex
+        try:
+            acquired = yield self._command("set", self._lock_key(key, namespace), token, nx=True, px=int(ttl * 1000))
+            return token if acquired else None
+        except Exception as e:
+            logger.error(f"Error acquiring cache lock {key}: {e}")
+            return token
+    
+    def _release_lock(self, key: str, token: str, namespace: str = "default") -> Operation:
+        """Снимает блокировку, если она не истекла и не перехвачена другим воркером"""
+        try:
+            return bool((yield self._command("eval", RELEASE_LOCK_SCRIPT, 1, self._lock_key(key, namespace), token)))
+        except Exception as e:
+            logger.error(f"Error releasing cache lock {key}: {e}")
+            return False
+    
+    def _health_check(self) -> Operation:
         """Проверяет здоровье кэша"""
         try:
-            client = self._get_client()
-            client.ping()
+            yield self._command("ping")
             return True
         except Exception as e:
             logger.error(f"Cache health check failed: {e}")
             return False
 
+
+class CachePipeline:
+    """
+    Команды кэша, накопленные для отправки в Redis одним запросом
+    
+    Ключи и значения обрабатываются так же, как в одиночных методах кэша.
+    После выполнения results содержит ответы в порядке команд (значения get
+    уже десериализованы); при ошибке Redis - None для каждой команды.
+    """
+    
+    def __init__(self, cache: BaseRedisCache, pipe: Any):
+        self.cache = cache
+        self.raw = pipe
+        self.results: List[Any] = []
+        # Ключи, измененные командами пайплайна (для инвалидации L1)
+        self.written: List[str] = []
+        self._decoders: List[Any] = []
+    
+    def __len__(self) -> int:
+        return len(self._decoders)
+    
+    def _queue(self, decoder: Any, written: Optional[List[str]] = None) -> "CachePipeline":
+        self._decoders.append(decoder)
+        if written:
+            self.written.extend(written)
+        return self
+    
+    def _decode_value(self, value: Optional[bytes]) -> Any:
+        return None if value is None else self.cache._deserialize(value)
+    
+    def get(self, key: str, namespace: str = "default") -> "CachePipeline":
+        """Получает значение (None, если ключа нет)"""
+        self.raw.get(self.cache._make_key(key, namespace))
+        return self._queue(self._decode_value)
+    
+    def get_many(self, keys: List[str], namespace: str = "default") -> "CachePipeline":
+        """Получает несколько значений одним MGET (результат - список)"""
+        self.raw.mget([self.cache._make_key(key, namespace) for key in keys])
+        return self._queue(lambda values: [self._decode_value(value) for value in values])
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, namespace: str = "default") -> "CachePipeline":
+        """Устанавливает значение"""
+        cache_key = self.cache._make_key(key, namespace)
+        self.raw.set(cache_key, self.cache._serialize(value), ex=ttl)
+        return self._queue(bool, [cache_key])
+    
+    def delete(self, key: str, namespace: str = "default") -> "CachePipeline":
+        """Удаляет значение"""
+        cache_key = self.cache._make_key(key, namespace)
+        self.raw.delete(cache_key)
+        return self._queue(bool, [cache_key])
+    
+    def delete_many(self, keys: List[str], namespace: str = "default") -> "CachePipeline":
+        """Удаляет несколько значений одной командой UNLINK (результат - число удаленных)"""
+        cache_keys = [self.cache._make_key(key, namespace) for key in keys]
+        self.raw.unlink(*cache_keys)
+        return self._queue(int, cache_keys)
+    
+    def expire(self, key: str, ttl: int, namespace: str = "default") -> "CachePipeline":
+        """Устанавливает TTL для ключа"""
+        cache_key = self.cache._make_key(key, namespace)
+        self.raw.expire(cache_key, ttl)
+        return self._queue(bool, [cache_key])
+    
+    def increment(self, key: str, amount: int = 1, namespace: str = "default") -> "CachePipeline":
+        """Увеличивает числовое значение"""
+        cache_key = self.cache._make_key(key, namespace)
+        self.raw.incrby(cache_key, amount)
+        return self._queue(int, [cache_key])
+    
+    def hash_set(self, key: str, field: str, value: Any, namespace: str = "default") -> "CachePipeline":
+        """Устанавливает поле в hash"""
+        self.raw.hset(self.cache._make_key(key, namespace), field, self.cache._serialize(value))
+        return self._queue(bool)
+    
+    def add_tags(self, key: str, tags: Iterable[str], ttl: Optional[int] = None, namespace: str = "default") -> "CachePipeline":
+        """Добавляет ключ в множества тегов; множество живет не меньше записи"""
+        cache_key = self.cache._make_key(key, namespace)
+        for tag in tags:
+            tag_key = self.cache._tag_key(tag)
+            self.raw.sadd(tag_key, cache_key)
+            self._queue(int)
+            if ttl:
+                # NX - для нового множества, GT - только продление (Redis 7+)
+                self.raw.expire(tag_key, ttl, nx=True)
+                self.raw.expire(tag_key, ttl, gt=True)
+                self._queue(bool)._queue(bool)
+        return self
+    
+    def tag_members(self, tags: Iterable[str]) -> "CachePipeline":
+        """Получает ключи кэша с каждым из тегов (результат на тег - список ключей)"""
+        for tag in tags:
+            self.raw.smembers(self.cache._tag_key(tag))
+            self._queue(lambda members: [self.cache._decode_key(member) for member in members or ()])
+        return self
+    
+    def forget_tag_members(self, tag: str, cache_keys: List[str]) -> "CachePipeline":
+        """Удаляет ключи из множества тега"""
+        self.raw.srem(self.cache._tag_key(tag), *cache_keys)
+        return self._queue(int)
+    
+    def unlink_keys(self, cache_keys: List[str]) -> "CachePipeline":
+        """Удаляет ключи с уже добавленным namespace (результат - число удаленных)"""
+        self.raw.unlink(*cache_keys)
+        return self._queue(int, cache_keys)
+    
+    def _finish(self, raw: Optional[List[Any]]):
+        """Разбирает ответы Redis; лишние ответы (например, publish) отбрасываются"""
+        if raw is None:
+            self.results = [None] * len(self._decoders)
+            return
+        self.results = [decode(value) for decode, value in zip(self._decoders, raw)]
+
+
+# Публичные методы кэша - операции BaseRedisCache с тем же именем без "_"
+OPERATIONS = (
+    "set", "get", "delete", "get_many", "set_many", "delete_many", "invalidate_tags",
+    "exists", "ttl", "expire", "clear_namespace", "get_keys", "increment", "decrement",
+    "hash_set", "hash_get", "hash_get_all", "list_push", "list_pop", "list_get_all",
+    "acquire_lock", "release_lock", "health_check",
+)
+
+
+def redis_operation(name: str, is_async: bool = False) -> Callable:
+    """
+    Публичный метод кэша, выполняющий операцию _<name>
+
+    Операция ищется у экземпляра, поэтому переопределения в подклассах
+    (например, L1 в LocalTierMixin) работают для обоих вариантов кэша.
+    """
+    operation = getattr(BaseRedisCache, f"_{name}")
+    
+    if is_async:
+        async def method(self, *args, **kwargs):
+            return await self._run(getattr(self, operation.__name__)(*args, **kwargs))
+    else:
+        def method(self, *args, **kwargs):
+            return self._run(getattr(self, operation.__name__)(*args, **kwargs))
+    
+    method.__name__ = name
+    method.__doc__ = operation.__doc__
+    method.__signature__ = inspect.signature(operation).replace(return_annotation=inspect.Signature.empty)
+    return method
+
+
+def redis_operations(cls: type) -> type:
+    """Декоратор класса кэша: добавляет публичные методы всех операций"""
+    is_async = asyncio.iscoroutinefunction(cls._run)
+    for name in OPERATIONS:
+        method = redis_operation(name, is_async)
+        method.__qualname__ = f"{cls.__qualname__}.{name}"
+        setattr(cls, name, method)
+    return cls
+
+
+@redis_operations
+class RedisCache(BaseRedisCache):
+    """Redis кэш с поддержкой различных типов данных"""
+    
+    def __init__(self, config: CacheConfig, codec: Optional[CacheCodec] = None):
+        super().__init__(config, codec)
+        self._client: Optional[redis.Redis] = None
+        self._connection_pool: Optional[redis.ConnectionPool] = None
+    
+    def _get_client(self) -> redis.Redis:
+        """Получает клиент Redis"""
+        if self._client is None:
+            self._connection_pool = redis.ConnectionPool(**self._pool_options())
+            self._client = redis.Redis(connection_pool=self._connection_pool)
+        
+        return self._client
+    
+    def _run(self, operation: Operation) -> Any:
+        """Выполняет операцию, вызывая ее команды Redis по очереди"""
+        try:
+            call = next(operation)
+            while True:
+                try:
+                    result = call()
+                except Exception as e:
+                    call = operation.throw(e)
+                else:
+                    call = operation.send(result)
+        except StopIteration as stop:
+            return stop.value
+    
+    @contextmanager
+    def pipeline(self, transaction: bool = False):
+        """
+        Пайплайн команд кэша: все команды блока уходят в Redis при выходе
+        
+            with cache.pipeline() as pipe:
+                pipe.set("fund:1", fund, ttl=300)
+                pipe.get("fund:2")
+            fund_2 = pipe.results[1]
+        """
+        pipe = self._new_pipeline(transaction)
+        yield pipe
+        self._execute_pipeline(pipe)
+    
+    def _execute_pipeline(self, pipe: CachePipeline):
+        """Выполняет накопленные команды"""
+        if not len(pipe):
+            pipe._finish([])
+            return
+        
+        try:
+            raw = pipe.raw.execute()
+        except Exception as e:
+            logger.error(f"Error executing cache pipeline: {e}")
+            raw = None
+        pipe._finish(raw)
+    
+    def migrate_legacy_values(self, namespace: Optional[str] = None, batch_size: int = 500) -> int:
+        """
+        Перекодирует строковые значения старого формата (JSON, pickle-hex)
+        
+        Ключи обходятся через SCAN, TTL сохраняется (SET KEEPTTL, Redis >= 6).
+        Старые значения читаются и без миграции; hash и списки не трогаются.
+        Возвращает число перекодированных ключей.
+        """
+        client = self._get_client()
+        pattern = f"{namespace}:*" if namespace else "*"
+        migrated = 0
+        
+        batch = []
+        for key in client.scan_iter(match=pattern, count=batch_size, _type="string"):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                migrated += self._migrate_batch(client, batch)
+                batch = []
+        if batch:
+            migrated += self._migrate_batch(client, batch)
+        
+        logger.info(f"Migrated {migrated} legacy cache values")
+        return migrated
+    
+    def _migrate_batch(self, client: redis.Redis, keys: List[bytes]) -> int:
+        """Перекодирует пачку ключей за два round trip"""
+        values = client.mget(keys)
+        
+        pipe = client.pipeline(transaction=False)
+        migrated = 0
+        for key, value in zip(keys, values):
+            if value is None or is_encoded(value):
+                continue
+            
+            decoded = decode_legacy(value)
+            encoded = self.codec.encode(decoded)
+            if encoded == value:
+                continue
+            
+            # Значение могло измениться между MGET и SET: пропускаем такие ключи
+            pipe.set(key, encoded, keepttl=True, xx=True)
+            migrated += 1
+        
+        if migrated:
+            pipe.execute()
+        return migrated
+
+# Признак отсутствия записи в локальном кэше (None - допустимое значение)
+MISSING = object()
+
+
+class LocalCache:
+    """In-process LRU кэш с TTL записей (L1 перед Redis)"""
+    
+    def __init__(self, max_entries: int = 1024, ttl: int = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Any:
+        """Получает значение или MISSING, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Сохраняет значение; TTL не больше собственного TTL кэша"""
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        if ttl <= 0:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str):
+        """Удаляет запись"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def delete_prefix(self, prefix: str):
+        """Удаляет записи с ключами, начинающимися с prefix"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+    
+    def clear(self):
+        """Очищает кэш"""
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalTierMixin:
+    """
+    Локальный уровень (L1) двухуровневого кэша
+    
+    L1 хранит сериализованное значение, поэтому каждый get возвращает новый
+    объект, как и при чтении из Redis. Запись живет в L1 не дольше остатка
+    TTL в Redis и cache_local_ttl. Изменения ключей публикуются в канал
+    Redis pub/sub, и другие воркеры удаляют их из своего L1; если подписка
+    недоступна, устаревание ограничено cache_local_ttl.
+    """
+    
+    local: LocalCache
+    channel: str
+    instance_id: str
+    
+    def _get_local(self, cache_key: str, namespace: str) -> Any:
+        """Значение из L1 или MISSING"""
+        value = self.local.get(cache_key)
+        if value is not MISSING:
+            cache_metrics.record_lookup(namespace, "l1")
+            return self._deserialize(value)
+        return MISSING
+    
+    def _fill_local(self, cache_key: str, namespace: str, value: Optional[bytes], pttl: int) -> Any:
+        """Записывает в L1 значение, прочитанное из Redis вместе с остатком TTL"""
+        if value is None:
+            cache_metrics.record_lookup(namespace, "miss")
+            return MISSING
+        
+        cache_metrics.record_lookup(namespace, "l2")
+        self.local.set(cache_key, value, pttl / 1000 if pttl > 0 else None)
+        return self._deserialize(value)
+    
+    def _invalidation_message(self, key: Optional[str] = None, prefix: Optional[str] = None) -> str:
+        """Удаляет ключ (или ключи с префиксом) из L1; сообщение для других воркеров"""
+        self._evict_local(key, prefix)
+        cache_metrics.record_invalidation("local")
+        return json.dumps({"origin": self.instance_id, "key": key, "prefix": prefix})
+    
+    def _evict_local(self, key: Optional[str], prefix: Optional[str], keys: Optional[List[str]] = None):
+        if key is not None:
+            self.local.delete(key)
+        if prefix is not None:
+            self.local.delete_prefix(prefix)
+        for cache_key in keys or ():
+            self.local.delete(cache_key)
+    
+    def _queue_pipeline_invalidation(self, pipe: CachePipeline) -> List[str]:
+        """Добавляет в пайплайн публикацию измененных ключей; возвращает эти ключи"""
+        written = list(dict.fromkeys(pipe.written))
+        if written:
+            message = json.dumps({"origin": self.instance_id, "keys": written})
+            pipe.raw.publish(self.channel, message)
+        return written
+    
+    def _evict_pipeline_keys(self, written: List[str]):
+        """Удаляет из L1 ключи, измененные пайплайном (после записи в Redis)"""
+        if written:
+            self._evict_local(None, None, written)
+            cache_metrics.record_invalidation("local")
+    
+    def _fill_local_many(
+        self, cache_keys: List[str], keys: List[str], namespace: str, values: List[Optional[bytes]], pttls: List[int]
+    ) -> Dict[str, Any]:
+        """Записывает в L1 значения, прочитанные одним MGET"""
+        result = {}
+        for cache_key, key, value, pttl in zip(cache_keys, keys, values, pttls):
+            value = self._fill_local(cache_key, namespace, value, pttl)
+            if value is not MISSING:
+                result[key] = value
+        return result
+    
+    def _handle_invalidation(self, message: Dict[str, Any]):
+        """Обрабатывает сообщение об инвалидации от другого воркера"""
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError, KeyError):
+            logger.warning(f"Invalid cache invalidation message: {message}")
+            return
+        
+        if payload.get("origin") == self.instance_id:
+            return
+        
+        self._evict_local(payload.get("key"), payload.get("prefix"), payload.get("keys"))
+        cache_metrics.record_invalidation("pubsub")
+    
+    def _get(self, key: str, namespace: str = "default", default: Any = None) -> Operation:
+        """Получает значение из L1, при промахе - из Redis"""
+        cache_key = self._make_key(key, namespace)
+        
+        value = self._get_local(cache_key, namespace)
+        if value is not MISSING:
+            return value
+        
+        try:
+            # Значение и остаток TTL за один round trip
+            pipe = self._get_client().pipeline(transaction=False)
+            pipe.get(cache_key)
+            pipe.pttl(cache_key)
+            raw, pttl = yield pipe.execute
+        except Exception as e:
+            logger.error(f"Error getting cache key {key}: {e}")
+            return default
+        
+        value = self._fill_local(cache_key, namespace, raw, pttl)
+        return default if value is MISSING else value
+    
+    def _get_many(self, keys: List[str], namespace: str = "default") -> Operation:
+        """Получает значения из L1, промахи - из Redis одним пайплайном MGET + PTTL"""
+        result = {}
+        missing = []
+        for key in keys:
+            value = self._get_local(self._make_key(key, namespace), namespace)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                result[key] = value
+        
+        if not missing:
+            return result
+        
+        cache_keys = [self._make_key(key, namespace) for key in missing]
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            pipe.mget(cache_keys)
+            for cache_key in cache_keys:
+                pipe.pttl(cache_key)
+            values, *pttls = yield pipe.execute
+        except Exception as e:
+            logger.error(f"Error getting cache keys {missing}: {e}")
+            return result
+        
+        result.update(self._fill_local_many(cache_keys, missing, namespace, values, pttls))
+        return result
+    
+    def _set(self, key: str, value: Any, ttl: Optional[int] = None, namespace: str = "default") -> Operation:
+        """Устанавливает значение в Redis и сбрасывает его в L1 всех воркеров"""
+        result = yield from super()._set(key, value, ttl, namespace)
+        yield from self._invalidate(key=self._make_key(key, namespace))
+        return result
+    
+    def _delete(self, key: str, namespace: str = "default") -> Operation:
+        """Удаляет значение из Redis и из L1 всех воркеров"""
+        result = yield from super()._delete(key, namespace)
+        yield from self._invalidate(key=self._make_key(key, namespace))
+        return result
+    
+    def _expire(self, key: str, ttl: int, namespace: str = "default") -> Operation:
+        """Устанавливает TTL ключа; L1 перечитает ключ с новым TTL"""
+        result = yield from super()._expire(key, ttl, namespace)
+        yield from self._invalidate(key=self._make_key(key, namespace))
+        return result
+    
+    def _clear_namespace(self, namespace: str = "default") -> Operation:
+        """Очищает namespace в Redis и в L1 всех воркеров"""
+        result = yield from super()._clear_namespace(namespace)
+        yield from self._invalidate(prefix=self._make_key("", namespace))
+        return result
+    
+    def _invalidate(self, key: Optional[str] = None, prefix: Optional[str] = None) -> Operation:
+        """Удаляет ключ из L1 и оповещает другие воркеры"""
+        message = self._invalidation_message(key, prefix)
+        try:
+            yield self._command("publish", self.channel, message)
+        except Exception as e:
+            logger.error(f"Error publishing cache invalidation: {e}")
+
+
+class TieredCache(LocalTierMixin, RedisCache):
+    """Двухуровневый кэш: локальный LRU (L1) перед Redis (L2)"""
+    
+    # Ожидание сообщения и задержки переподписки после сбоя Redis, в секундах
+    LISTENER_POLL_INTERVAL = 1.0
+    LISTENER_MIN_BACKOFF = 0.5
+    LISTENER_MAX_BACKOFF = 30.0
+    
+    def __init__(self, config: CacheConfig, local: LocalCache, channel: str, codec: Optional[CacheCodec] = None):
+        super().__init__(config, codec)
+        self.local = local
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self._listener: Optional[threading.Thread] = None
+        self._listener_stop = threading.Event()
+    
+    def _execute_pipeline(self, pipe: CachePipeline):
+        """Выполняет пайплайн; инвалидация L1 других воркеров уходит тем же запросом"""
+        written = self._queue_pipeline_invalidation(pipe)
+        super()._execute_pipeline(pipe)
+        self._evict_pipeline_keys(written)
+    
+    def start_invalidation_listener(self) -> bool:
+        """Подписывается на канал инвалидации в фоновом потоке"""
+        if self._listener is not None:
+            return True
+        
+        self._listener_stop.clear()
+        self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+        self._listener.start()
+        return True
+    
+    def stop_invalidation_listener(self):
+        """Останавливает подписку на канал инвалидации"""
+        if self._listener is not None:
+            self._listener_stop.set()
+            self._listener.join(timeout=self.LISTENER_POLL_INTERVAL + 1)
+            self._listener = None
+    
+    def _listen(self):
+        """
+        Слушает канал инвалидации, переподключаясь после ошибок Redis
+        
+        Поток не завершается при сбое: подписка восстанавливается с
+        экспоненциальной задержкой. Сообщения, отправленные, пока подписки
+        не было, потеряны, поэтому после каждой подписки L1 очищается.
+        """
+        backoff = self.LISTENER_MIN_BACKOFF
+        while not self._listener_stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self._get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._handle_invalidation})
+                self.local.clear()
+                cache_metrics.record_invalidation("resubscribe")
+                backoff = self.LISTENER_MIN_BACKOFF
+                while not self._listener_stop.is_set():
+                    pubsub.get_message(timeout=self.LISTENER_POLL_INTERVAL)
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed, resubscribing in {backoff:.1f}s: {e}")
+                self._listener_stop.wait(backoff)
+                backoff = min(backoff * 2, self.LISTENER_MAX_BACKOFF)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+@redis_operations
+class AsyncRedisCache(BaseRedisCache):
+    """Redis кэш на redis.asyncio: тот же API, что у RedisCache, но без блокировки event loop"""
+    
+    def __init__(self, config: CacheConfig, codec: Optional[CacheCodec] = None):
+        super().__init__(config, codec)
+        self._client: Optional[aioredis.Redis] = None
+        self._connection_pool: Optional[aioredis.ConnectionPool] = None
+    
+    def _get_client(self) -> aioredis.Redis:
+        """Получает асинхронный клиент Redis"""
+        if self._client is None:
+            self._connection_pool = aioredis.ConnectionPool(**self._pool_options())
+            self._client = aioredis.Redis(connection_pool=self._connection_pool)
+        
+        return self._client
+    
+    async def _run(self, operation: Operation) -> Any:
+        """Выполняет операцию, дожидаясь каждой ее команды Redis"""
+        try:
+            call = next(operation)
+            while True:
+                try:
+                    result = await call()
+                except Exception as e:
+                    call = operation.throw(e)
+                else:
+                    call = operation.send(result)
+        except StopIteration as stop:
+            return stop.value
+    
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False):
+        """
+        Пайплайн команд кэша: все команды блока уходят в Redis при выходе
+        
+            async with async_cache.pipeline() as pipe:
+                pipe.set("fund:1", fund, ttl=300)
+                pipe.get("fund:2")
+            fund_2 = pipe.results[1]
+        """
+        pipe = self._new_pipeline(transaction)
+        yield pipe
+        await self._execute_pipeline(pipe)
+    
+    async def _execute_pipeline(self, pipe: CachePipeline):
+        """Выполняет накопленные команды"""
+        if not len(pipe):
+            pipe._finish([])
+            return
+        
+        try:
+            raw = await pipe.raw.execute()
+        except Exception as e:
+            logger.error(f"Error executing cache pipeline: {e}")
+            raw = None
+        pipe._finish(raw)
+    
+    async def close(self):
+        """Закрывает пул подключений"""
+        if self._connection_pool is not None:
+            await self._connection_pool.disconnect()
+        self._client = None
+        self._connection_pool = None
+
+
+class AsyncTieredCache(LocalTierMixin, AsyncRedisCache):
+    """
+    Асинхронный двухуровневый кэш
+    
+    Использует тот же LocalCache и instance_id, что и синхронный TieredCache
+    воркера: L1 общий, а подписку на инвалидацию держит синхронный кэш.
+    """
+    
+    def __init__(
+        self,
+        config: CacheConfig,
+        local: LocalCache,
+        channel: str,
+        instance_id: str,
+        codec: Optional[CacheCodec] = None
+    ):
+        super().__init__(config, codec)
+        self.local = local
+        self.channel = channel
+        self.instance_id = instance_id
+    
+    async def _execute_pipeline(self, pipe: CachePipeline):
+        """Выполняет пайплайн; инвалидация L1 других воркеров уходит тем же запросом"""
+        written = self._queue_pipeline_invalidation(pipe)
+        await super()._execute_pipeline(pipe)
+        self._evict_pipeline_keys(written)
+
+
 class CacheManager:
     """Менеджер кэша с различными стратегиями"""
     
-    def __init__(self, cache: RedisCache):
+    # Интервал опроса кэша, пока значение пересчитывает другой воркер
+    LOCK_POLL_INTERVAL = 0.05
+    
+    def __init__(self, cache: RedisCache, async_cache: Optional[AsyncRedisCache] = None):
         self.cache = cache
+        self.async_cache = async_cache
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        # Ключи, для которых уже запущено фоновое обновление
+        self._refreshing: set = set()
+        self._refreshing_lock = threading.Lock()
+        # Сильные ссылки на фоновые задачи, чтобы их не собрал GC
+        self._background_tasks: set = set()
     
     def cache_result(
         self,
         ttl: int = 300,
         namespace: str = "default",
-        key_func: callable = None
+        key_func: callable = None,
+        single_flight: bool = False,
+        lock_ttl: Optional[float] = None,
+        xfetch_beta: Optional[float] = None,
+        stale_ttl: int = 0,
+        tags: Union[List[str], callable, None] = None,
+        version: int = 0,
+        exclude: Iterable[str] = (),
+        refresh: Optional[callable] = None
     ):
-        """Декоратор для кэширования результатов функций"""
+        """
+        Декоратор для кэширования результатов функций
+        
+        Ключ строится по сигнатуре функции (см. CacheKeyBuilder): параметры,
+        которые подставляет FastAPI (db, request, response), и exclude в ключ
+        не входят; version нужно увеличить при изменении формата результата.
+        Ключ вызова доступен как func.cache_key(*args, **kwargs).
+        
+        tags - теги записи для инвалидации (см. invalidate_tags): список
+        шаблонов, которые форматируются аргументами функции (например,
+        "fund:{fund_id}"), или функция с теми же аргументами, возвращающая теги.
+        
+        Защита от одновременного пересчета (все выключено по умолчанию):
+        single_flight - одновременные промахи в процессе ждут одного вызова;
+        lock_ttl - блокировка в Redis на время пересчета, остальные воркеры
+        ждут значение до lock_ttl секунд; xfetch_beta - вероятностное
+        обновление до истечения ttl (обычно 1.0); stale_ttl - сколько секунд
+        после ttl отдавать старое значение, обновляя его в фоне.
+        
+        xfetch_beta и stale_ttl обновляют значение уже после ответа. Сессия
+        БД, запрос и ответ обработчика к этому времени закрыты (или еще
+        используются запросом), поэтому для функций с такими параметрами
+        нужен refresh - функция с остальными аргументами, которая сама
+        открывает сессию; иначе декоратор выбрасывает ValueError.
+        """
+        use_entry = bool(xfetch_beta) or stale_ttl > 0
+        
         def decorator(func):
+            key_builder = CacheKeyBuilder(func, version, exclude)
+            signature = key_builder.signature
+            if use_entry and key_builder.injected and refresh is None:
+                raise ValueError(
+                    f"{func.__qualname__}: background refresh (xfetch_beta/stale_ttl) cannot reuse "
+                    f"request-bound parameters {sorted(key_builder.injected)}; pass refresh="
+                )
+            
+            def background_call(args: tuple, kwargs: dict) -> callable:
+                """Вызов для фонового обновления: refresh без параметров запроса или сама функция"""
+                if refresh is None:
+                    return lambda: func(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = {
+                    name: value for name, value in bound.arguments.items() if name not in key_builder.injected
+                }
+                return lambda: refresh(**arguments)
+            
+            def make_key(args: tuple, kwargs: dict) -> Optional[str]:
+                if key_func:
+                    return key_func(*args, **kwargs)
+                try:
+                    return key_builder(args, kwargs)
+                except TypeError as e:
+                    logger.warning(f"Cache bypassed for {func.__qualname__}: {e}")
+                    return None
+            
             @wraps(func)
             async def async_wrapper(*args, **kwargs):
                 # Создаем ключ кэша
-                if key_func:
-                    cache_key = key_func(*args, **kwargs)
-                else:
-                    cache_key = self._generate_key(func.__name__, args, kwargs)
+                cache_key = make_key(args, kwargs)
+                if cache_key is None:
+                    return await func(*args, **kwargs)
+                
+                async def compute(call: callable = lambda: func(*args, **kwargs)):
+                    started = time.perf_counter()
+                    result = await call()
+                    value = self._cache_value(result, ttl, time.perf_counter() - started, use_entry)
+                    entry_tags = self._resolve_tags(tags, signature, args, kwargs)
+                    await self.async_set_with_tags(cache_key, value, ttl + stale_ttl, namespace, entry_tags)
+                    return result
                 
                 # Пытаемся получить из кэша
-                cached_result = self.cache.get(cache_key, namespace)
+                cached_result = await self.async_get(cache_key, namespace)
                 if cached_result is not None:
                     logger.debug(f"Cache hit for {cache_key}")
+                    if use_entry and is_entry(cached_result):
+                        state = entry_state(cached_result, xfetch_beta)
+                        if state != FRESH:
+                            self._schedule_async_refresh(
+                                cache_key, namespace, lambda: compute(background_call(args, kwargs)), lock_ttl, state
+                            )
+                        return cached_result["value"]
                     return cached_result
                 
                 # Выполняем функцию
                 logger.debug(f"Cache miss for {cache_key}")
-                result = await func(*args, **kwargs)
                 
-                # Сохраняем в кэш
-                self.cache.set(cache_key, result, ttl, namespace)
+                async def load():
+                    return await self._async_load(cache_key, namespace, compute, lock_ttl)
+                
+                if not single_flight:
+                    return await load()
                 
+                result, shared = await self._async_flight.do((namespace, cache_key), load)
+                if shared:
+                    cache_metrics.record_coalesced(namespace)
                 return result
             
             @wraps(func)
             def sync_wrapper(*args, **kwargs):
                 # Создаем ключ кэша
-                if key_func:
-                    cache_key = key_func(*args, **kwargs)
-                else:
-                    cache_key = self._generate_key(func.__name__, args, kwargs)
+                cache_key = make_key(args, kwargs)
+                if cache_key is None:
+                    return func(*args, **kwargs)
+                
+                def compute(call: callable = lambda: func(*args, **kwargs)):
+                    started = time.perf_counter()
+                    result = call()
+                    value = self._cache_value(result, ttl, time.perf_counter() - started, use_entry)
+                    entry_tags = self._resolve_tags(tags, signature, args, kwargs)
+                    self.set_with_tags(cache_key, value, ttl + stale_ttl, namespace, entry_tags)
+                    return result
                 
                 # Пытаемся получить из кэша
                 cached_result = self.cache.get(cache_key, namespace)
                 if cached_result is not None:
                     logger.debug(f"Cache hit for {cache_key}")
+                    if use_entry and is_entry(cached_result):
+                        state = entry_state(cached_result, xfetch_beta)
+                        if state != FRESH:
+                            self._schedule_refresh(
+                                cache_key, namespace, lambda: compute(background_call(args, kwargs)), lock_ttl, state
+                            )
+                        return cached_result["value"]
                     return cached_result
                 
                 # Выполняем функцию
                 logger.debug(f"Cache miss for {cache_key}")
-                result = func(*args, **kwargs)
                 
-                # Сохраняем в кэш
-                self.cache.set(cache_key, result, ttl, namespace)
+                def load():
+                    return self._load(cache_key, namespace, compute, lock_ttl)
                 
+                if not single_flight:
+                    return load()
+                
+                result, shared = self._flight.do((namespace, cache_key), load)
+                if shared:
+                    cache_metrics.record_coalesced(namespace)
                 return result
             
-            if asyncio.iscoroutinefunction(func):
-                return async_wrapper
-            else:
-                return sync_wrapper
+            wrapper = async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+            wrapper.cache_key = lambda *args, **kwargs: make_key(args, kwargs)
+            return wrapper
         
         return decorator
     
-    def _generate_key(self, func_name: str, args: tuple, kwargs: dict) -> str:
-        """Генерирует ключ кэша"""
-        # Создаем строку из аргументов
-        args_str = str(args) + str(sorted(kwargs.items()))
+    @staticmethod
+    def _resolve_tags(
+        tags: Union[List[str], callable, None], signature: inspect.Signature, args: tuple, kwargs: dict
+    ) -> List[str]:
+        """Теги записи для конкретного вызова"""
+        if not tags:
+            return []
+        if callable(tags):
+            return list(tags(*args, **kwargs))
+        
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return [tag.format(**bound.arguments) for tag in tags]
+    
+    def set_with_tags(self, key: str, value: Any, ttl: int, namespace: str, tags: List[str]) -> bool:
+        """Записывает значение вместе с тегами за один round trip"""
+        if not tags:
+            return self.cache.set(key, value, ttl, namespace)
+        
+        with self.cache.pipeline() as pipe:
+            pipe.set(key, value, ttl, namespace).add_tags(key, tags, ttl, namespace)
+        return bool(pipe.results[0])
+    
+    async def async_set_with_tags(self, key: str, value: Any, ttl: int, namespace: str, tags: List[str]) -> bool:
+        """Запись значения с тегами для корутин"""
+        if not tags:
+            return await self.async_set(key, value, ttl, namespace)
+        if self.async_cache is None:
+            return await asyncio.to_thread(self.set_with_tags, key, value, ttl, namespace, tags)
+        
+        async with self.async_cache.pipeline() as pipe:
+            pipe.set(key, value, ttl, namespace).add_tags(key, tags, ttl, namespace)
+        return bool(pipe.results[0])
+    
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Инвалидирует записи с любым из тегов"""
+        return self.cache.invalidate_tags(tags)
+    
+    @staticmethod
+    def _cache_value(result: Any, ttl: int, compute_time: float, use_entry: bool) -> Any:
+        """Значение для записи: результат или конверт для XFetch/stale-while-revalidate"""
+        if use_entry:
+            return wrap_entry(result, ttl, compute_time)
+        return result
+    
+    @staticmethod
+    def _unwrap(cached: Any) -> Any:
+        """Результат функции из значения кэша"""
+        return cached["value"] if is_entry(cached) else cached
+    
+    def _load(self, cache_key: str, namespace: str, compute: callable, lock_ttl: Optional[float]) -> Any:
+        """Пересчет при промахе; с lock_ttl пересчитывает только владелец блокировки"""
+        if not lock_ttl:
+            cache_metrics.record_recompute(namespace, "miss")
+            return compute()
+        
+        token = self.cache.acquire_lock(cache_key, lock_ttl, namespace)
+        if token is None:
+            deadline = time.monotonic() + lock_ttl
+            while time.monotonic() < deadline:
+                time.sleep(self.LOCK_POLL_INTERVAL)
+                cached = self.cache.get(cache_key, namespace)
+                if cached is not None:
+                    cache_metrics.record_coalesced(namespace)
+                    return self._unwrap(cached)
+            # Владелец не успел: считаем сами, чтобы не отдавать ошибку
+            cache_metrics.record_recompute(namespace, "lock_timeout")
+            return compute()
+        
+        try:
+            # Значение могли записать между промахом и получением блокировки
+            cached = self.cache.get(cache_key, namespace)
+            if cached is not None:
+                return self._unwrap(cached)
+            cache_metrics.record_recompute(namespace, "miss")
+            return compute()
+        finally:
+            self.cache.release_lock(cache_key, token, namespace)
+    
+    async def _async_load(self, cache_key: str, namespace: str, compute: callable, lock_ttl: Optional[float]) -> Any:
+        """Пересчет при промахе для корутин; с lock_ttl пересчитывает только владелец блокировки"""
+        if not lock_ttl:
+            cache_metrics.record_recompute(namespace, "miss")
+            return await compute()
+        
+        token = await self._async_acquire_lock(cache_key, lock_ttl, namespace)
+        if token is None:
+            deadline = time.monotonic() + lock_ttl
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+                cached = await self.async_get(cache_key, namespace)
+                if cached is not None:
+                    cache_metrics.record_coalesced(namespace)
+                    return self._unwrap(cached)
+            # Владелец не успел: считаем сами, чтобы не отдавать ошибку
+            cache_metrics.record_recompute(namespace, "lock_timeout")
+            return await compute()
+        
+        try:
+            # Значение могли записать между промахом и получением блокировки
+            cached = await self.async_get(cache_key, namespace)
+            if cached is not None:
+                return self._unwrap(cached)
+            cache_metrics.record_recompute(namespace, "miss")
+            return await compute()
+        finally:
+            await self._async_release_lock(cache_key, token, namespace)
+    
+    def _start_refresh(self, cache_key: str, namespace: str) -> bool:
+        """Отмечает начало фонового обновления; False, если оно уже идет"""
+        with self._refreshing_lock:
+            if (namespace, cache_key) in self._refreshing:
+                return False
+            self._refreshing.add((namespace, cache_key))
+            return True
+    
+    def _finish_refresh(self, cache_key: str, namespace: str):
+        """Снимает отметку фонового обновления"""
+        with self._refreshing_lock:
+            self._refreshing.discard((namespace, cache_key))
+    
+    def _schedule_refresh(
+        self, cache_key: str, namespace: str, compute: callable, lock_ttl: Optional[float], reason: str
+    ):
+        """Запускает обновление значения в фоновом потоке (не больше одного на ключ)"""
+        if not self._start_refresh(cache_key, namespace):
+            return
+        
+        def refresh():
+            try:
+                token = self.cache.acquire_lock(cache_key, lock_ttl, namespace) if lock_ttl else None
+                if lock_ttl and token is None:
+                    return
+                try:
+                    cache_metrics.record_recompute(namespace, reason)
+                    compute()
+                finally:
+                    if token is not None:
+                        self.cache.release_lock(cache_key, token, namespace)
+            except Exception as e:
+                logger.error(f"Error refreshing cache key {cache_key}: {e}")
+            finally:
+                self._finish_refresh(cache_key, namespace)
+        
+        threading.Thread(target=refresh, name=f"cache-refresh-{cache_key}", daemon=True).start()
+    
+    def _schedule_async_refresh(
+        self, cache_key: str, namespace: str, compute: callable, lock_ttl: Optional[float], reason: str
+    ):
+        """Запускает обновление значения фоновой задачей (не больше одной на ключ)"""
+        if not self._start_refresh(cache_key, namespace):
+            return
         
-        # Создаем хэш
-        hash_obj = hashlib.md5(args_str.encode())
-        hash_str = hash_obj.hexdigest()
+        async def refresh():
+            try:
+                token = await self._async_acquire_lock(cache_key, lock_ttl, namespace) if lock_ttl else None
+                if lock_ttl and token is None:
+                    return
+                try:
+                    cache_metrics.record_recompute(namespace, reason)
+                    await compute()
+                finally:
+                    if token is not None:
+                        await self._async_release_lock(cache_key, token, namespace)
+            except Exception as e:
+                logger.error(f"Error refreshing cache key {cache_key}: {e}")
+            finally:
+                self._finish_refresh(cache_key, namespace)
         
-        return f"{func_name}:{hash_str}"
+        task = asyncio.create_task(refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
-    def invalidate_pattern(self, pattern: str, namespace: str = "default"):
-        """Инвалидирует кэш по паттерну"""
+    async def async_get(self, key: str, namespace: str) -> Any:
+        """Чтение для корутин: асинхронный клиент, без него - синхронный в потоке"""
+        if self.async_cache is not None:
+            return await self.async_cache.get(key, namespace)
+        return await asyncio.to_thread(self.cache.get, key, namespace)
+    
+    async def async_set(self, key: str, value: Any, ttl: int, namespace: str) -> bool:
+        """Запись для корутин: асинхронный клиент, без него - синхронный в потоке"""
+        if self.async_cache is not None:
+            return await self.async_cache.set(key, value, ttl, namespace)
+        return await asyncio.to_thread(self.cache.set, key, value, ttl, namespace)
+    
+    async def _async_acquire_lock(self, key: str, ttl: float, namespace: str) -> Optional[str]:
+        """Блокировка пересчета для корутин"""
+        if self.async_cache is not None:
+            return await self.async_cache.acquire_lock(key, ttl, namespace)
+        return await asyncio.to_thread(self.cache.acquire_lock, key, ttl, namespace)
+    
+    async def _async_release_lock(self, key: str, token: str, namespace: str) -> bool:
+        """Снятие блокировки пересчета для корутин"""
+        if self.async_cache is not None:
+            return await self.async_cache.release_lock(key, token, namespace)
+        return await asyncio.to_thread(self.cache.release_lock, key, token, namespace)
+    
+    def invalidate_pattern(self, pattern: str, namespace: str = "default") -> int:
+        """Инвалидирует кэш по паттерну; ключи удаляются одной командой"""
         keys = self.cache.get_keys(pattern, namespace)
-        for key in keys:
-            self.cache.delete(key, namespace)
+        return self.cache.delete_many(keys, namespace)
     
     def warm_cache(self, func: callable, args_list: List[tuple], namespace: str = "default"):
         """Прогревает кэш"""
@@ -414,7 +1437,15 @@ class CacheManager:
             except Exception as e:
                 logger.error(f"Error warming cache for {func.__name__}: {e}")
 
-# Глобальный экземпляр кэша
+# Глобальный экземпляр кэша (синхронный и асинхронный клиенты с общим L1)
 cache_config = CacheConfig()
-cache = RedisCache(cache_config)
-cache_manager = CacheManager(cache)
+if settings.cache_local_enabled:
+    local_cache = LocalCache(settings.cache_local_max_entries, settings.cache_local_ttl)
+    cache = TieredCache(cache_config, local_cache, settings.cache_invalidation_channel)
+    async_cache = AsyncTieredCache(
+        cache_config, local_cache, settings.cache_invalidation_channel, cache.instance_id
+    )
+else:
+    cache = RedisCache(cache_config)
+    async_cache = AsyncRedisCache(cache_config)
+cache_manager = CacheManager(cache, async_cache)
@@ -0,0 +1,234 @@
+import json
+import pickle
+import zlib
+import logging
+from typing import Any, Optional, Union
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+# Заголовок значения: версия формата, сериализатор, сжатие.
+# Старые значения (JSON-текст и pickle в hex) никогда не начинаются с \x01
+HEADER_VERSION = b"\x01"
+HEADER_SIZE = 3
+NO_COMPRESSION = b"-"
+
+
+class CodecError(ValueError):
+    """Ошибка декодирования значения кэша"""
+    pass
+
+
+class OrjsonSerializer:
+    """
+    JSON через orjson для значений из JSON-типов
+
+    datetime, Decimal, dataclass и т.п. не приводятся к строкам, а отклоняются
+    (TypeError), и кодек пишет такое значение через pickle без потери типов.
+    Кортежи становятся списками, UUID - строками.
+    """
+
+    tag = b"J"
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, option=self.options)
+
+    def loads(self, payload: bytes) -> Any:
+        return orjson.loads(payload)
+
+
+class MsgpackSerializer:
+    """msgpack для значений из JSON-типов и bytes; остальные отклоняются, как в orjson"""
+
+    tag = b"M"
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+class PickleSerializer:
+    """pickle для значений, которые не поддерживает основной сериализатор"""
+
+    tag = b"P"
+
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload: bytes) -> Any:
+        return pickle.loads(payload)
+
+
+class ZstdCompressor:
+    tag = b"Z"
+
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, payload: bytes) -> bytes:
+        return self._compressor.compress(payload)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return self._decompressor.decompress(payload)
+
+
+class LZ4Compressor:
+    tag = b"L"
+
+    def compress(self, payload: bytes) -> bytes:
+        return lz4_frame.compress(payload)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return lz4_frame.decompress(payload)
+
+
+class ZlibCompressor:
+    tag = b"D"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, payload: bytes) -> bytes:
+        return zlib.compress(payload, self.level)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return zlib.decompress(payload)
+
+
+# Доступные реализации: имя из настроек -> (фабрика, доступна ли зависимость)
+SERIALIZERS = {
+    "orjson": (OrjsonSerializer, True),
+    "msgpack": (MsgpackSerializer, msgpack is not None),
+    "pickle": (PickleSerializer, True),
+}
+
+COMPRESSORS = {
+    "zstd": (ZstdCompressor, zstandard is not None),
+    "lz4": (LZ4Compressor, lz4_frame is not None),
+    "zlib": (ZlibCompressor, True),
+}
+
+
+def _available(registry: dict) -> dict:
+    """Экземпляры доступных реализаций по тегу заголовка"""
+    instances = {}
+    for factory, available in registry.values():
+        if available:
+            instances[factory.tag] = factory()
+    return instances
+
+
+class CacheCodec:
+    """
+    Кодек значений кэша: сериализация + сжатие с заголовком типа
+
+    Формат: \\x01 | тег сериализатора | тег сжатия | данные. Значения, которые
+    основной сериализатор не поддерживает (datetime, Decimal, объекты),
+    пишутся через pickle - бинарный, без hex. Целые числа хранятся текстом
+    без заголовка, чтобы для них работали INCRBY/DECRBY. Читаются все форматы
+    (в т.ч. старые JSON и pickle-hex), независимо от настроек текущего воркера.
+    """
+
+    def __init__(
+        self,
+        serializer: str = "orjson",
+        compression: Optional[str] = None,
+        compression_threshold: int = 1024
+    ):
+        if serializer not in SERIALIZERS or not SERIALIZERS[serializer][1]:
+            logger.warning(f"Cache serializer {serializer} is not available, using orjson")
+            serializer = "orjson"
+        self.serializer = SERIALIZERS[serializer][0]()
+        self.fallback = PickleSerializer()
+
+        self.compressor = None
+        if compression:
+            if compression in COMPRESSORS and COMPRESSORS[compression][1]:
+                self.compressor = COMPRESSORS[compression][0]()
+            else:
+                logger.warning(f"Cache compression {compression} is not available, compression disabled")
+        self.compression_threshold = compression_threshold
+
+        self._serializers = _available(SERIALIZERS)
+        self._compressors = _available(COMPRESSORS)
+
+    def encode(self, value: Any) -> bytes:
+        """Кодирует значение для записи в Redis"""
+        if type(value) is int:
+            return str(value).encode()
+
+        try:
+            payload = self.serializer.dumps(value)
+            serializer_tag = self.serializer.tag
+        except TypeError:
+            payload = self.fallback.dumps(value)
+            serializer_tag = self.fallback.tag
+
+        compression_tag = NO_COMPRESSION
+        if self.compressor is not None and len(payload) >= self.compression_threshold:
+            compressed = self.compressor.compress(payload)
+            if len(compressed) < len(payload):
+                payload = compressed
+                compression_tag = self.compressor.tag
+
+        return HEADER_VERSION + serializer_tag + compression_tag + payload
+
+    def decode(self, raw: Union[bytes, str]) -> Any:
+        """Декодирует значение, прочитанное из Redis"""
+        if isinstance(raw, str):
+            raw = raw.encode()
+
+        if not is_encoded(raw):
+            return decode_legacy(raw)
+
+        serializer_tag = raw[1:2]
+        compression_tag = raw[2:3]
+        payload = raw[HEADER_SIZE:]
+
+        if compression_tag != NO_COMPRESSION:
+            compressor = self._compressors.get(compression_tag)
+            if compressor is None:
+                raise CodecError(f"Unsupported cache compression: {compression_tag!r}")
+            payload = compressor.decompress(payload)
+
+        serializer = self._serializers.get(serializer_tag)
+        if serializer is None:
+            raise CodecError(f"Unsupported cache serializer: {serializer_tag!r}")
+        return serializer.loads(payload)
+
+
+def is_encoded(raw: bytes) -> bool:
+    """Записано ли значение кодеком (а не в старом формате)"""
+    return raw[:1] == HEADER_VERSION
+
+
+def decode_legacy(raw: bytes) -> Any:
+    """Декодирует значение старого формата: JSON-текст или pickle в hex"""
+    text = raw.decode(errors="replace")
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        try:
+            return pickle.loads(bytes.fromhex(text))
+        except (ValueError, pickle.PickleError):
+            return text
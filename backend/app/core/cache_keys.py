@@ -0,0 +1,110 @@
+import inspect
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Iterable
+from uuid import UUID
+
+import orjson
+import xxhash
+from fastapi import BackgroundTasks, Request, Response, WebSocket
+from fastapi.params import Depends, Param
+from pydantic import BaseModel
+from sqlalchemy import inspect as sqlalchemy_inspect
+from sqlalchemy.exc import NoInspectionAvailable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+# Параметры, которые FastAPI подставляет сам и которые не влияют на результат
+INJECTED_NAMES = frozenset({"db", "session", "request", "response", "background_tasks"})
+INJECTED_TYPES = (AsyncSession, Session, Request, Response, BackgroundTasks, WebSocket)
+
+
+def hash_bytes(payload: bytes) -> str:
+    """Быстрый некриптографический хэш (xxh3-128)"""
+    return xxhash.xxh3_128_hexdigest(payload)
+
+
+def is_injected(name: str, parameter: inspect.Parameter) -> bool:
+    """Подставляется ли параметр фреймворком (сессия БД, запрос, ответ)"""
+    if name in INJECTED_NAMES:
+        return True
+    annotation = parameter.annotation
+    if inspect.isclass(annotation) and issubclass(annotation, INJECTED_TYPES):
+        return True
+    # Depends(get_db) без аннотации
+    default = parameter.default
+    return isinstance(default, Depends) and getattr(default.dependency, "__name__", "") == "get_db"
+
+
+def canonicalize(value: Any) -> Any:
+    """
+    Приводит аргумент к стабильному JSON-представлению
+
+    Объекты без стабильного представления (repr с адресом и т.п.) не
+    поддерживаются: TypeError лучше, чем ключ, который никогда не совпадет.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Param):
+        # Параметр не передан при прямом вызове обработчика: его значение по умолчанию
+        return canonicalize(value.default)
+    if isinstance(value, Enum):
+        return canonicalize(value.value)
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, BaseModel):
+        return canonicalize(value.model_dump(mode="json"))
+    if isinstance(value, dict):
+        return [[canonicalize(key), canonicalize(item)] for key, item in sorted(value.items(), key=lambda kv: str(kv[0]))]
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonicalize(item) for item in value), key=orjson.dumps)
+
+    try:
+        state = sqlalchemy_inspect(value)
+    except NoInspectionAvailable:
+        state = None
+    if state is not None and getattr(state, "identity", None) is not None:
+        # Объект модели - по классу и первичному ключу
+        return [type(value).__name__, canonicalize(state.identity)]
+
+    raise TypeError(f"Unsupported cache key argument of type {type(value).__name__}")
+
+
+class CacheKeyBuilder:
+    """
+    Ключ кэша по сигнатуре функции
+
+    Формат: модуль.функция:vГЛОБАЛЬНАЯ.ЛОКАЛЬНАЯ:хэш аргументов. Параметры,
+    которые подставляет FastAPI (db, request, response и т.п.), и параметры
+    из exclude в ключ не входят. Аргументы связываются с сигнатурой, поэтому
+    f(1), f(fund_id=1) и f(1, limit=20) при limit=20 по умолчанию дают один ключ.
+    """
+
+    def __init__(self, func: Callable, version: int = 0, exclude: Iterable[str] = ()):
+        self.signature = inspect.signature(func)
+        self.prefix = f"{func.__module__}.{func.__qualname__}:v{settings.cache_key_version}.{version}"
+        excluded = set(exclude)
+        # Параметры, привязанные к запросу: вне запроса их значения недействительны
+        self.injected = frozenset(
+            name for name, parameter in self.signature.parameters.items() if is_injected(name, parameter)
+        )
+        self.skipped = self.injected | frozenset(name for name in self.signature.parameters if name in excluded)
+
+    def __call__(self, args: tuple, kwargs: dict) -> str:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = [
+            [name, canonicalize(value)]
+            for name, value in bound.arguments.items()
+            if name not in self.skipped
+        ]
+        return f"{self.prefix}:{hash_bytes(orjson.dumps(arguments))}"
@@ -0,0 +1,136 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Маркер конверта значения в кэше (нужен для XFetch и stale-while-revalidate)
+ENTRY_MARKER = "__cache_entry__"
+
+# Состояния значения в конверте
+FRESH = "fresh"
+EARLY = "early"
+STALE = "stale"
+
+
+def wrap_entry(value: Any, ttl: int, compute_time: float) -> Dict[str, Any]:
+    """Конверт значения: мягкий срок годности и время вычисления"""
+    return {
+        ENTRY_MARKER: 1,
+        "value": value,
+        "expires_at": time.time() + ttl,
+        "delta": compute_time,
+    }
+
+
+def is_entry(cached: Any) -> bool:
+    """Записано ли значение в конверте"""
+    return isinstance(cached, dict) and cached.get(ENTRY_MARKER) == 1
+
+
+def entry_state(entry: Dict[str, Any], xfetch_beta: Optional[float], now: Optional[float] = None) -> str:
+    """
+    Состояние значения из конверта: fresh | early | stale
+
+    stale - мягкий срок прошел, значение отдается, пока идет пересчет
+    (stale-while-revalidate). early - срок не прошел, но по XFetch пора
+    обновить заранее: чем дольше вычисление и ближе срок, тем вероятнее.
+    """
+    now = time.time() if now is None else now
+    expires_at = entry["expires_at"]
+    if now >= expires_at:
+        return STALE
+
+    if xfetch_beta:
+        # log(u) < 0: сдвигаем "сейчас" вперед на случайную долю delta
+        if now - entry["delta"] * xfetch_beta * math.log(1.0 - random.random()) >= expires_at:
+            return EARLY
+
+    return FRESH
+
+
+class SingleFlight:
+    """Схлопывает одновременные вызовы с одним ключом внутри процесса (потоки)"""
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "SingleFlight._Call"] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Выполняет fn один раз на ключ; возвращает (результат, был ли вызов общим)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Выполняется ли сейчас вызов с этим ключом"""
+        with self._lock:
+            return key in self._calls
+
+
+class AsyncSingleFlight:
+    """
+    Схлопывает одновременные вызовы корутин с одним ключом внутри event loop
+
+    fn выполняется в отдельной задаче, которую все вызывающие, включая
+    первого, ждут через shield: отмена любого из них (например, клиент
+    оборвал запрос) не отменяет вычисление и не передается остальным.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Выполняет fn один раз на ключ; возвращает (результат, был ли вызов общим)"""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+
+        task = self._calls.get(call_key)
+        shared = task is not None
+        if not shared:
+            task = self._calls[call_key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(call_key, done))
+
+        return await asyncio.shield(task), shared
+
+    def _finish(self, call_key: Tuple[int, Hashable], task: asyncio.Future):
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        # Ошибку получают ожидающие; если все отменены, она не должна
+        # попасть в лог как "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Выполняется ли сейчас вызов с этим ключом в текущем event loop"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return (id(loop), key) in self._calls
@@ -0,0 +1,179 @@
+import logging
+from typing import Any, Iterable, Optional, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.orm import Mapper, ORMExecuteState, Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from sqlalchemy.util import await_only
+
+from .cache import async_cache, cache
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Теги, накопленные сессией до коммита
+PENDING_TAGS_KEY = "cache_pending_tags"
+
+# Модели с тегами: таблица -> (префикс тега записи, теги списков).
+# Например, изменение фонда 42 сбрасывает теги fund:42 и funds:list
+MODEL_TAGS = {
+    "funds": ("fund", ("funds:list",)),
+    "campaigns": ("campaign", ("campaigns:list",)),
+    "partner_applications": ("partner_application", ("partner_applications:list",)),
+}
+
+# Зависимые таблицы: таблица -> ((родительская таблица, внешний ключ), ...).
+# Новое пожертвование в кампанию меняет ее собранную сумму
+RELATED_TAGS = {
+    "campaign_donations": (("campaigns", "campaign_id"),),
+}
+
+
+def record_tags(table: str, identity: Any) -> Set[str]:
+    """Теги строки таблицы: запись и списки"""
+    prefix, list_tags = MODEL_TAGS[table]
+    return {f"{prefix}:{identity}", *list_tags}
+
+
+def table_tags(table: str) -> Set[str]:
+    """
+    Теги, сбрасываемые при изменении неизвестных строк таблицы
+
+    Тег таблицы (funds, campaigns) сбрасывается только массовым UPDATE/DELETE
+    без условия по id - его ставят записям отдельных строк вместе с тегом записи.
+    """
+    return {table, *MODEL_TAGS[table][1]}
+
+
+def tags_for_object(obj: Any) -> Set[str]:
+    """Теги измененного объекта модели (с учетом старых значений внешних ключей)"""
+    table = getattr(obj, "__tablename__", None)
+    tags = set()
+    
+    if table in MODEL_TAGS:
+        tags |= record_tags(table, obj.id)
+    
+    for parent, attribute in RELATED_TAGS.get(table, ()):
+        history = inspect(obj).attrs[attribute].history
+        for value in (*history.added, *history.unchanged, *history.deleted):
+            if value is not None:
+                tags |= record_tags(parent, value)
+    
+    return tags
+
+
+def _primary_key_values(mapper: Mapper, whereclause: Any) -> Optional[Set[Any]]:
+    """Значения id из условия вида id = :x или id IN (...); None, если условие другое"""
+    if whereclause is None or len(mapper.primary_key) != 1:
+        return None
+    
+    primary_key = mapper.primary_key[0]
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        clauses = whereclause.clauses
+    else:
+        clauses = [whereclause]
+    
+    for clause in clauses:
+        if not isinstance(clause, BinaryExpression) or not clause.left.compare(primary_key):
+            continue
+        if not isinstance(clause.right, BindParameter):
+            continue
+        if clause.operator is operators.eq:
+            return {clause.right.effective_value}
+        if clause.operator is operators.in_op:
+            return set(clause.right.effective_value or ())
+    
+    return None
+
+
+def tags_for_statement(mapper: Mapper, statement: Any) -> Set[str]:
+    """Теги массового UPDATE/DELETE по модели"""
+    table = mapper.local_table.name
+    tags = set()
+    
+    if table in MODEL_TAGS:
+        identities = _primary_key_values(mapper, statement.whereclause)
+        if identities is None:
+            tags |= table_tags(table)
+        for identity in identities or ():
+            tags |= record_tags(table, identity)
+    
+    # Родительские строки массового изменения неизвестны
+    for parent, _ in RELATED_TAGS.get(table, ()):
+        tags |= table_tags(parent)
+    
+    return tags
+
+
+def _pending_tags(session: Session) -> Set[str]:
+    return session.info.setdefault(PENDING_TAGS_KEY, set())
+
+
+def collect_flushed_tags(session: Session, flush_context: Any):
+    """Запоминает теги объектов, записанных flush (состояние сессии еще до flush)"""
+    tags = _pending_tags(session)
+    for obj in session.new:
+        tags |= tags_for_object(obj)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tags |= tags_for_object(obj)
+    for obj in session.deleted:
+        tags |= tags_for_object(obj)
+
+
+def collect_statement_tags(orm_execute_state: ORMExecuteState):
+    """Запоминает теги массовых UPDATE/DELETE по моделям"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        _pending_tags(orm_execute_state.session).update(
+            tags_for_statement(mapper, orm_execute_state.statement)
+        )
+
+
+def discard_pending_tags(session: Session):
+    """Изменения откатились - сбрасывать нечего"""
+    session.info.pop(PENDING_TAGS_KEY, None)
+
+
+def invalidate_committed_tags(session: Session):
+    """
+    Сбрасывает кэш по тегам закоммиченных изменений
+
+    Внутри AsyncSession коммит выполняется в greenlet, и асинхронный клиент
+    ожидается через await_only - event loop не блокируется, а к возврату из
+    await db.commit() кэш уже сброшен. В синхронной сессии - синхронный клиент.
+    """
+    tags = session.info.pop(PENDING_TAGS_KEY, None)
+    if not tags:
+        return
+    
+    invalidate_tags(tags)
+
+
+def invalidate_tags(tags: Iterable[str]) -> int:
+    """Сбрасывает кэш по тегам из синхронного кода или из greenlet AsyncSession"""
+    tags = sorted(tags)
+    logger.debug(f"Invalidating cache tags: {tags}")
+    try:
+        return await_only(async_cache.invalidate_tags(tags))
+    except MissingGreenlet:
+        # await_only уже закрыл корутину
+        return cache.invalidate_tags(tags)
+
+
+def install_cache_invalidation(session_class: type = Session):
+    """Подключает сброс кэша по тегам к сессиям (AsyncSession использует sync Session)"""
+    if not settings.cache_tag_invalidation_enabled:
+        return
+    if event.contains(session_class, "after_commit", invalidate_committed_tags):
+        return
+    
+    event.listen(session_class, "after_flush", collect_flushed_tags)
+    event.listen(session_class, "do_orm_execute", collect_statement_tags)
+    event.listen(session_class, "after_commit", invalidate_committed_tags)
+    event.listen(session_class, "after_rollback", discard_pending_tags)
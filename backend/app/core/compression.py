@@ -0,0 +1,180 @@
+import gzip
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = frozenset({
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+})
+
+
+class GzipEncoding:
+    name = "gzip"
+    level = 6
+
+    def compress(self, body: bytes) -> bytes:
+        # mtime=0: одинаковое тело - одинаковые байты
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+    def stream(self) -> "GzipStream":
+        return GzipStream(self.level)
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        # Z_SYNC_FLUSH: клиент получает каждую часть сразу, а не в конце потока
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoding:
+    name = "br"
+    # Качество 4-5 сжимает JSON лучше gzip при сопоставимой скорости
+    quality = 4
+
+    def compress(self, body: bytes) -> bytes:
+        return brotli.compress(body, quality=self.quality)
+
+    def stream(self) -> "BrotliStream":
+        return BrotliStream(self.quality)
+
+
+class BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoding:
+    name = "zstd"
+    level = 3
+
+    def compress(self, body: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(body)
+
+    def stream(self) -> "ZstdStream":
+        return ZstdStream(self.level)
+
+
+class ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Доступные реализации: имя кодировки -> (фабрика, доступна ли зависимость)
+ENCODINGS = {
+    "br": (BrotliEncoding, brotli is not None),
+    "zstd": (ZstdEncoding, zstandard is not None),
+    "gzip": (GzipEncoding, True),
+}
+
+_instances = {name: factory() for name, (factory, available) in ENCODINGS.items() if available}
+
+
+def available_encodings() -> List[str]:
+    """Включенные в настройках и установленные кодировки в порядке предпочтения"""
+    return [name for name in settings.compression_encodings if name in _instances]
+
+
+def get_encoding(name: str):
+    """Реализация кодировки по имени из Content-Encoding"""
+    return _instances[name]
+
+
+def negotiate_encoding(accept_encoding: Optional[str], encodings: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Кодировка ответа по Accept-Encoding или None
+
+    Выбирается наибольший q; при равных q - порядок compression_encodings.
+    q=0 запрещает кодировку, * задает вес для неперечисленных.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings() if encodings is None else encodings:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """Стоит ли сжимать тело с таким Content-Type"""
+    if not content_type:
+        return False
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+        or media_type.endswith("+xml")
+    )
+
+
+def weak_etag(etag: str) -> str:
+    """
+    ETag сжатого представления
+
+    Байты сжатого тела отличаются от исходных, поэтому строгий ETag
+    становится слабым (как в nginx). If-None-Match сравнивается слабо,
+    так что 304 продолжает работать для всех кодировок.
+    """
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """Сжатые варианты тела для кэша ответов: кодировка -> байты"""
+    if len(body) < settings.compression_min_size:
+        return {}
+
+    variants = {}
+    for name in available_encodings():
+        compressed = _instances[name].compress(body)
+        if len(compressed) < len(body):
+            variants[name] = compressed
+    return variants
@@ -23,6 +23,11 @@ class Settings(BaseSettings):
     database_pool_size: int = Field(default=10, description="Размер пула подключений")
     database_max_overflow: int = Field(default=20, description="Максимальное переполнение пула")
     database_pool_timeout: int = Field(default=30, description="Таймаут пула подключений")
+    database_pool_recycle: int = Field(default=1800, description="Время жизни подключения в пуле в секундах")
+    database_pool_pre_ping: bool = Field(default=True, description="Проверять подключение перед выдачей из пула")
+    database_slow_query_threshold: float = Field(default=0.5, description="Порог медленного запроса в секундах")
+    database_slow_query_log_params: bool = Field(default=True, description="Логировать параметры медленных запросов")
+    database_n_plus_one_threshold: int = Field(default=5, description="Число повторов одного запроса за HTTP-запрос, считающееся N+1")
     
     # Redis
     redis_url: str = Field(default="redis://localhost:6379/0", description="URL Redis")
@@ -72,6 +77,21 @@ class Settings(BaseSettings):
     # Мониторинг
     enable_metrics: bool = Field(default=True, description="Включить метрики")
     metrics_port: int = Field(default=9090, description="Порт для метрик")
+    metrics_multiprocess_dir: Optional[str] = Field(
+        default=None,
+        description="Каталог снимков метрик воркеров (например, /dev/shm/metrics); задан - /metrics суммирует все воркеры"
+    )
+    metrics_flush_interval: float = Field(default=1.0, description="Период записи снимка метрик воркера в секундах")
+    metrics_max_series_per_metric: int = Field(
+        default=1000,
+        description="Максимум серий (наборов меток) на метрику; новые сверх лимита сводятся в серию __overflow__"
+    )
+    event_loop_monitor_enabled: bool = Field(default=True, description="Измерять задержку event loop и искать блокирующие вызовы")
+    event_loop_monitor_interval: float = Field(default=0.1, description="Период проверки задержки event loop в секундах")
+    event_loop_stall_threshold: float = Field(
+        default=0.25,
+        description="Блокировка event loop дольше порога (в секундах) логируется со стеком и маршрутом"
+    )
     enable_health_checks: bool = Field(default=True, description="Включить проверки здоровья")
     
     # Файлы и загрузки
@@ -101,6 +121,15 @@ class Settings(BaseSettings):
     cache_ttl_user_data: int = Field(default=1800, description="TTL кэша пользовательских данных")
     cache_ttl_fund_data: int = Field(default=3600, description="TTL кэша данных фондов")
     cache_ttl_campaign_data: int = Field(default=1800, description="TTL кэша данных кампаний")
+    cache_local_enabled: bool = Field(default=True, description="Включить локальный (in-process) кэш перед Redis")
+    cache_local_max_entries: int = Field(default=1024, description="Максимальное количество записей локального кэша")
+    cache_local_ttl: int = Field(default=30, description="Максимальный TTL записи локального кэша в секундах")
+    cache_invalidation_channel: str = Field(default="cache:invalidate", description="Канал Redis pub/sub для инвалидации локального кэша")
+    cache_serializer: str = Field(default="orjson", description="Сериализатор значений кэша: orjson, msgpack или pickle")
+    cache_compression: Optional[str] = Field(default=None, description="Сжатие значений кэша: zstd, lz4 или zlib")
+    cache_compression_threshold: int = Field(default=1024, description="Минимальный размер значения для сжатия в байтах")
+    cache_key_version: int = Field(default=1, description="Версия схемы ключей кэша (увеличить при несовместимом изменении значений)")
+    cache_tag_invalidation_enabled: bool = Field(default=True, description="Сбрасывать кэш по тегам после коммита изменений моделей")
     
     # Безопасность дополнительная
     enable_csrf_protection: bool = Field(default=True, description="Включить защиту от CSRF")
@@ -110,7 +139,14 @@ class Settings(BaseSettings):
     # Производительность
     enable_compression: bool = Field(default=True, description="Включить сжатие ответов")
     compression_min_size: int = Field(default=1024, description="Минимальный размер для сжатия")
+    compression_encodings: List[str] = Field(
+        default=["br", "zstd", "gzip"],
+        description="Кодировки сжатия ответов в порядке предпочтения (brotli и zstandard - в requirements.txt; без них остается gzip)"
+    )
     enable_etag: bool = Field(default=True, description="Включить ETag")
+    response_cache_enabled: bool = Field(default=True, description="Кэшировать ответы GET-эндпоинтов с @cache_response")
+    response_cache_max_body_size: int = Field(default=1024 * 1024, description="Максимальный размер кэшируемого ответа в байтах")
+    response_cache_default_locale: str = Field(default="ru", description="Язык ключа кэша ответа без Accept-Language")
     
     # Резервное копирование
     backup_enabled: bool = Field(default=False, description="Включить резервное копирование")
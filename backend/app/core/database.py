@@ -1,20 +1,132 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .cache_tags import install_cache_invalidation
 from .config import settings
+from .metrics import database_metrics
+from .query_metrics import instrument_engine
 
-# Database engine
-engine = create_engine(settings.database_url)
+# Асинхронные драйверы для синхронных URL из настроек
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def make_async_url(database_url: str) -> str:
+    """Преобразует URL базы данных в URL с асинхронным драйвером"""
+    url = make_url(database_url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+class InstrumentedPoolMixin:
+    """Отправляет в метрики состояние пула, время ожидания подключения и его исчерпание"""
+
+    pool_name = "default"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        database_metrics.set_connection_pool_size(self.size(), pool=self.pool_name)
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            database_metrics.record_pool_timeout(self.pool_name)
+            raise
+        finally:
+            database_metrics.record_pool_wait(self.pool_name, time.perf_counter() - start_time)
+            self._report_status()
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self._report_status()
+
+    def _report_status(self):
+        database_metrics.record_pool_status(
+            self.pool_name,
+            checked_out=self.checkedout(),
+            checked_in=self.checkedin(),
+            overflow=max(self.overflow(), 0),
+        )
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    """Пул синхронного engine с метриками"""
+    pool_name = "sync"
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """Пул асинхронного engine с метриками"""
+    pool_name = "async"
+
+
+def pool_options(database_url: str, poolclass: type) -> dict:
+    """Параметры пула подключений из настроек"""
+    if make_url(database_url).get_backend_name() == "sqlite":
+        # SQLite использует собственные пулы без overflow/timeout
+        return {}
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_timeout": settings.database_pool_timeout,
+        "pool_recycle": settings.database_pool_recycle,
+        "pool_pre_ping": settings.database_pool_pre_ping,
+    }
+
+
+# Database engine (синхронный, для фоновых задач и sync-обработчиков)
+engine = create_engine(
+    settings.database_url,
+    **pool_options(settings.database_url, InstrumentedQueuePool)
+)
+instrument_engine(engine)
+
+# Асинхронный engine для обработчиков API
+async_database_url = make_async_url(settings.database_url)
+async_engine = create_async_engine(
+    async_database_url,
+    **pool_options(async_database_url, InstrumentedAsyncQueuePool)
+)
+instrument_engine(async_engine.sync_engine)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Base class for models
-Base = declarative_base()
+# Async session factory (expire_on_commit=False: после commit атрибуты
+# остаются доступными без неявной подгрузки)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# Сброс кэша по тегам после коммита изменений моделей
+install_cache_invalidation()
+
+# Base class for models (AsyncAttrs дает awaitable_attrs для связей)
+Base = declarative_base(cls=AsyncAttrs)
+
+
+async def get_db():
+    """Dependency to get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
-def get_db():
-    """Dependency to get database session"""
+def get_sync_db():
+    """Dependency to get sync database session"""
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,76 @@
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache_keys import hash_bytes
+from .config import settings
+from .database import get_db
+
+# Заголовки представления, которые не отправляются в ответе 304
+NOT_MODIFIED_DROPPED_HEADERS = frozenset({b"content-length", b"content-type", b"content-encoding", b"content-language"})
+
+
+def body_etag(body: bytes) -> str:
+    """Строгий ETag по хэшу тела ответа"""
+    return f'"{hash_bytes(body)}"'
+
+
+def version_etag(*parts: Any) -> str:
+    """
+    Строгий ETag по версии данных (таблица, id, updated_at)
+
+    В хэш входит cache_key_version: после изменения формата ответов
+    клиенты со старыми ETag получат новое тело, а не 304.
+    """
+    payload = orjson.dumps([settings.cache_key_version, *parts], default=str)
+    return f'"v{hash_bytes(payload)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с ETag (RFC 9110): W/"x" совпадает с "x", * - с любым"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def row_version_etag(model: Any, path_param: str) -> Callable:
+    """
+    Dependency: ETag по версии строки и 304 до вызова обработчика
+
+    Читает только coalesce(updated_at, created_at) по первичному ключу -
+    без загрузки объекта и сериализации ответа. ETag версии ставится и на
+    обычный GET: ETagMiddleware его не заменяет, поэтому следующий условный
+    запрос совпадет и получит 304. Подходит эндпоинтам, ответ которых
+    зависит только от этой строки:
+
+        @router.get("/{fund_id}", dependencies=[Depends(row_version_etag(Fund, "fund_id"))])
+    """
+    table = model.__tablename__
+    primary_key = model.__mapper__.primary_key[0]
+    version = select(func.coalesce(model.updated_at, model.created_at))
+
+    async def check_row_version(request: Request, response: Response, db: AsyncSession = Depends(get_db)) -> None:
+        if not settings.enable_etag:
+            return
+        try:
+            identity = primary_key.type.python_type(request.path_params[path_param])
+        except (KeyError, ValueError):
+            # Некорректный id - ошибку валидации вернет сам обработчик
+            return
+
+        updated_at = await db.scalar(version.where(primary_key == identity))
+        if updated_at is None:
+            return
+
+        etag = version_etag(table, identity, updated_at)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
+    return check_row_version
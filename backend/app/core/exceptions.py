@@ -1,6 +1,7 @@
 import logging
 from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from fastapi.utils import is_body_allowed_for_status_code
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
@@ -30,6 +31,13 @@ class CustomHTTPException(HTTPException):
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Обработчик HTTP исключений"""
     request_id = getattr(request.state, 'request_id', None)
+    headers = dict(exc.headers or {})
+    if request_id:
+        headers["X-Request-ID"] = request_id
+    
+    # 304 Not Modified и 204 отдаются без тела, с заголовками исключения (ETag)
+    if not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
     
     logger.warning(
         f"HTTP {exc.status_code}: {exc.detail} "
@@ -57,7 +65,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content=response_data,
-        headers={"X-Request-ID": request_id} if request_id else None
+        headers=headers or None
     )
 
 
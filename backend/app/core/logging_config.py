@@ -286,7 +286,8 @@ class PerformanceLogger:
     def __init__(self):
         self.logger = StructuredLogger('performance')
     
-    def log_slow_query(self, query: str, duration: float, params: Dict[str, Any]):
+    def log_slow_query(self, query: str, duration: float, params: Dict[str, Any],
+                       fingerprint: Optional[str] = None, route: Optional[str] = None):
         """Логирует медленные запросы к БД"""
         self.logger.warning(
             f"Slow database query: {duration:.3f}s",
@@ -294,10 +295,38 @@ class PerformanceLogger:
                 'query': query,
                 'duration': duration,
                 'params': params,
+                'fingerprint': fingerprint,
+                'route': route,
                 'event_type': 'slow_query'
             }
         )
     
+    def log_n_plus_one(self, query: str, count: int,
+                       fingerprint: Optional[str] = None, route: Optional[str] = None):
+        """Логирует вероятный N+1: один и тот же запрос повторяется в рамках HTTP-запроса"""
+        self.logger.warning(
+            f"Probable N+1 query: {count} repeats in {route}",
+            extra_data={
+                'query': query,
+                'count': count,
+                'fingerprint': fingerprint,
+                'route': route,
+                'event_type': 'n_plus_one'
+            }
+        )
+    
+    def log_event_loop_stall(self, duration: float, route: Optional[str], stack: str):
+        """Логирует блокировку event loop: синхронный вызов в асинхронном коде"""
+        self.logger.warning(
+            f"Event loop blocked for {duration:.3f}s in {route}",
+            extra_data={
+                'duration': duration,
+                'route': route,
+                'stack': stack,
+                'event_type': 'event_loop_stall'
+            }
+        )
+    
     def log_cache_miss(self, key: str, operation: str):
         """Логирует промахи кэша"""
         self.logger.info(
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Optional
+
+from .logging_config import performance_logger
+from .metrics import EventLoopMetrics, event_loop_metrics
+from .query_metrics import current_request_scope, route_from_scope
+
+logger = logging.getLogger(__name__)
+
+# Задача asyncio -> scope HTTP-запроса, который она обслуживает. Контекст
+# (current_request_scope) чужой задачи из другого потока не прочитать,
+# поэтому сторожевой поток находит маршрут через этот реестр
+_request_tasks: "weakref.WeakKeyDictionary[asyncio.Task, dict]" = weakref.WeakKeyDictionary()
+
+
+def track_request_task(scope: dict):
+    """Связывает текущую задачу с запросом (вызывается RequestContextMiddleware)"""
+    task = asyncio.current_task()
+    if task is not None:
+        _request_tasks[task] = scope
+
+
+class EventLoopMonitor:
+    """
+    Задержка event loop и поиск блокирующих вызовов
+
+    Проба в event loop засыпает на interval и записывает, насколько позже
+    проснулась, в гистограмму event_loop_lag_seconds. Сторожевой поток
+    следит за временем последнего пробуждения: если loop не отвечает дольше
+    threshold, он снимает стек потока loop (sys._current_frames) - это и
+    есть блокирующий вызов - и логирует его вместе с маршрутом запроса,
+    задача которого сейчас выполняется. Одна блокировка логируется один раз.
+
+    Задачи, созданные внутри запроса (BaseHTTPMiddleware запускает обработчик
+    в дочерней задаче), связываются с ним через фабрику задач loop.
+    """
+
+    def __init__(self, interval: float, threshold: float, metrics: Optional[EventLoopMetrics] = None):
+        self.interval = interval
+        self.threshold = threshold
+        self.metrics = metrics or event_loop_metrics
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._previous_factory = None
+        self._heartbeat = time.monotonic()
+        self._probe: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Запускает пробу и сторожевой поток (вызывается из работающего loop)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._create_task)
+        self._heartbeat = time.monotonic()
+        self._probe = self._loop.create_task(self._measure_lag(), name="event-loop-monitor")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает пробу и сторожевой поток"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.threshold + 1)
+            self._thread = None
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+        if self._loop is not None and self._loop.get_task_factory() == self._create_task:
+            self._loop.set_task_factory(self._previous_factory)
+        self._loop = None
+
+    def _create_task(self, loop: asyncio.AbstractEventLoop, coro, **kwargs) -> asyncio.Task:
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        # Фабрика вызывается в контексте создающей задачи: дочерняя задача
+        # обслуживает тот же запрос
+        scope = current_request_scope.get()
+        if scope is not None:
+            _request_tasks[task] = scope
+        return task
+
+    async def _measure_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = now = time.monotonic()
+            self.metrics.record_lag(max(0.0, now - started - self.interval))
+
+    def _watch(self):
+        reported = None
+        check_interval = min(self.interval, self.threshold / 2)
+        while not self._stop.wait(check_interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            try:
+                self._report_stall(blocked)
+            except Exception as e:
+                logger.error(f"Error reporting event loop stall: {e}")
+
+    def _report_stall(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        task = asyncio.current_task(self._loop)
+        route = route_from_scope(_request_tasks.get(task) if task is not None else None)
+        self.metrics.record_stall(route)
+        performance_logger.log_event_loop_stall(blocked, route, stack)
+
+
+event_loop_monitor: Optional[EventLoopMonitor] = None
+
+
+def start_event_loop_monitor(interval: float, threshold: float) -> EventLoopMonitor:
+    """Включает мониторинг event loop текущего воркера"""
+    global event_loop_monitor
+    if event_loop_monitor is None:
+        event_loop_monitor = EventLoopMonitor(interval, threshold)
+        event_loop_monitor.start()
+    return event_loop_monitor
+
+
+def stop_event_loop_monitor():
+    """Выключает мониторинг event loop"""
+    global event_loop_monitor
+    if event_loop_monitor is not None:
+        event_loop_monitor.stop()
+        event_loop_monitor = None
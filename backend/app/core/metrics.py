@@ -1,12 +1,16 @@
+import math
 import time
 import asyncio
-from typing import Dict, Any, Optional, List
+from bisect import bisect_left
+from typing import Dict, Any, Iterable, Optional, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
 import threading
 import logging
 
+from .config import settings
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -32,58 +36,397 @@ class HistogramMetric(Metric):
     """Гистограмма"""
     buckets: List[float] = field(default_factory=list)
 
+# Границы корзин гистограмм по умолчанию: длительности в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Границы корзин метрик со своей шкалой: не секунды или миллисекундная точность
+HISTOGRAM_BUCKETS = {
+    'event_loop_lag_seconds': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    'database_queries_per_request': (1, 2, 3, 5, 10, 20, 50, 100),
+    'donation_amount': (100, 500, 1000, 5000, 10000, 50000, 100000, 500000),
+    'payment_amount': (100, 500, 1000, 5000, 10000, 50000, 100000, 500000),
+}
+
+# Квантили в get_metrics
+HISTOGRAM_QUANTILES = (0.5, 0.95, 0.99)
+
+# Значение меток серии, в которую сводятся наборы меток сверх metrics_max_series_per_metric
+OVERFLOW_LABEL_VALUE = '__overflow__'
+
+# Сведение измерителей нескольких воркеров: live - серия на процесс (метка pid),
+# sum - сумма, max - максимум. Учитываются только живые процессы
+GAUGE_LIVE = 'live'
+GAUGE_SUM = 'sum'
+GAUGE_MAX = 'max'
+
+GAUGE_MODES = {
+    'database_connection_pool_size': GAUGE_SUM,
+    'database_connection_pool_checked_out': GAUGE_SUM,
+    'database_connection_pool_checked_in': GAUGE_SUM,
+    'database_connection_pool_overflow': GAUGE_SUM,
+    'system_memory_usage_mb': GAUGE_SUM,
+    'system_active_connections': GAUGE_SUM,
+    'system_disk_usage_percent': GAUGE_MAX,
+}
+
+
+def format_value(value: float) -> str:
+    """Число в формате Prometheus (+Inf для бесконечности)"""
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами: O(1) памяти на серию
+    
+    Хранит число попаданий в каждую корзину (значение <= границы), сумму,
+    минимум и максимум. Накопленные счетчики корзин отдаются как
+    _bucket{le=...} в Prometheus, квантили оцениваются по корзинам так же,
+    как histogram_quantile.
+    """
+    
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'min', 'max')
+    
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(bounds))
+        # Последняя корзина - +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def observe(self, value: float):
+        """Добавляет наблюдение"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    
+    def merge(self, other: "Histogram"):
+        """
+        Прибавляет наблюдения другой гистограммы с теми же границами
+        
+        count берется из скопированных корзин, поэтому в сумме всегда равен
+        корзине +Inf, даже если other в это время пополняется своим потоком.
+        """
+        counts = list(other.counts)
+        for index, count in enumerate(counts):
+            self.counts[index] += count
+        self.count += sum(counts)
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def state(self) -> Dict[str, Any]:
+        """Состояние для снимка метрик процесса"""
+        return {
+            'bounds': self.bounds,
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Histogram":
+        """Гистограмма из снимка метрик процесса"""
+        histogram = cls(state['bounds'])
+        histogram.counts = list(state['counts'])
+        histogram.count = sum(histogram.counts)
+        histogram.sum = state['sum']
+        if histogram.count:
+            histogram.min = state['min']
+            histogram.max = state['max']
+        return histogram
+    
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Накопленные счетчики: (граница, число значений <= границы), последняя - +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip((*self.bounds, math.inf), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+    
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        
+        rank = q * self.count
+        lower = 0.0
+        seen = 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if math.isinf(bound):
+                    # В корзине +Inf граница неизвестна: лучшее, что есть, - максимум
+                    return self.max
+                in_bucket = total - seen
+                fraction = (rank - seen) / in_bucket if in_bucket else 1.0
+                # Границы корзины сужаются до наблюдавшихся min/max
+                low = max(lower, self.min)
+                return min(low + (bound - low) * fraction, self.max)
+            lower = bound
+            seen = total
+        return self.max
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Сводка для get_metrics"""
+        summary = {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count else 0,
+            'min': self.min if self.count else 0,
+            'max': self.max if self.count else 0,
+            # Ключи - границы le в формате Prometheus: сводка сериализуется в JSON без Infinity
+            'buckets': {format_value(bound): count for bound, count in self.cumulative()},
+        }
+        for q in HISTOGRAM_QUANTILES:
+            summary[f'p{round(q * 100)}'] = self.quantile(q)
+        return summary
+
+
+def summarize(counters: Dict[str, float], gauges: Dict[str, float], histograms: Dict[str, Histogram]) -> Dict[str, Any]:
+    """Метрики в формате get_metrics"""
+    return {
+        'counters': counters,
+        'gauges': gauges,
+        'histograms': {
+            name: histogram.snapshot()
+            for name, histogram in histograms.items()
+        }
+    }
+
+
+class MetricShard:
+    """
+    Счетчики и гистограммы одного потока
+    
+    В шард пишет только его поток, поэтому запись идет без блокировок:
+    при GIL += над значением словаря из одного потока не теряет обновлений,
+    а list()/dict() при сборе копируют словари атомарно.
+    """
+    
+    __slots__ = ('counters', 'histograms')
+    
+    def __init__(self):
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.histograms: Dict[str, Histogram] = {}
+
+
+class BoundCounter:
+    """Счетчик с привязанными метками: ключ серии вычислен один раз"""
+    
+    __slots__ = ('collector', 'key')
+    
+    def __init__(self, collector: "MetricsCollector", key: str):
+        self.collector = collector
+        self.key = key
+    
+    def inc(self, value: float = 1.0):
+        self.collector._shard().counters[self.key] += value
+
+
+class BoundGauge:
+    """Измеритель с привязанными метками"""
+    
+    __slots__ = ('collector', 'key')
+    
+    def __init__(self, collector: "MetricsCollector", key: str):
+        self.collector = collector
+        self.key = key
+    
+    def set(self, value: float):
+        self.collector._gauges[self.key] = value
+
+
+class BoundHistogram:
+    """Гистограмма с привязанными метками и границами корзин"""
+    
+    __slots__ = ('collector', 'key', 'bounds')
+    
+    def __init__(self, collector: "MetricsCollector", key: str, bounds: Tuple[float, ...]):
+        self.collector = collector
+        self.key = key
+        self.bounds = bounds
+    
+    def observe(self, value: float):
+        histograms = self.collector._shard().histograms
+        histogram = histograms.get(self.key)
+        if histogram is None:
+            histogram = histograms[self.key] = Histogram(self.bounds)
+        histogram.observe(value)
+
+
 class MetricsCollector:
-    """Сборщик метрик"""
+    """
+    Сборщик метрик
+    
+    Счетчики и гистограммы пишутся в шард текущего потока (корутины одного
+    event loop делят шард его потока) и суммируются при get_metrics, так что
+    на горячем пути нет общей блокировки. Для частых вызовов лучше заранее
+    получить серию с метками: collector.counter(name, labels).inc().
+    """
     
     def __init__(self):
-        self._counters: Dict[str, float] = defaultdict(float)
-        self._gauges: Dict[str, float] = defaultdict(float)
-        self._histograms: Dict[str, List[float]] = defaultdict(list)
+        self._gauges: Dict[str, float] = {}
+        self._histogram_buckets: Dict[str, Tuple[float, ...]] = dict(HISTOGRAM_BUCKETS)
+        # Ключ серии -> (имя метрики, метки) для экспорта в Prometheus
+        self._series: Dict[str, Tuple[str, Tuple[Tuple[str, str], ...]]] = {}
+        self._keys: Dict[tuple, str] = {}
+        self._series_counts: Dict[str, int] = defaultdict(int)
+        self._gauge_modes: Dict[str, str] = dict(GAUGE_MODES)
+        # Шарды живых потоков; шарды завершившихся сливаются в _retired
+        self._shards: List[Tuple[threading.Thread, MetricShard]] = []
+        self._retired = MetricShard()
+        self._local = threading.local()
         self._lock = threading.Lock()
     
+    def configure_histogram(self, name: str, buckets: Iterable[float]):
+        """Задает границы корзин гистограммы (для серий, созданных после вызова)"""
+        with self._lock:
+            self._histogram_buckets[name] = tuple(sorted(buckets))
+    
+    def counter(self, name: str, labels: Dict[str, str] = None) -> BoundCounter:
+        """Счетчик с привязанными метками"""
+        return BoundCounter(self, self._make_key(name, labels))
+    
+    def gauge(self, name: str, labels: Dict[str, str] = None) -> BoundGauge:
+        """Измеритель с привязанными метками"""
+        return BoundGauge(self, self._make_key(name, labels))
+    
+    def histogram(self, name: str, labels: Dict[str, str] = None) -> BoundHistogram:
+        """Гистограмма с привязанными метками"""
+        return BoundHistogram(self, self._make_key(name, labels), self._histogram_buckets.get(name, DEFAULT_BUCKETS))
+    
     def increment_counter(self, name: str, value: float = 1.0, labels: Dict[str, str] = None):
         """Увеличивает счетчик"""
-        with self._lock:
-            key = self._make_key(name, labels)
-            self._counters[key] += value
+        self._shard().counters[self._make_key(name, labels)] += value
     
     def set_gauge(self, name: str, value: float, labels: Dict[str, str] = None):
         """Устанавливает значение измерителя"""
-        with self._lock:
-            key = self._make_key(name, labels)
-            self._gauges[key] = value
+        self._gauges[self._make_key(name, labels)] = value
     
     def observe_histogram(self, name: str, value: float, labels: Dict[str, str] = None):
         """Добавляет значение в гистограмму"""
+        key = self._make_key(name, labels)
+        histograms = self._shard().histograms
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._histogram_buckets.get(name, DEFAULT_BUCKETS))
+        histogram.observe(value)
+    
+    def configure_gauge(self, name: str, mode: str):
+        """Задает сведение измерителя между воркерами: live, sum или max"""
         with self._lock:
-            key = self._make_key(name, labels)
-            self._histograms[key].append(value)
+            self._gauge_modes[name] = mode
+    
+    def gauge_mode(self, name: str) -> str:
+        """Сведение измерителя между воркерами"""
+        return self._gauge_modes.get(name, GAUGE_LIVE)
     
     def get_metrics(self) -> Dict[str, Any]:
-        """Получает все метрики"""
+        """Получает все метрики, суммируя шарды потоков"""
+        return summarize(*self.collect())
+    
+    def collect(self) -> Tuple[Dict[str, float], Dict[str, float], Dict[str, Histogram]]:
+        """Счетчики, измерители и гистограммы процесса, сложенные по шардам"""
+        counters = defaultdict(float)
+        histograms: Dict[str, Histogram] = {}
         with self._lock:
-            return {
-                'counters': dict(self._counters),
-                'gauges': dict(self._gauges),
-                'histograms': {
-                    name: {
-                        'values': values,
-                        'count': len(values),
-                        'sum': sum(values),
-                        'avg': sum(values) / len(values) if values else 0,
-                        'min': min(values) if values else 0,
-                        'max': max(values) if values else 0
-                    }
-                    for name, values in self._histograms.items()
-                }
-            }
+            self._retire_dead_shards()
+            shards = [shard for _, shard in self._shards]
+            self._add_shard(self._retired, counters, histograms)
+        
+        for shard in shards:
+            self._add_shard(shard, counters, histograms)
+        
+        return dict(counters), dict(self._gauges), histograms
+    
+    @staticmethod
+    def _add_shard(shard: MetricShard, counters: Dict[str, float], histograms: Dict[str, Histogram]):
+        """Прибавляет значения шарда к сумме"""
+        for key, value in list(shard.counters.items()):
+            counters[key] += value
+        for key, histogram in list(shard.histograms.items()):
+            merged = histograms.get(key)
+            if merged is None:
+                merged = histograms[key] = Histogram(histogram.bounds)
+            merged.merge(histogram)
+    
+    def series(self, key: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        """Имя метрики и метки серии по ключу"""
+        return self._series.get(key, (key, ()))
+    
+    def _shard(self) -> MetricShard:
+        """Шард текущего потока (создается при первой записи)"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = MetricShard()
+            with self._lock:
+                self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+    
+    def _retire_dead_shards(self):
+        """
+        Сливает шарды завершившихся потоков в общий (вызывается под _lock)
+        
+        В шард завершившегося потока больше никто не пишет, поэтому его можно
+        сложить без гонок. Иначе короткоживущие потоки (фоновое обновление
+        кэша, to_thread) копили бы шарды на все время жизни процесса.
+        """
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+                continue
+            self._add_shard(shard, self._retired.counters, self._retired.histograms)
+        self._shards = alive
     
     def _make_key(self, name: str, labels: Dict[str, str] = None) -> str:
-        """Создает ключ для метрики"""
+        """Создает ключ для метрики (готовые ключи кэшируются по имени и меткам)"""
         if not labels:
             return name
         
-        label_str = ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+        cache_key = (name, *labels.items())
+        key = self._keys.get(cache_key)
+        if key is not None:
+            return key
+        
+        items = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        if self._series_counts[name] >= settings.metrics_max_series_per_metric:
+            # Защита от взрыва кардинальности: ключ не кэшируется, чтобы не расти и здесь
+            return self._overflow_key(name, items)
+        
+        key = self._keys[cache_key] = self._format_key(name, items)
+        if key not in self._series:
+            self._series[key] = (name, items)
+            self._series_counts[name] += 1
+        return key
+    
+    def _overflow_key(self, name: str, items: Tuple[Tuple[str, str], ...]) -> str:
+        """Ключ серии __overflow__ для набора меток сверх лимита"""
+        items = tuple((k, OVERFLOW_LABEL_VALUE) for k, _ in items)
+        key = self._format_key(name, items)
+        if key not in self._series:
+            self._series[key] = (name, items)
+            logger.warning(
+                f"Metric {name} reached {settings.metrics_max_series_per_metric} series, "
+                f"new label sets are collapsed into {key}"
+            )
+        return key
+    
+    @staticmethod
+    def _format_key(name: str, items: Tuple[Tuple[str, str], ...]) -> str:
+        label_str = ','.join(f"{k}={v}" for k, v in items)
         return f"{name}{{{label_str}}}"
 
 class APIMetrics:
@@ -91,24 +434,37 @@ class APIMetrics:
     
     def __init__(self, collector: MetricsCollector):
         self.collector = collector
+        # (method, endpoint, status_code) -> серии запроса
+        self._request_series: Dict[Tuple[str, str, int], Tuple[BoundCounter, BoundHistogram, BoundCounter]] = {}
     
     def record_request(self, method: str, endpoint: str, status_code: int, duration: float):
         """Записывает метрики запроса"""
+        series = self._request_series.get((method, endpoint, status_code))
+        if series is None:
+            series = self._bind_request(method, endpoint, status_code)
+            if len(self._request_series) < settings.metrics_max_series_per_metric:
+                self._request_series[(method, endpoint, status_code)] = series
+        
+        requests, durations, responses = series
+        requests.inc()
+        durations.observe(duration)
+        responses.inc()
+    
+    def _bind_request(self, method: str, endpoint: str, status_code: int):
+        """Серии метрик запроса с метками"""
         labels = {
             'method': method,
             'endpoint': endpoint,
             'status_code': str(status_code)
         }
-        
-        # Счетчик запросов
-        self.collector.increment_counter('api_requests_total', labels=labels)
-        
-        # Длительность запроса
-        self.collector.observe_histogram('api_request_duration_seconds', duration, labels=labels)
-        
-        # Метрики по статус кодам
-        status_labels = {'status_code': str(status_code)}
-        self.collector.increment_counter('api_responses_total', labels=status_labels)
+        return (
+            # Счетчик запросов
+            self.collector.counter('api_requests_total', labels),
+            # Длительность запроса
+            self.collector.histogram('api_request_duration_seconds', labels),
+            # Метрики по статус кодам
+            self.collector.counter('api_responses_total', {'status_code': str(status_code)}),
+        )
     
     def record_error(self, method: str, endpoint: str, error_type: str):
         """Записывает метрики ошибок"""
@@ -172,25 +528,115 @@ class DatabaseMetrics:
     
     def __init__(self, collector: MetricsCollector):
         self.collector = collector
+        # (query_type, success, fingerprint, route) -> серии запроса к БД
+        self._query_series: Dict[Tuple[str, bool, Optional[str], Optional[str]], Tuple[BoundCounter, BoundHistogram]] = {}
     
-    def record_query(self, query_type: str, duration: float, success: bool):
+    def record_query(self, query_type: str, duration: float, success: bool,
+                     fingerprint: Optional[str] = None, route: Optional[str] = None):
         """Записывает метрики запросов к БД"""
+        series_key = (query_type, success, fingerprint, route)
+        series = self._query_series.get(series_key)
+        if series is None:
+            labels = {
+                'query_type': query_type,
+                'success': str(success)
+            }
+            if fingerprint:
+                labels['fingerprint'] = fingerprint
+            if route:
+                labels['route'] = route
+            series = (
+                self.collector.counter('database_queries_total', labels),
+                self.collector.histogram('database_query_duration_seconds', labels),
+            )
+            if len(self._query_series) < settings.metrics_max_series_per_metric:
+                self._query_series[series_key] = series
+        
+        queries, durations = series
+        queries.inc()
+        durations.observe(duration)
+    
+    def record_request_queries(self, route: str, count: int):
+        """Записывает число запросов к БД за один HTTP-запрос"""
+        labels = {'route': route}
+        self.collector.observe_histogram('database_queries_per_request', count, labels=labels)
+    
+    def record_n_plus_one(self, route: str, fingerprint: str):
+        """Записывает обнаружение вероятного N+1"""
         labels = {
-            'query_type': query_type,
-            'success': str(success)
+            'route': route,
+            'fingerprint': fingerprint
         }
-        
-        self.collector.increment_counter('database_queries_total', labels=labels)
-        self.collector.observe_histogram('database_query_duration_seconds', duration, labels=labels)
+        self.collector.increment_counter('database_n_plus_one_total', labels=labels)
     
     def record_connection(self, status: str):
         """Записывает метрики подключений к БД"""
         labels = {'status': status}
         self.collector.increment_counter('database_connections_total', labels=labels)
     
-    def set_connection_pool_size(self, size: int):
+    def set_connection_pool_size(self, size: int, pool: Optional[str] = None):
         """Устанавливает размер пула подключений"""
-        self.collector.set_gauge('database_connection_pool_size', size)
+        labels = {'pool': pool} if pool else None
+        self.collector.set_gauge('database_connection_pool_size', size, labels=labels)
+    
+    def record_pool_status(self, pool: str, checked_out: int, checked_in: int, overflow: int):
+        """Записывает состояние пула подключений"""
+        labels = {'pool': pool}
+        self.collector.set_gauge('database_connection_pool_checked_out', checked_out, labels=labels)
+        self.collector.set_gauge('database_connection_pool_checked_in', checked_in, labels=labels)
+        self.collector.set_gauge('database_connection_pool_overflow', overflow, labels=labels)
+    
+    def record_pool_wait(self, pool: str, duration: float):
+        """Записывает время ожидания подключения из пула"""
+        labels = {'pool': pool}
+        self.collector.observe_histogram('database_connection_pool_wait_seconds', duration, labels=labels)
+    
+    def record_pool_timeout(self, pool: str):
+        """Записывает исчерпание пула (таймаут ожидания подключения)"""
+        labels = {'pool': pool}
+        self.collector.increment_counter('database_connection_pool_timeouts_total', labels=labels)
+
+class CacheMetrics:
+    """Метрики кэша"""
+    
+    TIERS = ('l1', 'l2')
+    
+    def __init__(self, collector: MetricsCollector):
+        self.collector = collector
+        self._lookups: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+    
+    def record_lookup(self, namespace: str, result: str):
+        """Записывает обращение к кэшу: result = l1 | l2 | miss"""
+        labels = {'namespace': namespace, 'result': result}
+        self.collector.increment_counter('cache_requests_total', labels=labels)
+        
+        with self._lock:
+            lookups = self._lookups[namespace]
+            lookups[result] += 1
+            total = sum(lookups.values())
+            ratios = {tier: lookups[tier] / total for tier in self.TIERS}
+        
+        for tier, ratio in ratios.items():
+            self.collector.set_gauge('cache_hit_ratio', ratio, labels={'namespace': namespace, 'tier': tier})
+        self.collector.set_gauge(
+            'cache_hit_ratio', sum(ratios.values()), labels={'namespace': namespace, 'tier': 'total'}
+        )
+    
+    def record_invalidation(self, source: str):
+        """Записывает инвалидацию локального кэша (local | pubsub)"""
+        labels = {'source': source}
+        self.collector.increment_counter('cache_local_invalidations_total', labels=labels)
+    
+    def record_recompute(self, namespace: str, reason: str):
+        """Записывает пересчет значения: reason = miss | early | stale | lock_timeout"""
+        labels = {'namespace': namespace, 'reason': reason}
+        self.collector.increment_counter('cache_recomputes_total', labels=labels)
+    
+    def record_coalesced(self, namespace: str):
+        """Записывает вызов, который дождался чужого пересчета вместо своего"""
+        labels = {'namespace': namespace}
+        self.collector.increment_counter('cache_coalesced_total', labels=labels)
 
 class ExternalServiceMetrics:
     """Метрики для внешних сервисов"""
@@ -242,6 +688,21 @@ class SystemMetrics:
         """Записывает количество активных подключений"""
         self.collector.set_gauge('system_active_connections', count)
 
+class EventLoopMetrics:
+    """Метрики event loop воркера"""
+    
+    def __init__(self, collector: MetricsCollector):
+        self.collector = collector
+        self._lag = collector.histogram('event_loop_lag_seconds')
+    
+    def record_lag(self, lag: float):
+        """Записывает задержку планирования event loop"""
+        self._lag.observe(lag)
+    
+    def record_stall(self, route: str):
+        """Записывает блокировку event loop дольше порога"""
+        self.collector.increment_counter('event_loop_stalls_total', labels={'route': route})
+
 class HealthChecker:
     """Проверка здоровья системы"""
     
@@ -296,7 +757,12 @@ class HealthChecker:
         return 'healthy'
 
 class MetricsExporter:
-    """Экспортер метрик"""
+    """
+    Экспортер метрик
+    
+    collector - любой источник с get_metrics() и series(): сборщик процесса
+    или сводка по воркерам (core/metrics_multiprocess.py).
+    """
     
     def __init__(self, collector: MetricsCollector):
         self.collector = collector
@@ -306,26 +772,43 @@ class MetricsExporter:
         metrics = self.collector.get_metrics()
         lines = []
         
-        # Счетчики
-        for name, value in metrics['counters'].items():
-            lines.append(f"# TYPE {name} counter")
-            lines.append(f"{name} {value}")
+        # Счетчики и измерители
+        for kind in ('counter', 'gauge'):
+            for name, samples in self._families(metrics[f'{kind}s']).items():
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{self._format_labels(labels)} {format_value(value)}")
         
-        # Измерители
-        for name, value in metrics['gauges'].items():
-            lines.append(f"# TYPE {name} gauge")
-            lines.append(f"{name} {value}")
-        
-        # Гистограммы
-        for name, data in metrics['histograms'].items():
+        # Гистограммы: накопленные корзины, сумма и количество
+        for name, samples in self._families(metrics['histograms']).items():
             lines.append(f"# TYPE {name} histogram")
-            lines.append(f"{name}_count {data['count']}")
-            lines.append(f"{name}_sum {data['sum']}")
-            lines.append(f"{name}_avg {data['avg']}")
-            lines.append(f"{name}_min {data['min']}")
-            lines.append(f"{name}_max {data['max']}")
+            for labels, data in samples:
+                for bound, count in data['buckets'].items():
+                    bucket_labels = (*labels, ('le', bound))
+                    lines.append(f"{name}_bucket{self._format_labels(bucket_labels)} {count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {format_value(data['sum'])}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {data['count']}")
         
-        return '\n'.join(lines)
+        return '\n'.join(lines) + '\n'
+    
+    def _families(self, values: Dict[str, Any]) -> Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], Any]]]:
+        """Серии, сгруппированные по имени метрики: # TYPE пишется один раз на метрику"""
+        families = defaultdict(list)
+        for key, value in values.items():
+            name, labels = self.collector.series(key)
+            families[name].append((labels, value))
+        return families
+    
+    @staticmethod
+    def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+        """Метки в формате {k="v"} с экранированием \\, " и перевода строки"""
+        if not labels:
+            return ''
+        escaped = (
+            f'{k}="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for k, v in labels
+        )
+        return '{' + ','.join(escaped) + '}'
     
     def export_json(self) -> Dict[str, Any]:
         """Экспортирует метрики в формате JSON"""
@@ -339,8 +822,10 @@ collector = MetricsCollector()
 api_metrics = APIMetrics(collector)
 business_metrics = BusinessMetrics(collector)
 database_metrics = DatabaseMetrics(collector)
+cache_metrics = CacheMetrics(collector)
 external_service_metrics = ExternalServiceMetrics(collector)
 system_metrics = SystemMetrics(collector)
+event_loop_metrics = EventLoopMetrics(collector)
 health_checker = HealthChecker()
 metrics_exporter = MetricsExporter(collector)
 
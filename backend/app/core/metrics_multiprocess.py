@@ -0,0 +1,179 @@
+import glob
+import logging
+import os
+import threading
+from collections import defaultdict
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from .metrics import (
+    GAUGE_LIVE, GAUGE_SUM, Histogram, MetricsCollector, collector, metrics_exporter, summarize
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "metrics-"
+
+
+def is_process_alive(pid: int) -> bool:
+    """Жив ли процесс с таким pid на этом хосте"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessMetrics:
+    """
+    Метрики всех воркеров uvicorn/gunicorn
+
+    Каждый воркер раз в flush_interval атомарно (через rename) записывает
+    снимок своих метрик в общий каталог - лучше в tmpfs вроде /dev/shm,
+    очищаемый при перезапуске контейнера. /metrics в любом воркере читает
+    все снимки и сводит их: счетчики и гистограммы суммируются, в том числе
+    завершившихся воркеров (иначе суммы "откатывались" бы при рестарте
+    воркера), измерители - только живых, по режиму метрики (live/sum/max).
+    Запись на горячем пути не меняется: снимок делается фоновым потоком.
+    """
+
+    def __init__(self, collector: MetricsCollector, directory: str, flush_interval: float = 1.0):
+        self.collector = collector
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._series: Dict[str, Tuple[str, Tuple[Tuple[str, str], ...]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def path(self) -> str:
+        """Файл снимка текущего процесса"""
+        return os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{os.getpid()}.json")
+
+    def start(self):
+        """Запускает периодическую запись снимка"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.flush()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает запись и сохраняет последний снимок"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Записывает снимок метрик процесса"""
+        counters, gauges, histograms = self.collector.collect()
+        snapshot = {
+            "pid": os.getpid(),
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": {key: histogram.state() for key, histogram in histograms.items()},
+            "series": {key: self.collector.series(key) for key in chain(counters, gauges, histograms)},
+        }
+        path = self.path
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(orjson.dumps(snapshot))
+        os.replace(temporary, path)
+
+    def read_snapshots(self) -> List[Dict[str, Any]]:
+        """Снимки всех воркеров из каталога"""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}*.json")):
+            try:
+                with open(path, "rb") as file:
+                    snapshots.append(orjson.loads(file.read()))
+            except (OSError, orjson.JSONDecodeError) as e:
+                logger.warning(f"Error reading metrics snapshot {path}: {e}")
+        return snapshots
+
+    def collect(self) -> Tuple[Dict[str, float], Dict[str, float], Dict[str, Histogram]]:
+        """Счетчики, измерители и гистограммы, сведенные по всем воркерам"""
+        self.flush()
+
+        counters = defaultdict(float)
+        gauges: Dict[str, float] = {}
+        histograms: Dict[str, Histogram] = {}
+        series = {}
+
+        for snapshot in self.read_snapshots():
+            for key, (name, labels) in snapshot["series"].items():
+                series[key] = (name, tuple(tuple(label) for label in labels))
+
+            for key, value in snapshot["counters"].items():
+                counters[key] += value
+
+            for key, state in snapshot["histograms"].items():
+                histogram = Histogram.from_state(state)
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = histogram
+                elif merged.bounds == histogram.bounds:
+                    merged.merge(histogram)
+                else:
+                    logger.warning(f"Histogram {key} has different buckets in worker {snapshot['pid']}, skipped")
+
+            if not is_process_alive(snapshot["pid"]):
+                continue
+            for key, value in snapshot["gauges"].items():
+                name, labels = series[key]
+                mode = self.collector.gauge_mode(name)
+                if mode == GAUGE_LIVE:
+                    live_labels = (*labels, ("pid", str(snapshot["pid"])))
+                    live_key = f"{name}{{{','.join(f'{k}={v}' for k, v in live_labels)}}}"
+                    series[live_key] = (name, live_labels)
+                    gauges[live_key] = value
+                elif mode == GAUGE_SUM:
+                    gauges[key] = gauges.get(key, 0) + value
+                else:
+                    gauges[key] = max(gauges.get(key, value), value)
+
+        self._series = series
+        return dict(counters), gauges, histograms
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Метрики всех воркеров в формате MetricsCollector.get_metrics"""
+        return summarize(*self.collect())
+
+    def series(self, key: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        """Имя метрики и метки серии по ключу (в том числе из других воркеров)"""
+        return self._series.get(key) or self.collector.series(key)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+
+multiprocess_metrics: Optional[MultiprocessMetrics] = None
+
+
+def enable_multiprocess_metrics(directory: str, flush_interval: float = 1.0) -> MultiprocessMetrics:
+    """Включает сводку метрик по воркерам: /metrics и /metrics/json читают все снимки"""
+    global multiprocess_metrics
+    if multiprocess_metrics is None:
+        multiprocess_metrics = MultiprocessMetrics(collector, directory, flush_interval)
+        multiprocess_metrics.start()
+        metrics_exporter.collector = multiprocess_metrics
+    return multiprocess_metrics
+
+
+def disable_multiprocess_metrics():
+    """Сохраняет последний снимок и возвращает экспорт метрик только этого процесса"""
+    global multiprocess_metrics
+    if multiprocess_metrics is not None:
+        multiprocess_metrics.stop()
+        metrics_exporter.collector = collector
+        multiprocess_metrics = None
@@ -0,0 +1,103 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> list:
+    """Кодирует значение ключа сортировки с сохранением типа"""
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    if isinstance(value, Decimal):
+        return ["dec", str(value)]
+    return ["v", value]
+
+
+def _decode_value(tagged: list) -> Any:
+    """Декодирует значение ключа сортировки"""
+    tag, value = tagged
+    if tag == "dt":
+        return datetime.fromisoformat(value)
+    if tag == "d":
+        return date.fromisoformat(value)
+    if tag == "dec":
+        return Decimal(value)
+    return value
+
+
+def encode_cursor(sort_key: str, values: Sequence[Any]) -> str:
+    """Создает непрозрачный курсор из значений ключа сортировки последней строки"""
+    payload = {"s": sort_key, "v": [_encode_value(value) for value in values]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: str) -> List[Any]:
+    """Разбирает курсор; курсор от другой сортировки считается неверным"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["s"] != sort_key:
+            raise ValueError("cursor sort key mismatch")
+        return [_decode_value(tagged) for tagged in payload["v"]]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def apply_keyset(
+    query: Select,
+    columns: Sequence,
+    descending: bool,
+    cursor: Optional[str],
+    limit: int,
+    sort_key: str
+) -> Select:
+    """
+    Добавляет к запросу keyset-пагинацию по (columns...)
+
+    Последняя колонка должна быть уникальной (обычно id). Запрашивается
+    limit + 1 строка, чтобы понять, есть ли следующая страница.
+    """
+    if cursor:
+        values = tuple(decode_cursor(cursor, sort_key))
+        if len(values) != len(columns):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        key = tuple_(*columns)
+        query = query.where(key < values if descending else key > values)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def keyset_page(
+    rows: Sequence,
+    columns: Sequence,
+    limit: int,
+    sort_key: str,
+    response: Response
+) -> List:
+    """Обрезает лишнюю строку и выставляет заголовок X-Next-Cursor"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows
+
+    page = rows[:limit]
+    last = page[-1]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+        sort_key, [getattr(last, column.key) for column in columns]
+    )
+    return page
+
@@ -0,0 +1,193 @@
+import re
+import time
+import hashlib
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .metrics import database_metrics
+from .logging_config import performance_logger
+
+
+class RequestQueryStats:
+    """Статистика запросов к БД в рамках одного HTTP-запроса"""
+    
+    def __init__(self):
+        self.count = 0
+        self.fingerprints: Counter = Counter()
+        self.statements: Dict[str, str] = {}
+    
+    def record(self, fingerprint: str, statement: str):
+        """Учитывает выполненный запрос"""
+        self.count += 1
+        self.fingerprints[fingerprint] += 1
+        self.statements.setdefault(fingerprint, statement)
+    
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Отпечатки запросов, повторившихся не менее threshold раз (вероятный N+1)"""
+        return {
+            fingerprint: count
+            for fingerprint, count in self.fingerprints.items()
+            if count >= threshold
+        }
+
+
+# ASGI scope текущего запроса (устанавливается RequestContextMiddleware)
+current_request_scope: ContextVar[Optional[dict]] = ContextVar("current_request_scope", default=None)
+
+# Счетчик запросов к БД текущего HTTP-запроса
+current_query_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("current_query_stats", default=None)
+
+QUERY_START_KEY = "query_start_time"
+NO_ROUTE = "none"
+# Метка запросов, не совпавших ни с одним маршрутом (404, сканеры): сырой путь
+# в метке метрики дал бы отдельную серию на каждый URL
+UNMATCHED_ROUTE = "unmatched"
+MAX_LOGGED_PARAM_LENGTH = 200
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(statement: str) -> str:
+    """Нормализует SQL: убирает литералы, схлопывает списки параметров и пробелы"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_statement(statement: str) -> str:
+    """Короткий стабильный отпечаток нормализованного SQL"""
+    return hashlib.sha1(normalize_statement(statement).encode()).hexdigest()[:12]
+
+
+def statement_type(statement: str) -> str:
+    """Тип запроса (SELECT, INSERT, UPDATE, ...)"""
+    parts = statement.lstrip().split(None, 1)
+    return parts[0].upper() if parts else "UNKNOWN"
+
+
+def current_route() -> str:
+    """Шаблон маршрута текущего запроса (например, /api/v1/funds/{fund_id})"""
+    return route_from_scope(current_request_scope.get())
+
+
+def route_from_scope(scope: Optional[dict]) -> str:
+    """Шаблон маршрута из ASGI scope"""
+    if scope is None:
+        return NO_ROUTE
+
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+
+    return UNMATCHED_ROUTE
+
+
+def _loggable_params(parameters: Any, executemany: bool) -> Dict[str, Any]:
+    """Приводит параметры запроса к виду, пригодному для JSON-лога"""
+    if not settings.database_slow_query_log_params:
+        return {}
+
+    if executemany:
+        return {"executemany_rows": len(parameters)}
+
+    if isinstance(parameters, dict):
+        items = parameters.items()
+    else:
+        items = enumerate(parameters or ())
+
+    return {str(key): repr(value)[:MAX_LOGGED_PARAM_LENGTH] for key, value in items}
+
+
+def _record_query(conn, statement: str, parameters: Any, executemany: bool, success: bool):
+    """Записывает метрики запроса и логирует медленные запросы"""
+    start_times = conn.info.get(QUERY_START_KEY)
+    if not start_times:
+        return
+
+    duration = time.perf_counter() - start_times.pop()
+    fingerprint = fingerprint_statement(statement)
+    route = current_route()
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(fingerprint, statement)
+
+    database_metrics.record_query(
+        statement_type(statement),
+        duration,
+        success,
+        fingerprint=fingerprint,
+        route=route,
+    )
+
+    if duration >= settings.database_slow_query_threshold:
+        performance_logger.log_slow_query(
+            normalize_statement(statement),
+            duration,
+            _loggable_params(parameters, executemany),
+            fingerprint=fingerprint,
+            route=route,
+        )
+
+
+def report_request_queries(stats: RequestQueryStats, route: str):
+    """Записывает число запросов HTTP-запроса и предупреждает о вероятных N+1"""
+    database_metrics.record_request_queries(route, stats.count)
+
+    for fingerprint, count in stats.repeated(settings.database_n_plus_one_threshold).items():
+        database_metrics.record_n_plus_one(route, fingerprint)
+        performance_logger.log_n_plus_one(
+            normalize_statement(stats.statements[fingerprint]),
+            count,
+            fingerprint=fingerprint,
+            route=route,
+        )
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Запоминает время начала запроса"""
+    conn.info.setdefault(QUERY_START_KEY, []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Фиксирует успешно выполненный запрос"""
+    _record_query(conn, statement, parameters, executemany, success=True)
+
+
+def handle_error(exception_context):
+    """Фиксирует запрос, завершившийся ошибкой"""
+    conn = exception_context.connection
+    if conn is None or exception_context.statement is None:
+        return
+
+    executemany = bool(exception_context.execution_context and exception_context.execution_context.executemany)
+    _record_query(
+        conn,
+        exception_context.statement,
+        exception_context.parameters,
+        executemany,
+        success=False,
+    )
+
+
+def instrument_engine(engine: Engine):
+    """Подключает замер времени запросов к engine"""
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
@@ -0,0 +1,98 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.requests import Request
+
+from .cache_keys import hash_bytes
+from .config import settings
+
+# Атрибут эндпоинта с политикой кэширования ответа
+RESPONSE_CACHE_ATTR = "__response_cache__"
+
+# Ключ scope с тегами, добавленными эндпоинтом во время запроса
+RESPONSE_CACHE_TAGS_KEY = "response_cache_tags"
+
+# Заголовки ответа, которые не сохраняются в кэше (их добавляют на каждый запрос)
+UNCACHED_HEADERS = frozenset({b"date", b"server", b"x-request-id", b"x-process-time", b"x-db-queries", b"x-db-n-plus-one"})
+
+
+class ResponseCachePolicy:
+    """Политика кэширования ответа эндпоинта"""
+
+    def __init__(self, ttl: Union[int, str], tags: Iterable[str], vary_locale: bool):
+        self.ttl = ttl
+        self.tags = list(tags)
+        self.vary_locale = vary_locale
+
+    def resolve_ttl(self) -> int:
+        """TTL в секундах; строка - имя настройки (cache_ttl_fund_data и т.п.)"""
+        if isinstance(self.ttl, str):
+            return getattr(settings, self.ttl)
+        return self.ttl
+
+    def resolve_tags(self, path_params: Dict[str, Any]) -> List[str]:
+        """Теги записи, шаблоны форматируются параметрами пути ("fund:{fund_id}")"""
+        return [tag.format(**path_params) for tag in self.tags]
+
+
+def cache_response(
+    ttl: Union[int, str] = "cache_ttl_default",
+    tags: Iterable[str] = (),
+    vary_locale: bool = True
+) -> Callable:
+    """
+    Включает кэширование готового ответа GET-эндпоинта (ResponseCacheMiddleware)
+
+    Ответ должен зависеть только от пути, query-параметров и языка: эндпоинты
+    с данными пользователя так помечать нельзя. tags - теги для сброса при
+    изменении моделей (см. core/cache_tags.py).
+
+        @router.get("/{fund_id}")
+        @cache_response(ttl="cache_ttl_fund_data", tags=["fund:{fund_id}", "funds"])
+        async def get_fund(...)
+    """
+    policy = ResponseCachePolicy(ttl, tags, vary_locale)
+
+    def decorator(func: Callable) -> Callable:
+        setattr(func, RESPONSE_CACHE_ATTR, policy)
+        return func
+
+    return decorator
+
+
+def add_response_cache_tags(request: Request, *tags: str):
+    """
+    Добавляет теги к записи ответа, известные только после чтения данных
+
+        campaign = await db.get(Campaign, campaign_id)
+        add_response_cache_tags(request, f"fund:{campaign.fund_id}")
+    """
+    request.scope.setdefault(RESPONSE_CACHE_TAGS_KEY, []).extend(tags)
+
+
+def policy_for(endpoint: Any) -> Optional[ResponseCachePolicy]:
+    """Политика кэширования эндпоинта или None"""
+    return getattr(endpoint, RESPONSE_CACHE_ATTR, None)
+
+
+def normalize_query(query_string: bytes) -> str:
+    """Query-строка с отсортированными параметрами: ?b=2&a=1 и ?a=1&b=2 - один ключ"""
+    if not query_string:
+        return ""
+    pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return urlencode(sorted(pairs))
+
+
+def request_locale(headers: Iterable) -> str:
+    """Основной язык из Accept-Language (ru-RU,ru;q=0.9 -> ru)"""
+    for name, value in headers:
+        if name == b"accept-language":
+            primary = value.decode("latin-1").split(",", 1)[0].split(";", 1)[0].strip()
+            return primary.split("-", 1)[0].lower() or settings.response_cache_default_locale
+    return settings.response_cache_default_locale
+
+
+def response_cache_key(route_path: str, path: str, query_string: bytes, locale: str) -> str:
+    """Ключ ответа: шаблон маршрута (для чтения) и хэш пути, query и языка"""
+    raw = f"{path}?{normalize_query(query_string)}#{locale}"
+    return f"{route_path}:{hash_bytes(raw.encode())}"
@@ -1,16 +1,20 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import datetime
 import logging
 import os
 
 from .core.config import settings
-from .core.database import get_db
+from .core.database import get_db, async_engine
+from .core.cache import async_cache, cache, TieredCache
 from .core.exceptions import ErrorHandlers
 from .core.auth import create_auth_dependencies
 from .core.logging_config import setup_logging
+from .core.loop_monitor import start_event_loop_monitor, stop_event_loop_monitor
+from .core.metrics_multiprocess import disable_multiprocess_metrics, enable_multiprocess_metrics
+from .core.pagination import NEXT_CURSOR_HEADER
 from .core.metrics import (
     api_metrics, business_metrics, database_metrics,
     external_service_metrics, system_metrics, health_checker, metrics_exporter
@@ -20,7 +24,12 @@ from .middleware import (
     SecurityHeadersMiddleware,
     RateLimitMiddleware,
     CORSMiddleware as CustomCORSMiddleware,
-    RequestValidationMiddleware
+    RequestValidationMiddleware,
+    RequestContextMiddleware,
+    ResponseCacheMiddleware,
+    ETagMiddleware,
+    CompressionMiddleware,
+    RequestMetricsMiddleware
 )
 from .api import donations, subscriptions, zakat, funds, partners, users, campaigns, search, webhooks
 
@@ -55,10 +64,15 @@ app = FastAPI(
 ErrorHandlers.register_handlers(app)
 
 # Middleware (порядок важен!)
+app.add_middleware(ResponseCacheMiddleware)  # ближе всех к роутеру: ответы из кэша проходят остальные middleware
+app.add_middleware(ETagMiddleware)  # снаружи кэша ответов: 304 и для попаданий в кэш
+app.add_middleware(CompressionMiddleware)  # снаружи ETag: 304 сравнивается с ETag несжатого ответа
 app.add_middleware(LoggingMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(RequestValidationMiddleware)
 app.add_middleware(RateLimitMiddleware, calls=100, period=60)  # 100 запросов в минуту
+app.add_middleware(RequestMetricsMiddleware)  # метрики запросов с шаблоном маршрута в метке
+app.add_middleware(RequestContextMiddleware)
 
 # CORS middleware с настройками безопасности
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://t.me,https://web.telegram.org").split(",")
@@ -68,6 +82,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
     max_age=86400
 )
 
@@ -86,6 +101,53 @@ app.include_router(search.router, prefix="/api/v1/search", tags=["search"])
 app.include_router(webhooks.router, prefix="/api/v1/webhooks", tags=["webhooks"])
 
 
+@app.on_event("startup")
+async def start_cache_invalidation():
+    """Подписывается на инвалидацию локального кэша от других воркеров"""
+    if isinstance(cache, TieredCache):
+        cache.start_invalidation_listener()
+
+
+@app.on_event("startup")
+async def start_multiprocess_metrics():
+    """Включает сводку метрик по всем воркерам, если задан каталог снимков"""
+    if settings.metrics_multiprocess_dir:
+        enable_multiprocess_metrics(settings.metrics_multiprocess_dir, settings.metrics_flush_interval)
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """Запускает измерение задержки event loop и поиск блокирующих вызовов"""
+    if settings.event_loop_monitor_enabled:
+        start_event_loop_monitor(settings.event_loop_monitor_interval, settings.event_loop_stall_threshold)
+
+
+@app.on_event("shutdown")
+async def shutdown_loop_monitor():
+    """Останавливает мониторинг event loop"""
+    stop_event_loop_monitor()
+
+
+@app.on_event("shutdown")
+async def shutdown_multiprocess_metrics():
+    """Сохраняет последний снимок метрик воркера"""
+    disable_multiprocess_metrics()
+
+
+@app.on_event("shutdown")
+async def shutdown_database():
+    """Закрывает пул подключений к БД при остановке"""
+    await async_engine.dispose()
+
+
+@app.on_event("shutdown")
+async def shutdown_cache():
+    """Останавливает подписку на инвалидацию кэша и закрывает пул Redis"""
+    if isinstance(cache, TieredCache):
+        cache.stop_invalidation_listener()
+    await async_cache.close()
+
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -97,11 +159,11 @@ async def root():
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db)):
     """Проверка здоровья системы"""
     try:
         # Проверяем подключение к БД
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         
         # Записываем метрики
         database_metrics.record_connection("success")
@@ -152,12 +214,12 @@ async def get_metrics_json():
 
 
 @app.get("/health/detailed")
-async def detailed_health_check(db: Session = Depends(get_db)):
+async def detailed_health_check(db: AsyncSession = Depends(get_db)):
     """Детальная проверка здоровья системы"""
     try:
         # Регистрируем проверки здоровья
         async def check_database():
-            db.execute(text("SELECT 1"))
+            await db.execute(text("SELECT 1"))
             return True
         
         async def check_redis():
@@ -1,13 +1,383 @@
 import time
 import logging
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import Match
 from starlette.types import ASGIApp
 import uuid
 
+from ..core.cache import CacheManager, cache_manager
+from ..core.compression import (
+    available_encodings, get_encoding, is_compressible, negotiate_encoding, precompress, weak_etag
+)
+from ..core.config import settings
+from ..core.metrics import APIMetrics, api_metrics
+from ..core.etag import NOT_MODIFIED_DROPPED_HEADERS, body_etag, etag_matches
+from ..core.loop_monitor import track_request_task
+from ..core.query_metrics import (
+    RequestQueryStats,
+    current_query_stats,
+    current_request_scope,
+    report_request_queries,
+    route_from_scope,
+)
+from ..core.response_cache import RESPONSE_CACHE_TAGS_KEY, UNCACHED_HEADERS, policy_for, request_locale, response_cache_key
+
 logger = logging.getLogger(__name__)
 
+
+class RequestContextMiddleware:
+    """ASGI middleware, сохраняющий scope запроса в контексте и считающий запросы к БД"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestQueryStats()
+        scope_token = current_request_scope.set(scope)
+        stats_token = current_query_stats.set(stats)
+        track_request_task(scope)
+        
+        async def send_with_query_count(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Queries", str(stats.count))
+                repeated = stats.repeated(settings.database_n_plus_one_threshold)
+                if repeated:
+                    headers.append(
+                        "X-DB-N-Plus-One",
+                        ",".join(f"{fingerprint}={count}" for fingerprint, count in repeated.items())
+                    )
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_query_count)
+        finally:
+            current_query_stats.reset(stats_token)
+            current_request_scope.reset(scope_token)
+            report_request_queries(stats, route_from_scope(scope))
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware, записывающий метрики каждого HTTP-запроса
+    
+    Метка endpoint - шаблон маршрута FastAPI (/api/v1/campaigns/{campaign_id}),
+    а не путь запроса: иначе каждый id давал бы новую серию. Запросы без
+    маршрута сводятся в "unmatched", нестандартные методы - в "OTHER".
+    Длительность считается до отправки последней части тела.
+    """
+    
+    METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+    
+    def __init__(self, app: ASGIApp, metrics: Optional[APIMetrics] = None):
+        self.app = app
+        self.metrics = metrics or api_metrics
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.enable_metrics:
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        method = scope["method"] if scope["method"] in self.METHODS else "OTHER"
+        status_code = 500
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            self.metrics.record_error(method, route_from_scope(scope), type(e).__name__)
+            raise
+        finally:
+            self.metrics.record_request(method, route_from_scope(scope), status_code, time.perf_counter() - started)
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware, кэширующий готовые ответы GET-эндпоинтов с @cache_response
+    
+    Ключ - путь, нормализованная query-строка и язык из Accept-Language.
+    В двухуровневом кэше хранятся статус, заголовки и байты тела, поэтому при
+    попадании ответ отдается без вызова эндпоинта и повторной сериализации JSON.
+    Кэшируются только ответы 200 без Set-Cookie и Cache-Control: no-store. Подключается ближе всех к
+    приложению: заголовки остальных middleware добавляются и к ответам из кэша.
+    """
+    
+    NAMESPACE = "http"
+    
+    def __init__(self, app: ASGIApp, manager: Optional[CacheManager] = None):
+        self.app = app
+        self.manager = manager or cache_manager
+    
+    @staticmethod
+    def _match_route(scope) -> Tuple[Optional[Any], Dict[str, Any]]:
+        """Маршрут запроса (как в роутере Starlette: первый полностью совпавший)"""
+        router = getattr(scope.get("app"), "router", None)
+        for route in getattr(router, "routes", ()):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return route, child_scope.get("path_params", {})
+        return None, {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not settings.response_cache_enabled:
+            await self.app(scope, receive, send)
+            return
+        
+        route, path_params = self._match_route(scope)
+        policy = policy_for(getattr(route, "endpoint", None))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+        
+        locale = request_locale(scope["headers"]) if policy.vary_locale else ""
+        cache_key = response_cache_key(route.path, scope["path"], scope["query_string"], locale)
+        
+        cached = await self.manager.async_get(cache_key, self.NAMESPACE)
+        if cached is not None:
+            # Роутер не вызывается: маршрут для меток метрик проставляется здесь
+            scope["route"] = route
+            await self._send_cached(send, cached, Headers(scope=scope).get("accept-encoding"))
+            return
+        
+        response = {}
+        chunks = []
+        size = 0
+        cacheable = True
+        
+        async def send_and_capture(message):
+            nonlocal cacheable, size
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if policy.vary_locale:
+                    headers.add_vary_header("Accept-Language")
+                cacheable = (
+                    message["status"] == 200
+                    and "set-cookie" not in headers
+                    and "no-store" not in headers.get("cache-control", "").lower()
+                )
+                response["status"] = message["status"]
+                response["headers"] = [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in message["headers"]
+                    if name not in UNCACHED_HEADERS
+                ]
+                headers.append("X-Cache", "MISS")
+            elif message["type"] == "http.response.body" and cacheable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > settings.response_cache_max_body_size:
+                    cacheable = False
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                    if not message.get("more_body", False):
+                        response["body"] = b"".join(chunks)
+            await send(message)
+        
+        await self.app(scope, receive, send_and_capture)
+        
+        if cacheable and "body" in response:
+            if settings.enable_etag and not any(name == "etag" for name, _ in response["headers"]):
+                # ETag сохраняется вместе с ответом: попадания не хэшируют тело заново
+                response["headers"].append(["etag", body_etag(response["body"])])
+            content_type = next((value for name, value in response["headers"] if name == "content-type"), None)
+            if settings.enable_compression and is_compressible(content_type):
+                # Сжатые варианты хранятся рядом с телом: горячие ответы не сжимаются заново
+                response["variants"] = precompress(response["body"])
+            await self.manager.async_set_with_tags(
+                cache_key, response, policy.resolve_ttl(), self.NAMESPACE,
+                policy.resolve_tags(path_params) + scope.get(RESPONSE_CACHE_TAGS_KEY, [])
+            )
+    
+    @staticmethod
+    def _encode_headers(headers: List[List[str]]) -> List[Tuple[bytes, bytes]]:
+        """Сохраненные заголовки в формате ASGI"""
+        return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    
+    @classmethod
+    async def _send_cached(cls, send, cached: Dict[str, Any], accept_encoding: Optional[str]):
+        """Отдает сохраненный ответ, сжатый вариант - если клиент его принимает"""
+        message = {"type": "http.response.start", "status": cached["status"], "headers": cls._encode_headers(cached["headers"])}
+        headers = MutableHeaders(scope=message)
+        body = cached["body"]
+        
+        variants = cached.get("variants")
+        if variants and settings.enable_compression:
+            headers.add_vary_header("Accept-Encoding")
+            encoding = negotiate_encoding(accept_encoding, [name for name in available_encodings() if name in variants])
+            if encoding is not None:
+                body = variants[encoding]
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                if "etag" in headers:
+                    headers["ETag"] = weak_etag(headers["etag"])
+        
+        headers.append("X-Cache", "HIT")
+        await send(message)
+        await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware, сжимающий ответы (br, zstd, gzip по Accept-Encoding)
+    
+    Сжимаются ответы с текстовым Content-Type: тело целиком - если оно не
+    меньше compression_min_size, потоковые ответы - по частям с flush после
+    каждой, чтобы клиент не ждал конца потока. Ответы с Content-Encoding
+    (например, сжатый вариант из кэша ответов) пропускаются как есть.
+    Строгий ETag сжатого ответа становится слабым.
+    """
+    
+    SKIPPED_STATUSES = frozenset({204, 206, 304})
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not settings.enable_compression:
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start = None
+        stream = None
+        
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    message["status"] in self.SKIPPED_STATUSES
+                    or "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type"))
+                ):
+                    await send(message)
+                else:
+                    # Заголовки зависят от тела: отправляются вместе с первой частью
+                    start = message
+                return
+            
+            if message["type"] != "http.response.body" or (start is None and stream is None):
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if stream is not None:
+                chunk = stream.compress(body)
+                if not more_body:
+                    chunk += stream.finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+            
+            pending, start = start, None
+            headers = MutableHeaders(scope=pending)
+            headers.add_vary_header("Accept-Encoding")
+            
+            if not more_body:
+                compressed = get_encoding(encoding).compress(body) if len(body) >= settings.compression_min_size else body
+                if len(compressed) >= len(body):
+                    await send(pending)
+                    await send(message)
+                    return
+                self._mark_encoded(headers, encoding)
+                headers["Content-Length"] = str(len(compressed))
+                await send(pending)
+                await send({"type": "http.response.body", "body": compressed})
+                return
+            
+            stream = get_encoding(encoding).stream()
+            self._mark_encoded(headers, encoding)
+            del headers["content-length"]
+            await send(pending)
+            await send({"type": "http.response.body", "body": stream.compress(body), "more_body": True})
+        
+        await self.app(scope, receive, send_compressed)
+    
+    @staticmethod
+    def _mark_encoded(headers: MutableHeaders, encoding: str):
+        """Заголовки сжатого представления"""
+        headers["Content-Encoding"] = encoding
+        if "etag" in headers:
+            headers["ETag"] = weak_etag(headers["etag"])
+
+
+class ETagMiddleware:
+    """
+    ASGI middleware, добавляющий ETag к GET-ответам и отвечающий 304
+
+    ETag, выставленный обработчиком (версия строки) или сохраненный в кэше
+    ответов, используется как есть; иначе он считается по хэшу тела. При
+    совпадении с If-None-Match тело не отправляется. Потоковые ответы
+    (несколько частей тела) пропускаются без изменений.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not settings.enable_etag:
+            await self.app(scope, receive, send)
+            return
+        
+        if_none_match = None
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        
+        start = None
+        
+        async def send_with_etag(message):
+            nonlocal start
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                # Заголовки отправляются вместе с первой частью тела
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            
+            pending, start = start, None
+            if not message.get("more_body", False):
+                headers = MutableHeaders(scope=pending)
+                etag = headers.get("etag")
+                if etag is None:
+                    etag = headers["ETag"] = body_etag(message.get("body", b""))
+                if etag_matches(if_none_match, etag):
+                    await self._send_not_modified(send, pending)
+                    return
+            await send(pending)
+            await send(message)
+        
+        await self.app(scope, receive, send_with_etag)
+    
+    @staticmethod
+    async def _send_not_modified(send, start):
+        """Отдает 304 с заголовками исходного ответа без тела и его метаданных"""
+        headers = [(name, value) for name, value in start["headers"] if name not in NOT_MODIFIED_DROPPED_HEADERS]
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+
 class LoggingMiddleware(BaseHTTPMiddleware):
     """Middleware для логирования запросов"""
     
@@ -147,7 +517,8 @@ class CORSMiddleware(BaseHTTPMiddleware):
         allow_methods: list = None,
         allow_headers: list = None,
         allow_credentials: bool = False,
-        max_age: int = 86400
+        max_age: int = 86400,
+        expose_headers: list = None
     ):
         super().__init__(app)
         self.allow_origins = allow_origins or ["*"]
@@ -155,6 +526,7 @@ class CORSMiddleware(BaseHTTPMiddleware):
         self.allow_headers = allow_headers or ["*"]
         self.allow_credentials = allow_credentials
         self.max_age = max_age
+        self.expose_headers = expose_headers or []
     
     async def dispatch(self, request: Request, call_next):
         # Обрабатываем preflight запросы
@@ -175,6 +547,9 @@ class CORSMiddleware(BaseHTTPMiddleware):
         response.headers["Access-Control-Allow-Headers"] = ", ".join(self.allow_headers)
         response.headers["Access-Control-Max-Age"] = str(self.max_age)
         
+        if self.expose_headers:
+            response.headers["Access-Control-Expose-Headers"] = ", ".join(self.expose_headers)
+        
         if self.allow_credentials:
             response.headers["Access-Control-Allow-Credentials"] = "true"
         
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Numeric, JSON, Date, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Numeric, JSON, Date, Enum, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -34,6 +34,12 @@ class User(Base):
 class Fund(Base):
     """Фонд для пожертвований"""
     __tablename__ = "funds"
+    __table_args__ = (
+        # Каталог активных фондов (keyset по id), см. migrations/add_funds_indexes.sql
+        Index("idx_funds_active_id", "id", postgresql_where=text("active"), sqlite_where=text("active = 1")),
+        Index("idx_funds_active_country_id", "country_code", "id",
+              postgresql_where=text("active"), sqlite_where=text("active = 1")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
@@ -56,9 +62,36 @@ class Fund(Base):
     reports = relationship("Report", back_populates="fund")
 
 
+
+# Полнотекстовый документ фонда (PostgreSQL, конфигурация russian): название весомее описания.
+# Тот же expression используется в запросе поиска, иначе планировщик не выберет GIN-индекс
+FUND_SEARCH_CONFIG = text("'russian'::regconfig")
+fund_search_vector = func.setweight(
+    func.to_tsvector(FUND_SEARCH_CONFIG, func.coalesce(Fund.name, text("''"))),
+    text("'A'")
+).op("||")(func.setweight(
+    func.to_tsvector(FUND_SEARCH_CONFIG, func.coalesce(Fund.short_desc, text("''"))),
+    text("'B'")
+))
+
+# GIN-индексы поиска фондов есть только в PostgreSQL, см. migrations/add_funds_search_indexes.sql
+Index(
+    "idx_funds_search_vector", fund_search_vector,
+    postgresql_using="gin", postgresql_where=text("active")
+).ddl_if(dialect="postgresql")
+Index(
+    "idx_funds_name_trgm", Fund.name,
+    postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}, postgresql_where=text("active")
+).ddl_if(dialect="postgresql")
+
+
 class Donation(Base):
     """Разовое пожертвование"""
     __tablename__ = "donations"
+    __table_args__ = (
+        # История пожертвований пользователя (keyset по created_at, id)
+        Index("idx_donations_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -103,6 +136,11 @@ class DonationRequest(Base):
 class Subscription(Base):
     """Подписка на регулярные пожертвования"""
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        Index("idx_subscriptions_user_status", "user_id", "status"),
+        # Выборка подписок к списанию
+        Index("idx_subscriptions_status_next_payment", "status", "next_payment_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -146,6 +184,9 @@ class DerivedAlms(Base):
 class ZakatCalculation(Base):
     """Расчет закята"""
     __tablename__ = "zakat_calculations"
+    __table_args__ = (
+        Index("idx_zakat_calculations_user_created", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -184,6 +225,10 @@ class ZakatCalculation(Base):
 class PartnerApplication(Base):
     """Заявка на партнерство"""
     __tablename__ = "partner_applications"
+    __table_args__ = (
+        Index("idx_partner_applications_created_id", "created_at", "id"),
+        Index("idx_partner_applications_status_created_id", "status", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     organization_name = Column(String(255), nullable=False)
@@ -204,6 +249,13 @@ class PartnerApplication(Base):
 class Campaign(Base):
     """Целевая кампания"""
     __tablename__ = "campaigns"
+    __table_args__ = (
+        # Список кампаний: фильтры по статусу/стране/категории и keyset по сортировке
+        Index("idx_campaigns_status_created_id", "status", "created_at", "id"),
+        Index("idx_campaigns_status_country_category_created_id",
+              "status", "country_code", "category", "created_at", "id"),
+        Index("idx_campaigns_status_goal_id", "status", "goal_amount", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -230,6 +282,10 @@ class Campaign(Base):
 class CampaignDonation(Base):
     """Пожертвование в кампанию"""
     __tablename__ = "campaign_donations"
+    __table_args__ = (
+        Index("idx_campaign_donations_campaign_created_id", "campaign_id", "created_at", "id"),
+        Index("idx_campaign_donations_campaign_status", "campaign_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
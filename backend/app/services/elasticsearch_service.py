@@ -286,7 +286,7 @@ class ElasticsearchService:
             }
         except Exception as e:
             logger.error(f"Error searching funds: {e}")
-            return {"hits": [], "total": 0, "took": 0}
+            raise
     
     def search_campaigns(
         self,
@@ -351,7 +351,7 @@ class ElasticsearchService:
             }
         except Exception as e:
             logger.error(f"Error searching campaigns: {e}")
-            return {"hits": [], "total": 0, "took": 0}
+            raise
     
     def search_users(
         self,
@@ -412,7 +412,7 @@ class ElasticsearchService:
             }
         except Exception as e:
             logger.error(f"Error searching users: {e}")
-            return {"hits": [], "total": 0, "took": 0}
+            raise
     
     def delete_document(self, index_type: str, doc_id: int) -> bool:
         """Удаление документа из индекса"""
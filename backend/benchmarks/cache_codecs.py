@@ -0,0 +1,113 @@
+"""
+Бенчмарк кодеков кэша: размер значения в Redis и время декодирования
+
+Запуск из каталога backend:
+    python -m benchmarks.cache_codecs [--number 2000]
+
+Сравнивает старый формат (pickle в hex) с CacheCodec для типичных значений:
+одного фонда, страницы каталога фондов и страницы кампаний - как Python-объектов
+(datetime, Decimal) и в JSON-представлении ответа API.
+"""
+import argparse
+import json
+import pickle
+import timeit
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from app.core.cache_codec import COMPRESSORS, SERIALIZERS, CacheCodec, decode_legacy
+from app.schemas.schemas import Campaign, Fund
+
+CREATED_AT = datetime(2025, 1, 15, 10, 30, tzinfo=timezone.utc)
+
+
+def make_fund(fund_id: int) -> dict:
+    """Фонд в том виде, в каком его отдает API"""
+    return Fund(
+        id=fund_id,
+        name=f"Благотворительный фонд «Помощь» №{fund_id}",
+        short_desc="Помощь нуждающимся семьям, строительство мечетей и колодцев, поддержка сирот. " * 2,
+        country_code="RU",
+        purposes=["mosque", "orphans", "water", "education"],
+        logo_url=f"https://cdn.sadaka-pass.ru/funds/{fund_id}/logo.png",
+        website=f"https://fund{fund_id}.example.org",
+        social_links={"telegram": f"https://t.me/fund{fund_id}", "vk": f"https://vk.com/fund{fund_id}"},
+        partner_enabled=True,
+        verified=True,
+        active=True,
+        created_at=CREATED_AT + timedelta(days=fund_id),
+    ).model_dump()
+
+
+def make_campaign(campaign_id: int) -> dict:
+    """Кампания в том виде, в каком ее отдает API"""
+    return Campaign(
+        id=campaign_id,
+        owner_id=campaign_id % 50 + 1,
+        fund_id=campaign_id % 20 + 1,
+        title=f"Строительство колодца в селе №{campaign_id}",
+        description="Сбор средств на строительство колодца с чистой питьевой водой для жителей села. " * 3,
+        category="water",
+        goal_amount=Decimal("250000.00"),
+        collected_amount=Decimal("123456.78"),
+        country_code="RU",
+        end_date=date(2025, 12, 31),
+        banner_url=f"https://cdn.sadaka-pass.ru/campaigns/{campaign_id}/banner.jpg",
+        status="active",
+        participants_count=1234,
+        created_at=CREATED_AT + timedelta(hours=campaign_id),
+    ).model_dump()
+
+
+FUNDS_PAGE = [make_fund(i) for i in range(20)]
+CAMPAIGNS_PAGE = [make_campaign(i) for i in range(50)]
+
+# Python-значения (datetime, Decimal) и их JSON-представление, как в ответе API
+PAYLOADS = {
+    "fund": make_fund(1),
+    "funds page (20)": FUNDS_PAGE,
+    "campaigns page (50)": CAMPAIGNS_PAGE,
+    "funds page, json": json.loads(json.dumps(FUNDS_PAGE, default=str)),
+    "campaigns page, json": json.loads(json.dumps(CAMPAIGNS_PAGE, default=str)),
+}
+
+
+def legacy_encode(value) -> bytes:
+    """Старый формат RedisCache._serialize"""
+    return pickle.dumps(value).hex().encode()
+
+
+def codecs() -> dict:
+    """Варианты кодирования, доступные в текущем окружении"""
+    variants = {"pickle-hex (legacy)": (legacy_encode, decode_legacy)}
+    for serializer, (_, available) in SERIALIZERS.items():
+        if not available:
+            continue
+        codec = CacheCodec(serializer)
+        variants[serializer] = (codec.encode, codec.decode)
+        for compression, (_, compression_available) in COMPRESSORS.items():
+            if compression_available:
+                codec = CacheCodec(serializer, compression, compression_threshold=512)
+                variants[f"{serializer}+{compression}"] = (codec.encode, codec.decode)
+    return variants
+
+
+def run(number: int):
+    print(f"{'payload':<22}{'codec':<22}{'bytes':>9}{'encode, us':>13}{'decode, us':>13}")
+    for payload_name, payload in PAYLOADS.items():
+        for codec_name, (encode, decode) in codecs().items():
+            encoded = encode(payload)
+            assert decode(encoded) == payload, codec_name
+            encode_time = timeit.timeit(lambda: encode(payload), number=number) / number
+            decode_time = timeit.timeit(lambda: decode(encoded), number=number) / number
+            print(
+                f"{payload_name:<22}{codec_name:<22}{len(encoded):>9}"
+                f"{encode_time * 1e6:>13.1f}{decode_time * 1e6:>13.1f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Число повторов для замера")
+    run(parser.parse_args().number)
@@ -0,0 +1,96 @@
+"""
+Бенчмарк записи метрик запроса: накладные расходы на один HTTP-запрос
+
+Запуск из каталога backend:
+    python -m benchmarks.metrics_recording [--number 200000] [--threads 1 4]
+
+Сравнивает старый MetricsCollector (общая блокировка на каждый вызов,
+ключ из словаря меток при каждом вызове, список значений гистограммы)
+с текущим: запись через словарь меток и через APIMetrics.record_request
+с заранее привязанными сериями и шардами потоков.
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+
+from app.core.metrics import APIMetrics, MetricsCollector
+
+ENDPOINT = "/api/v1/campaigns/{campaign_id}"
+
+
+class LegacyCollector:
+    """Старый MetricsCollector: блокировка, ключ и список на каждый вызов"""
+
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._histograms = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def increment_counter(self, name, value=1.0, labels=None):
+        with self._lock:
+            self._counters[self._make_key(name, labels)] += value
+
+    def observe_histogram(self, name, value, labels=None):
+        with self._lock:
+            self._histograms[self._make_key(name, labels)].append(value)
+
+    def _make_key(self, name, labels=None):
+        if not labels:
+            return name
+        label_str = ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+        return f"{name}{{{label_str}}}"
+
+
+def record_with_labels(collector):
+    """Запись метрик запроса так, как ее делал старый APIMetrics.record_request"""
+    def record(method, endpoint, status_code, duration):
+        labels = {'method': method, 'endpoint': endpoint, 'status_code': str(status_code)}
+        collector.increment_counter('api_requests_total', labels=labels)
+        collector.observe_histogram('api_request_duration_seconds', duration, labels=labels)
+        collector.increment_counter('api_responses_total', labels={'status_code': str(status_code)})
+    return record
+
+
+def variants() -> dict:
+    """Способы записи: имя -> функция record(method, endpoint, status_code, duration)"""
+    return {
+        "legacy (lock + list)": record_with_labels(LegacyCollector()),
+        "labels dict, sharded": record_with_labels(MetricsCollector()),
+        "record_request, bound": APIMetrics(MetricsCollector()).record_request,
+    }
+
+
+def measure(record, number: int, threads: int) -> float:
+    """Время одного вызова в наносекундах при записи из threads потоков"""
+    per_thread = number // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(per_thread):
+            record("GET", ENDPOINT, 200, (i % 100) / 1000)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (per_thread * threads) * 1e9
+
+
+def run(number: int, thread_counts: list):
+    print(f"{'variant':<26}" + "".join(f"{f'{threads} thr, ns':>14}" for threads in thread_counts))
+    for name, record in variants().items():
+        timings = [measure(record, number, threads) for threads in thread_counts]
+        print(f"{name:<26}" + "".join(f"{timing:>14.0f}" for timing in timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="Число записанных запросов")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="Число пишущих потоков")
+    args = parser.parse_args()
+    run(args.number, args.threads)
@@ -0,0 +1,8 @@
+-- Миграция: индексы таблицы campaign_donations
+-- Дата: 2026-10-17
+-- Описание: Индексы для списка пожертвований кампании и отчета по кампании
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_campaign_donations_campaign_created_id
+  ON campaign_donations(campaign_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_campaign_donations_campaign_status ON campaign_donations(campaign_id, status);
@@ -0,0 +1,12 @@
+-- Миграция: индексы таблицы campaigns
+-- Дата: 2026-10-17
+-- Описание: Составные индексы для списка кампаний: фильтры по статусу, стране и категории, сортировка по дате и цели
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_campaigns_status_created_id ON campaigns(status, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_campaigns_status_country_category_created_id
+  ON campaigns(status, country_code, category, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_campaigns_status_goal_id ON campaigns(status, goal_amount, id);
+
+-- collected_amount обновляется при каждом пожертвовании, индекс по нему
+-- замедлил бы запись; сортировка по сбору остается без индекса
@@ -0,0 +1,6 @@
+-- Миграция: индексы таблицы donations
+-- Дата: 2026-10-17
+-- Описание: Составной индекс для истории пожертвований пользователя (keyset по created_at, id)
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_donations_user_created_id ON donations(user_id, created_at, id);
@@ -0,0 +1,7 @@
+-- Миграция: индексы таблицы funds
+-- Дата: 2026-10-17
+-- Описание: Частичные индексы по активным фондам для каталога (keyset по id) и фильтра по стране
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_funds_active_id ON funds(id) WHERE active;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_funds_active_country_id ON funds(country_code, id) WHERE active;
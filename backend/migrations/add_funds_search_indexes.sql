@@ -0,0 +1,15 @@
+-- Миграция: индексы поиска фондов
+-- Дата: 2026-10-17
+-- Описание: Полнотекстовый (russian) и триграммный поиск фондов без Elasticsearch
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Выражение должно совпадать с fund_search_vector в app/models/models.py
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_funds_search_vector ON funds USING gin ((
+  setweight(to_tsvector('russian'::regconfig, coalesce(name, '')), 'A') ||
+  setweight(to_tsvector('russian'::regconfig, coalesce(short_desc, '')), 'B')
+)) WHERE active;
+
+-- Нечеткий поиск по названию (операторы %, %>, ILIKE)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_funds_name_trgm ON funds USING gin (name gin_trgm_ops) WHERE active;
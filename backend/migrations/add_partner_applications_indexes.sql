@@ -0,0 +1,8 @@
+-- Миграция: индексы таблицы partner_applications
+-- Дата: 2026-10-17
+-- Описание: Индексы для списка заявок партнеров с фильтром по статусу (keyset по created_at, id)
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_partner_applications_created_id ON partner_applications(created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_partner_applications_status_created_id
+  ON partner_applications(status, created_at, id);
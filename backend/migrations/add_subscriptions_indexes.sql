@@ -0,0 +1,7 @@
+-- Миграция: индексы таблицы subscriptions
+-- Дата: 2026-10-17
+-- Описание: Индексы для подписок пользователя и выборки подписок к списанию
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_user_status ON subscriptions(user_id, status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_status_next_payment ON subscriptions(status, next_payment_date);
@@ -0,0 +1,6 @@
+-- Миграция: индексы таблицы zakat_calculations
+-- Дата: 2026-10-17
+-- Описание: Индекс для истории расчетов закята пользователя
+-- Выполнять вне транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_zakat_calculations_user_created ON zakat_calculations(user_id, created_at);
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def assert_max_queries():
+    """Проверяет, что эндпоинт выполнил не больше max_queries запросов к БД"""
+    def check(response, max_queries: int):
+        assert "X-DB-Queries" in response.headers, "Response has no X-DB-Queries header"
+        
+        query_count = int(response.headers["X-DB-Queries"])
+        n_plus_one = response.headers.get("X-DB-N-Plus-One")
+        assert query_count <= max_queries, (
+            f"{response.request.method} {response.request.url.path} executed "
+            f"{query_count} queries, expected at most {max_queries}"
+            + (f" (probable N+1: {n_plus_one})" if n_plus_one else "")
+        )
+        return query_count
+    
+    return check
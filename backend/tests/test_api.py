@@ -1,25 +1,54 @@
+import asyncio
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateIndex
+import re
 import tempfile
+from unittest.mock import patch
 import os
+from datetime import datetime, timedelta
 
 from app.main import app
-from app.core.database import get_db, Base
-from app.models.models import User, Fund, Campaign, SubscriptionPlan
+from app.api.funds import build_search_query
+from app.core.database import get_db, get_sync_db, Base
+from app.core.query_metrics import instrument_engine
+from app.models.models import (
+    User, Fund, Campaign, SubscriptionPlan, Donation, CampaignDonation, Subscription,
+    ZakatCalculation, PartnerApplication, fund_search_vector
+)
 
-# Создаем тестовую базу данных в памяти
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Создаем тестовую базу данных во временном файле: синхронный engine
+# используется фикстурами, асинхронный - обработчиками API
+TEST_DB_PATH = os.path.join(tempfile.gettempdir(), "sadaka_pass_test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def override_get_db():
+# NullPool: TestClient запускает каждый запрос в своем event loop
+async_engine = create_async_engine(
+    f"sqlite+aiosqlite:///{TEST_DB_PATH}",
+    connect_args={"timeout": 60},  # параллельные записи ждут блокировку, а не падают
+    poolclass=NullPool,
+)
+instrument_engine(async_engine.sync_engine)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+def override_get_sync_db():
     try:
         db = TestingSessionLocal()
         yield db
@@ -27,6 +56,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_sync_db] = override_get_sync_db
 
 client = TestClient(app)
 
@@ -61,7 +91,7 @@ def test_fund(db_session):
     """Создает тестовый фонд"""
     fund = Fund(
         name="Test Fund",
-        description="Test fund description",
+        short_desc="Test fund description",
         country_code="RU",
         purposes=["mosque", "orphans"],
         verified=True,
@@ -120,6 +150,267 @@ class TestHealthCheck:
         assert data["database"] == "connected"
 
 
+class TestMetrics:
+    """Тесты гистограмм и экспорта метрик"""
+    
+    def test_histogram_memory_is_bounded(self):
+        """Тест: гистограмма хранит счетчики корзин, а не значения"""
+        from app.core.metrics import Histogram
+        
+        histogram = Histogram((0.1, 0.5, 1.0))
+        for i in range(10000):
+            histogram.observe(i / 10000)
+        
+        assert histogram.counts == [1001, 4000, 4999, 0]
+        assert histogram.cumulative()[-1] == (float("inf"), 10000)
+        assert histogram.count == 10000
+        assert histogram.min == 0 and histogram.max == 0.9999
+        assert abs(histogram.quantile(0.5) - 0.5) < 0.01
+        assert 0.9 < histogram.quantile(0.99) <= 0.9999
+    
+    def test_configured_buckets_and_snapshot(self):
+        """Тест настраиваемых корзин и сводки в get_metrics"""
+        from app.core.metrics import MetricsCollector
+        
+        collector = MetricsCollector()
+        collector.configure_histogram("job_items", [10, 1, 5])
+        for value in (1, 3, 7, 100):
+            collector.observe_histogram("job_items", value, labels={"job": "sync"})
+        
+        data = collector.get_metrics()["histograms"]["job_items{job=sync}"]
+        assert data["buckets"] == {"1.0": 1, "5.0": 2, "10.0": 3, "+Inf": 4}
+        assert data["count"] == 4 and data["sum"] == 111
+        assert data["min"] == 1 and data["max"] == 100
+        assert "values" not in data
+    
+    def test_prometheus_exposition(self):
+        """Тест формата Prometheus: корзины le, кавычки в метках, один TYPE на метрику"""
+        from app.core.metrics import MetricsCollector, MetricsExporter
+        
+        collector = MetricsCollector()
+        collector.configure_histogram("request_seconds", [0.1, 1])
+        collector.observe_histogram("request_seconds", 0.05, labels={"route": "/funds/{fund_id}"})
+        collector.observe_histogram("request_seconds", 2, labels={"route": "/funds/{fund_id}"})
+        collector.increment_counter("requests_total", labels={"route": '/a"b'})
+        collector.increment_counter("requests_total", labels={"route": "/c"})
+        collector.set_gauge("pool_size", 5)
+        
+        text = MetricsExporter(collector).export_prometheus()
+        lines = text.splitlines()
+        
+        assert lines.count("# TYPE requests_total counter") == 1
+        assert 'requests_total{route="/a\\"b"} 1.0' in lines
+        assert "pool_size 5.0" in lines
+        assert 'request_seconds_bucket{route="/funds/{fund_id}",le="0.1"} 1' in lines
+        assert 'request_seconds_bucket{route="/funds/{fund_id}",le="1.0"} 1' in lines
+        assert 'request_seconds_bucket{route="/funds/{fund_id}",le="+Inf"} 2' in lines
+        assert 'request_seconds_sum{route="/funds/{fund_id}"} 2.05' in lines
+        assert 'request_seconds_count{route="/funds/{fund_id}"} 2' in lines
+        assert text.endswith("\n")
+    
+    def test_sharded_recording_from_threads(self):
+        """Тест: записи из разных потоков суммируются при сборе без потерь"""
+        import threading
+        from app.core.metrics import MetricsCollector
+        
+        collector = MetricsCollector()
+        requests = collector.counter("jobs_total", {"job": "sync"})
+        durations = collector.histogram("job_seconds", {"job": "sync"})
+        
+        def worker():
+            for _ in range(1000):
+                requests.inc()
+                durations.observe(0.02)
+                collector.increment_counter("jobs_total", labels={"job": "sync"})
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        metrics = collector.get_metrics()
+        assert metrics["counters"]["jobs_total{job=sync}"] == 16000
+        histogram = metrics["histograms"]["job_seconds{job=sync}"]
+        assert histogram["count"] == 8000
+        assert histogram["buckets"]["0.025"] == histogram["buckets"]["+Inf"] == 8000
+    
+    def test_finished_thread_shards_are_retired(self):
+        """Тест: шарды завершившихся потоков сливаются, а не копятся"""
+        import threading
+        from app.core.metrics import MetricsCollector
+        
+        collector = MetricsCollector()
+        recomputes = collector.counter("cache_recomputes_total")
+        durations = collector.histogram("job_seconds")
+        
+        def worker():
+            recomputes.inc()
+            durations.observe(0.02)
+        
+        for _ in range(2000):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        
+        assert len(collector._shards) <= 2
+        metrics = collector.get_metrics()
+        assert len(collector._shards) <= 1
+        assert metrics["counters"]["cache_recomputes_total"] == 2000
+        assert metrics["histograms"]["job_seconds"]["count"] == 2000
+    
+    def test_record_request_reuses_bound_series(self):
+        """Тест: серии запроса привязываются один раз на набор меток"""
+        from app.core.metrics import APIMetrics, MetricsCollector
+        
+        collector = MetricsCollector()
+        api = APIMetrics(collector)
+        with patch.object(collector, "_make_key", wraps=collector._make_key) as make_key:
+            for _ in range(5):
+                api.record_request("GET", "/api/v1/funds/{fund_id}", 200, 0.01)
+        
+        assert make_key.call_count == 3
+        metrics = collector.get_metrics()
+        assert metrics["counters"]["api_requests_total{endpoint=/api/v1/funds/{fund_id},method=GET,status_code=200}"] == 5
+        assert metrics["counters"]["api_responses_total{status_code=200}"] == 5
+    
+    def test_multiprocess_aggregation(self, tmp_path):
+        """Тест сводки метрик воркеров: счетчики и гистограммы суммируются, измерители - по режиму"""
+        import multiprocessing
+        from app.core.metrics import MetricsCollector, MetricsExporter
+        from app.core.metrics_multiprocess import MultiprocessMetrics
+        
+        def record(collector, requests, duration, pool_size, hit_ratio, queue):
+            collector.configure_gauge("queue_depth", "max")
+            collector.increment_counter("requests_total", requests, labels={"route": "/funds"})
+            collector.observe_histogram("request_seconds", duration)
+            collector.set_gauge("database_connection_pool_size", pool_size)
+            collector.set_gauge("cache_hit_ratio", hit_ratio, labels={"tier": "l1"})
+            collector.set_gauge("queue_depth", queue)
+        
+        def worker():
+            collector = MetricsCollector()
+            record(collector, 3, 0.2, 5, 0.5, 10)
+            MultiprocessMetrics(collector, str(tmp_path)).flush()
+        
+        child = multiprocessing.get_context("fork").Process(target=worker)
+        child.start()
+        child.join()
+        
+        collector = MetricsCollector()
+        record(collector, 2, 0.02, 7, 0.9, 4)
+        aggregator = MultiprocessMetrics(collector, str(tmp_path))
+        
+        with patch("app.core.metrics_multiprocess.is_process_alive", return_value=True):
+            metrics = aggregator.get_metrics()
+            text = MetricsExporter(aggregator).export_prometheus()
+        
+        assert metrics["counters"]["requests_total{route=/funds}"] == 5
+        assert metrics["histograms"]["request_seconds"]["count"] == 2
+        assert metrics["histograms"]["request_seconds"]["buckets"]["0.025"] == 1
+        assert metrics["gauges"]["database_connection_pool_size"] == 12
+        assert metrics["gauges"]["queue_depth"] == 10
+        assert f'cache_hit_ratio{{tier="l1",pid="{child.pid}"}} 0.5' in text
+        assert 'requests_total{route="/funds"} 5.0' in text
+        
+        # Завершившийся воркер: его счетчики остаются, измерители - нет
+        metrics = aggregator.get_metrics()
+        assert metrics["counters"]["requests_total{route=/funds}"] == 5
+        assert metrics["gauges"]["database_connection_pool_size"] == 7
+        assert metrics["gauges"]["queue_depth"] == 4
+    
+    def test_request_metrics_use_route_template(self, db_session, test_fund):
+        """Тест: метрики запросов размечены шаблоном маршрута, неизвестные пути сведены"""
+        from app.core.metrics import collector
+        
+        def requests_total(endpoint, status_code):
+            key = f"api_requests_total{{endpoint={endpoint},method=GET,status_code={status_code}}}"
+            return collector.get_metrics()["counters"].get(key, 0)
+        
+        before = requests_total("/api/v1/funds/{fund_id}", 200)
+        unmatched_before = requests_total("unmatched", 404)
+        
+        client.get(f"/api/v1/funds/{test_fund.id}")
+        client.get(f"/api/v1/funds/{test_fund.id}?limit=1")
+        client.get("/wp-admin/setup-config.php")
+        
+        assert requests_total("/api/v1/funds/{fund_id}", 200) == before + 2
+        assert requests_total("unmatched", 404) == unmatched_before + 1
+        assert not any(f"/api/v1/funds/{test_fund.id}" in key for key in collector.get_metrics()["counters"])
+    
+    def test_series_cap_per_metric(self):
+        """Тест: наборы меток сверх лимита сводятся в серию __overflow__"""
+        from app.core.config import settings
+        from app.core.metrics import MetricsCollector
+        
+        collector = MetricsCollector()
+        with patch.object(settings, "metrics_max_series_per_metric", 3):
+            for user_id in range(10):
+                collector.increment_counter("logins_total", labels={"user": user_id, "source": "bot"})
+            collector.increment_counter("other_total", labels={"user": 1})
+        
+        counters = collector.get_metrics()["counters"]
+        assert len([key for key in counters if key.startswith("logins_total")]) == 4
+        assert counters["logins_total{source=__overflow__,user=__overflow__}"] == 7
+        assert counters["logins_total{source=bot,user=0}"] == 1
+        assert counters["other_total{user=1}"] == 1
+    
+    def test_event_loop_stall_reported_with_stack_and_route(self):
+        """Тест: блокирующий вызов в задаче запроса логируется со стеком и маршрутом"""
+        import time
+        from types import SimpleNamespace
+        from app.core.loop_monitor import EventLoopMonitor
+        from app.core.metrics import EventLoopMetrics, MetricsCollector
+        from app.core.query_metrics import current_request_scope
+        
+        def blocking_report_build():
+            time.sleep(0.3)
+        
+        async def handler():
+            blocking_report_build()
+        
+        async def serve():
+            monitor = EventLoopMonitor(interval=0.01, threshold=0.1, metrics=EventLoopMetrics(collector))
+            monitor.start()
+            try:
+                await asyncio.sleep(0.05)
+                # Обработчик выполняется в дочерней задаче, как за BaseHTTPMiddleware
+                current_request_scope.set({"type": "http", "route": SimpleNamespace(path="/api/v1/reports/{id}")})
+                await asyncio.create_task(handler())
+                await asyncio.sleep(0.05)
+            finally:
+                monitor.stop()
+        
+        collector = MetricsCollector()
+        with patch("app.core.loop_monitor.performance_logger") as performance_logger:
+            asyncio.run(serve())
+        
+        performance_logger.log_event_loop_stall.assert_called_once()
+        duration, route, stack = performance_logger.log_event_loop_stall.call_args.args
+        assert duration >= 0.1
+        assert route == "/api/v1/reports/{id}"
+        assert "blocking_report_build" in stack
+        
+        metrics = collector.get_metrics()
+        assert metrics["counters"]["event_loop_stalls_total{route=/api/v1/reports/{id}}"] == 1
+        lag = metrics["histograms"]["event_loop_lag_seconds"]
+        assert lag["max"] >= 0.2
+        assert lag["buckets"]["+Inf"] == lag["count"] > 1
+    
+    def test_metrics_endpoints(self):
+        """Тест эндпоинтов /metrics и /metrics/json"""
+        from app.core.metrics import collector
+        
+        collector.observe_histogram("test_endpoint_seconds", 0.2)
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'test_endpoint_seconds_bucket{le="+Inf"}' in response.text
+        
+        data = client.get("/metrics/json").json()
+        assert data["metrics"]["histograms"]["test_endpoint_seconds"]["buckets"]["0.25"] >= 1
+
+
 class TestUsersAPI:
     """Тесты для API пользователей"""
     
@@ -196,6 +487,35 @@ class TestFundsAPI:
         data = response.json()
         assert len(data) == 1
         assert "Test" in data[0]["name"]
+    
+    def test_search_funds_by_description(self, db_session, test_fund):
+        """Тест поиска фондов по описанию"""
+        response = client.get("/api/v1/funds/search/?q=description")
+        assert response.status_code == 200
+        assert [fund["id"] for fund in response.json()] == [test_fund.id]
+    
+    def test_search_query_postgresql(self):
+        """Тест полнотекстового и триграммного запроса поиска для PostgreSQL"""
+        sql = str(build_search_query("закят", "postgresql").compile(dialect=postgresql.dialect()))
+        
+        assert "@@ websearch_to_tsquery('russian'::regconfig" in sql
+        assert "funds.name %%> " in sql
+        assert "ILIKE" not in sql.upper()
+        assert "ORDER BY ts_rank_cd(" in sql
+    
+    def test_search_indexes_postgresql_only(self):
+        """Тест GIN-индексов поиска: создаются только в PostgreSQL"""
+        indexes = {index.name: index for index in Fund.__table__.indexes}
+        ddl = str(CreateIndex(indexes["idx_funds_search_vector"]).compile(dialect=postgresql.dialect()))
+        
+        assert "USING gin" in ddl
+        # Индекс построен по тому же выражению, что и запрос (DDL без имени таблицы)
+        expression = str(fund_search_vector.compile(dialect=postgresql.dialect()))
+        assert expression.replace("funds.", "") in ddl
+        with engine.connect() as conn:
+            assert "idx_funds_search_vector" not in {
+                row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")
+            }
 
 
 class TestCampaignsAPI:
@@ -256,6 +576,451 @@ class TestCampaignsAPI:
         assert data["campaign_progress"] > 0
 
 
+class TestCampaignCounters:
+    """Тесты для атомарных счетчиков кампании"""
+    
+    DONATIONS = 1000
+    CONCURRENCY = 20
+    
+    def test_parallel_donations(self, db_session, test_campaign, test_user):
+        """Тест параллельных пожертвований: без потерянных обновлений, цель достигается один раз"""
+        goal = self.DONATIONS // 2
+        test_campaign.goal_amount = goal
+        db_session.commit()
+        
+        donation_data = {
+            "user_id": test_user.id,
+            "amount": 1,
+            "currency": "RUB",
+            "payment_method": "yookassa"
+        }
+        
+        async def donate(semaphore, donor):
+            # Каждый донор со своего адреса: лимит частоты считается по IP
+            transport = httpx.ASGITransport(app=app, client=(f"10.0.{donor // 256}.{donor % 256}", 50000))
+            async with semaphore, httpx.AsyncClient(transport=transport, base_url="http://test") as donor_client:
+                return await donor_client.post(f"/api/v1/campaigns/{test_campaign.id}/donate", json=donation_data)
+        
+        async def donate_all():
+            semaphore = asyncio.Semaphore(self.CONCURRENCY)
+            return await asyncio.gather(*(donate(semaphore, donor) for donor in range(self.DONATIONS)))
+        
+        responses = asyncio.run(donate_all())
+        
+        accepted = [r for r in responses if r.status_code == 200]
+        rejected = [r for r in responses if r.status_code == 400]
+        assert len(accepted) == goal
+        assert len(rejected) == self.DONATIONS - goal
+        # Ровно одно пожертвование довело кампанию до цели
+        assert [r.json()["campaign_progress"] for r in accepted].count(100.0) == 1
+        
+        db_session.refresh(test_campaign)
+        assert test_campaign.collected_amount == goal
+        assert test_campaign.participants_count == goal
+        assert test_campaign.status == "completed"
+        assert db_session.query(CampaignDonation).filter_by(campaign_id=test_campaign.id).count() == goal
+
+
+class TestQueryCounter:
+    """Тесты для счетчика запросов к БД"""
+    
+    def test_query_count_header(self, db_session, test_fund, assert_max_queries):
+        """Тест заголовка X-DB-Queries"""
+        response = client.get(f"/api/v1/funds/{test_fund.id}")
+        assert response.status_code == 200
+        # Версия строки для ETag и сам фонд
+        assert response.headers["X-DB-Queries"] == "2"
+        assert "X-DB-N-Plus-One" not in response.headers
+        assert_max_queries(response, 2)
+    
+    def test_no_queries_without_database(self, assert_max_queries):
+        """Тест эндпоинта без обращений к БД"""
+        response = client.get("/api/v1/zakat/nisab")
+        assert response.headers["X-DB-Queries"] == "0"
+        assert_max_queries(response, 0)
+
+
+class TestConditionalRequests:
+    """Тесты ETag и условных GET-запросов"""
+    
+    def test_body_etag_and_not_modified(self, db_session, test_fund):
+        """Тест: ETag по хэшу тела и 304 без тела на совпавший If-None-Match"""
+        response = client.get("/api/v1/funds/")
+        etag = response.headers["ETag"]
+        assert etag.startswith('"') and etag.endswith('"')
+        
+        not_modified = client.get("/api/v1/funds/", headers={"If-None-Match": f'"other", W/{etag}'})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag
+        assert "content-type" not in not_modified.headers
+    
+    def test_row_version_etag_skips_handler(self, db_session, test_fund, assert_max_queries):
+        """Тест: версия строки проверяется до обработчика одним запросом"""
+        url = f"/api/v1/funds/{test_fund.id}"
+        stale = client.get(url, headers={"If-None-Match": '"stale"'})
+        assert stale.status_code == 200
+        etag = stale.headers["ETag"]
+        assert etag.startswith('"v')
+        
+        not_modified = client.get(url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == etag
+        assert_max_queries(not_modified, 1)
+        
+        test_fund.description = "Новое описание"
+        test_fund.updated_at = datetime.utcnow() + timedelta(seconds=1)
+        db_session.commit()
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+    
+    def test_plain_get_returns_version_etag(self, db_session, test_fund):
+        """Тест: обычный GET получает ETag версии, и следующий условный GET - 304"""
+        url = f"/api/v1/funds/{test_fund.id}"
+        first = client.get(url)
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+        assert etag.startswith('"v')
+        
+        not_modified = client.get(url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == etag
+    
+    def test_errors_have_no_etag(self, db_session):
+        """Тест: ETag только у успешных ответов"""
+        response = client.get("/api/v1/funds/999999", headers={"If-None-Match": "*"})
+        assert response.status_code == 404
+        assert "ETag" not in response.headers
+
+
+@pytest.fixture
+def compression_client():
+    """Приложение с CompressionMiddleware и ETagMiddleware"""
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from app.middleware import CompressionMiddleware, ETagMiddleware
+    
+    small_app = FastAPI()
+    
+    @small_app.get("/campaigns")
+    async def campaigns():
+        return [{"id": i, "description": "Сбор на строительство мечети " * 5} for i in range(100)]
+    
+    @small_app.get("/small")
+    async def small():
+        return {"ok": True}
+    
+    @small_app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(50):
+                yield f"line {i} " * 20 + "\n"
+        return StreamingResponse(lines(), media_type="text/plain")
+    
+    @small_app.get("/binary")
+    async def binary():
+        return PlainTextResponse("x" * 4096, media_type="application/octet-stream")
+    
+    small_app.add_middleware(ETagMiddleware)
+    small_app.add_middleware(CompressionMiddleware)
+    return TestClient(small_app)
+
+
+class TestCompression:
+    """Тесты сжатия ответов"""
+    
+    def test_negotiate_encoding(self):
+        """Тест выбора кодировки по Accept-Encoding"""
+        from app.core.compression import negotiate_encoding
+        
+        encodings = ["br", "zstd", "gzip"]
+        assert negotiate_encoding("gzip, deflate, br", encodings) == "br"
+        assert negotiate_encoding("gzip;q=1.0, br;q=0.5", encodings) == "gzip"
+        assert negotiate_encoding("br;q=0, gzip", encodings) == "gzip"
+        assert negotiate_encoding("*", encodings) == "br"
+        assert negotiate_encoding("identity", encodings) is None
+        assert negotiate_encoding(None, encodings) is None
+    
+    def test_large_response_compressed(self, compression_client):
+        """Тест: большой JSON сжимается, ETag становится слабым"""
+        response = compression_client.get("/campaigns", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert response.json()[99]["id"] == 99
+        assert response.headers["etag"].startswith('W/"')
+        
+        not_modified = compression_client.get(
+            "/campaigns", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+        )
+        assert not_modified.status_code == 304
+    
+    def test_small_and_binary_responses_not_compressed(self, compression_client):
+        """Тест: тела меньше compression_min_size и нетекстовые типы не сжимаются"""
+        small = compression_client.get("/small", headers={"Accept-Encoding": "gzip"})
+        binary = compression_client.get("/binary", headers={"Accept-Encoding": "gzip"})
+        identity = compression_client.get("/campaigns", headers={"Accept-Encoding": "identity"})
+        
+        assert "content-encoding" not in small.headers
+        assert "content-encoding" not in binary.headers
+        assert "content-encoding" not in identity.headers
+        assert small.json() == {"ok": True}
+    
+    def test_streaming_response_compressed(self, compression_client):
+        """Тест: потоковый ответ сжимается по частям"""
+        response = compression_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text.count("\n") == 50
+    
+    def test_disabled_by_setting(self, compression_client):
+        """Тест отключения сжатия настройкой"""
+        from app.core.config import settings
+        
+        with patch.object(settings, "enable_compression", False):
+            response = compression_client.get("/campaigns", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+
+class TestRelationshipEndpointsQueryCount:
+    """Тесты фиксированного числа запросов для эндпоинтов со связями"""
+    
+    ROWS = 10
+    
+    def test_user_donations(self, db_session, test_user, assert_max_queries):
+        """Тест истории пожертвований пользователя по разным фондам"""
+        for i in range(self.ROWS):
+            fund = Fund(name=f"Fund {i}", country_code="RU")
+            db_session.add(fund)
+            db_session.flush()
+            db_session.add(Donation(
+                user_id=test_user.id, fund_id=fund.id, amount=100 + i, payment_method="yookassa"
+            ))
+        db_session.commit()
+        
+        response = client.get(f"/api/v1/users/{test_user.id}/donations")
+        assert response.status_code == 200
+        assert len(response.json()) == self.ROWS
+        assert {d["fund_name"] for d in response.json()} == {f"Fund {i}" for i in range(self.ROWS)}
+        assert_max_queries(response, 2)
+    
+    def test_user_subscriptions(self, db_session, test_user, test_fund, test_subscription_plan, assert_max_queries):
+        """Тест подписок пользователя, в том числе без фонда"""
+        for i in range(self.ROWS):
+            db_session.add(Subscription(
+                user_id=test_user.id,
+                plan_id=test_subscription_plan.id,
+                fund_id=test_fund.id if i % 2 else None,
+                amount=290,
+                period="1M",
+                payment_method="yookassa"
+            ))
+        db_session.commit()
+        
+        response = client.get(f"/api/v1/users/{test_user.id}/subscriptions")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == self.ROWS
+        assert {s["fund_name"] for s in data} == {test_fund.name, None}
+        assert data[0]["frequency"] == "1M"
+        assert_max_queries(response, 2)
+    
+    def test_campaign_donations(self, db_session, test_campaign, assert_max_queries):
+        """Тест пожертвований кампании от разных доноров"""
+        for i in range(self.ROWS):
+            donor = User(telegram_id=1000 + i, first_name=f"Donor{i}", last_name="Test")
+            db_session.add(donor)
+            db_session.flush()
+            db_session.add(CampaignDonation(
+                campaign_id=test_campaign.id, user_id=donor.id, amount=50, payment_method="yookassa"
+            ))
+        db_session.commit()
+        
+        response = client.get(f"/api/v1/campaigns/{test_campaign.id}/donations")
+        assert response.status_code == 200
+        assert len(response.json()) == self.ROWS
+        assert response.json()[0]["user_name"].endswith(" Test")
+        assert_max_queries(response, 2)
+    
+    def test_campaign_report(self, db_session, test_campaign, test_fund, assert_max_queries):
+        """Тест отчета по кампании с названием фонда"""
+        response = client.get(f"/api/v1/campaigns/{test_campaign.id}/report")
+        assert response.status_code == 200
+        assert response.json()["fund_name"] == test_fund.name
+        assert_max_queries(response, 2)
+
+
+class TestKeysetPagination:
+    """Тесты для курсорной пагинации"""
+    
+    def _walk(self, url, limit):
+        """Проходит все страницы по X-Next-Cursor"""
+        items, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+            items.extend(response.json())
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return items, pages
+    
+    def test_campaigns_pages(self, db_session, test_user):
+        """Тест обхода кампаний без пропусков и повторов"""
+        base_time = datetime(2025, 1, 1)
+        for i in range(7):
+            db_session.add(Campaign(
+                owner_id=test_user.id, title=f"Campaign {i}", description="d", category="mosque",
+                goal_amount=1000, country_code="RU", status="active",
+                # Пары кампаний с одинаковым created_at проверяют тай-брейк по id
+                created_at=base_time + timedelta(minutes=i // 2)
+            ))
+        db_session.commit()
+        
+        items, pages = self._walk("/api/v1/campaigns/", limit=3)
+        assert pages == 3
+        assert len(items) == 7
+        assert len({c["id"] for c in items}) == 7
+        created = [c["created_at"] for c in items]
+        assert created == sorted(created, reverse=True)
+    
+    def test_campaign_donations_pages(self, db_session, test_campaign, test_user):
+        """Тест обхода пожертвований кампании"""
+        base_time = datetime(2025, 1, 1)
+        for i in range(5):
+            db_session.add(CampaignDonation(
+                campaign_id=test_campaign.id, user_id=test_user.id, amount=10 + i,
+                payment_method="yookassa", created_at=base_time
+            ))
+        db_session.commit()
+        
+        items, pages = self._walk(f"/api/v1/campaigns/{test_campaign.id}/donations", limit=2)
+        assert pages == 3
+        assert [d["id"] for d in items] == sorted((d["id"] for d in items), reverse=True)
+    
+    def test_funds_last_page_has_no_cursor(self, db_session, test_fund):
+        """Тест отсутствия курсора на последней странице"""
+        response = client.get("/api/v1/funds/", params={"limit": 1})
+        assert response.status_code == 200
+        assert "X-Next-Cursor" not in response.headers
+    
+    def test_invalid_cursor(self, db_session):
+        """Тест неверного курсора"""
+        response = client.get("/api/v1/funds/", params={"cursor": "garbage"})
+        assert response.status_code == 400
+    
+    def test_cursor_from_other_sort_rejected(self, db_session, test_user):
+        """Тест курсора, выданного для другой сортировки"""
+        for i in range(2):
+            db_session.add(Campaign(
+                owner_id=test_user.id, title=f"Campaign {i}", description="d", category="mosque",
+                goal_amount=1000 + i, country_code="RU", status="active"
+            ))
+        db_session.commit()
+        
+        response = client.get("/api/v1/campaigns/", params={"limit": 1})
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/api/v1/campaigns/", params={"cursor": cursor, "sort_by": "goal_amount"})
+        assert response.status_code == 400
+
+
+# Списочные запросы, план которых проверяется на отсутствие полного сканирования
+LIST_QUERY_ENDPOINTS = [
+    "/api/v1/funds/",
+    "/api/v1/funds/?country_code=RU",
+    "/api/v1/campaigns/",
+    "/api/v1/campaigns/?country_code=RU&category=mosque",
+    "/api/v1/campaigns/?sort_by=goal_amount&sort_order=asc",
+    "/api/v1/campaigns/{campaign_id}/donations",
+    "/api/v1/campaigns/{campaign_id}/report",
+    "/api/v1/users/{user_id}/donations",
+    "/api/v1/users/{user_id}/subscriptions",
+    "/api/v1/donations/user/{user_id}",
+    "/api/v1/zakat/user/{user_id}",
+    "/api/v1/partners/applications",
+    "/api/v1/partners/applications?status_filter=pending",
+]
+
+# Полное сканирование таблицы без индекса: "SCAN campaigns"
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+@pytest.fixture
+def seeded_db(db_session, test_user, test_fund, test_subscription_plan):
+    """Заполняет БД данными для проверки планов запросов"""
+    funds = [
+        Fund(name=f"Fund {i}", country_code="RU" if i % 2 else "KZ", active=i < 20)
+        for i in range(200)
+    ]
+    db_session.add_all(funds)
+    db_session.flush()
+    
+    campaigns = [
+        Campaign(
+            owner_id=test_user.id, fund_id=test_fund.id, title=f"Campaign {i}", description="d",
+            category=["mosque", "orphans", "medical"][i % 3], goal_amount=1000 + i,
+            country_code="RU" if i % 2 else "KZ", status=["active", "pending", "completed"][i % 3]
+        )
+        for i in range(30)
+    ]
+    db_session.add_all(campaigns)
+    db_session.flush()
+    
+    for i in range(50):
+        db_session.add(Donation(
+            user_id=test_user.id, fund_id=funds[i % 20].id, amount=100, payment_method="yookassa"
+        ))
+        db_session.add(CampaignDonation(
+            campaign_id=campaigns[i % 30].id, user_id=test_user.id, amount=50,
+            payment_method="yookassa", status="completed" if i % 2 else "pending"
+        ))
+        db_session.add(Subscription(
+            user_id=test_user.id, plan_id=test_subscription_plan.id, fund_id=funds[i % 20].id,
+            amount=290, period="1M", payment_method="yookassa"
+        ))
+        db_session.add(ZakatCalculation(user_id=test_user.id))
+        db_session.add(PartnerApplication(
+            organization_name=f"Org {i}", contact_person="Contact", email="org@example.com",
+            description="d", status="pending" if i % 2 else "approved"
+        ))
+    db_session.commit()
+    db_session.execute(text("ANALYZE"))
+    
+    return {"user_id": test_user.id, "campaign_id": campaigns[0].id}
+
+
+class TestListQueryPlans:
+    """Тесты для планов списочных запросов: каждый должен использовать индекс"""
+    
+    @pytest.mark.parametrize("endpoint", LIST_QUERY_ENDPOINTS)
+    def test_no_full_table_scan(self, seeded_db, endpoint):
+        """Тест отсутствия полного сканирования таблиц в запросах эндпоинта"""
+        statements = []
+        
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append((statement, parameters))
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            response = client.get(endpoint.format(**seeded_db))
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+        
+        assert response.status_code == 200
+        assert statements
+        
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                full_scans = [row[-1] for row in plan if FULL_SCAN.match(row[-1])]
+                assert not full_scans, f"{endpoint}: {full_scans} in plan of {statement}"
+
+
 class TestZakatAPI:
     """Тесты для API закята"""
     
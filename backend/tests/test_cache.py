@@ -0,0 +1,1277 @@
+import asyncio
+import json
+import pickle
+import threading
+import time
+import pytest
+from fnmatch import fnmatchcase
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import wraps
+from unittest.mock import AsyncMock, MagicMock, call, patch
+
+from fastapi import Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.core.cache import (
+    AsyncRedisCache, AsyncTieredCache, CacheConfig, CacheManager, LocalCache, MISSING, RedisCache, TieredCache
+)
+from app.api import campaigns as campaigns_api, funds as funds_api
+from app.core.cache_codec import CacheCodec, is_encoded
+from app.core.cache_keys import CacheKeyBuilder
+from app.core.config import settings
+from app.core.database import Base
+from app.models.models import Campaign, Fund
+from app.core.cache_stampede import EARLY, FRESH, STALE, AsyncSingleFlight, entry_state
+from app.core.metrics import collector
+
+
+@pytest.fixture
+def clock():
+    """Управляемые часы для TTL локального кэша"""
+    now = [1000.0]
+    with patch("app.core.cache.time.monotonic", side_effect=lambda: now[0]):
+        yield now
+
+
+def fake_pipeline(store):
+    """Pipeline поверх словаря: команды выполняются при execute"""
+    pipe = MagicMock()
+    calls = []
+
+    def queue(command):
+        return lambda *args, **kwargs: calls.append(lambda: command(*args, **kwargs))
+
+    def fake_set(key, value, ex=None):
+        store[key] = value
+        return True
+
+    def fake_sadd(key, *members):
+        added = set(members) - store.setdefault(key, set())
+        store[key] |= added
+        return len(added)
+
+    def fake_srem(key, *members):
+        removed = store.get(key, set()) & set(members)
+        store.get(key, set()).difference_update(removed)
+        return len(removed)
+
+    pipe.get.side_effect = queue(store.get)
+    pipe.mget.side_effect = queue(lambda keys: [store.get(key) for key in keys])
+    pipe.pttl.side_effect = queue(lambda key: 60000 if key in store else -2)
+    pipe.set.side_effect = queue(fake_set)
+    pipe.delete.side_effect = queue(lambda *keys: sum(store.pop(key, None) is not None for key in keys))
+    pipe.unlink.side_effect = pipe.delete.side_effect
+    pipe.publish.side_effect = queue(lambda channel, message: 0)
+    pipe.sadd.side_effect = queue(fake_sadd)
+    pipe.smembers.side_effect = queue(lambda key: set(store.get(key, ())))
+    pipe.srem.side_effect = queue(fake_srem)
+    pipe.expire.side_effect = queue(lambda key, ttl, nx=False, gt=False: key in store)
+    pipe.execute.side_effect = lambda: [command() for command in calls]
+    return pipe
+
+
+@pytest.fixture
+def redis_client():
+    """Клиент Redis, отвечающий из словаря"""
+    store = {}
+    client = MagicMock()
+    client.pipeline.side_effect = lambda transaction=True: fake_pipeline(store)
+    client.get.side_effect = store.get
+    client.mget.side_effect = lambda keys: [store.get(key) for key in keys]
+
+    def fake_set(key, value, nx=False, px=None, **kwargs):
+        if nx and key in store:
+            return None
+        store[key] = value
+        return True
+
+    def fake_eval(script, numkeys, key, token):
+        # Скрипт снятия блокировки: удаляет ключ, только если токен совпадает
+        if store.get(key) != token:
+            return 0
+        del store[key]
+        return 1
+
+    client.set.side_effect = fake_set
+    client.eval.side_effect = fake_eval
+    client.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value) or True
+    client.delete.side_effect = lambda *keys: sum(store.pop(key, None) is not None for key in keys)
+    client.unlink.side_effect = client.delete.side_effect
+    scans = {}
+
+    def fake_scan(cursor=0, match="*", count=None):
+        # Курсор - позиция в снимке ключей на начало обхода, как гарантия SCAN
+        if cursor == 0:
+            scans[match] = [key for key in list(store) if fnmatchcase(key, match)]
+        keys = scans[match]
+        page = keys[cursor:cursor + (count or 10)]
+        next_cursor = cursor + len(page)
+        return (next_cursor if next_cursor < len(keys) else 0), page
+
+    client.scan.side_effect = fake_scan
+    client.store = store
+    return client
+
+
+@pytest.fixture
+def async_redis_client(redis_client):
+    """Асинхронный клиент Redis поверх того же словаря"""
+    store = redis_client.store
+    client = MagicMock()
+
+    def pipeline(transaction=True):
+        pipe = fake_pipeline(store)
+        pipe.execute = AsyncMock(side_effect=pipe.execute.side_effect)
+        return pipe
+
+    client.pipeline.side_effect = pipeline
+    for command in ("get", "mget", "set", "setex", "delete", "unlink", "publish", "eval", "scan"):
+        setattr(client, command, AsyncMock(side_effect=getattr(redis_client, command).side_effect))
+    client.store = store
+    return client
+
+
+@pytest.fixture
+def tiered_cache(redis_client):
+    """Двухуровневый кэш поверх фиктивного клиента Redis"""
+    cache = TieredCache(CacheConfig(), LocalCache(max_entries=3, ttl=30), "cache:invalidate")
+    cache._client = redis_client
+    return cache
+
+
+class TestLocalCache:
+    """Тесты для локального LRU кэша"""
+
+    def test_lru_eviction(self):
+        """Тест вытеснения давно не использованных записей"""
+        local = LocalCache(max_entries=2, ttl=30)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+
+        assert local.get("a") == 1
+        assert local.get("b") is MISSING
+        assert local.get("c") == 3
+
+    def test_ttl_expiry(self, clock):
+        """Тест истечения TTL, ограниченного TTL кэша"""
+        local = LocalCache(max_entries=10, ttl=30)
+        local.set("short", 1, ttl=5)
+        local.set("long", 2, ttl=3600)
+
+        clock[0] += 6
+        assert local.get("short") is MISSING
+        assert local.get("long") == 2
+
+        clock[0] += 30
+        assert local.get("long") is MISSING
+
+    def test_delete_prefix(self):
+        """Тест удаления записей namespace"""
+        local = LocalCache()
+        local.set("funds:1", 1)
+        local.set("funds:2", 2)
+        local.set("plans:1", 3)
+
+        local.delete_prefix("funds:")
+        assert len(local) == 1
+        assert local.get("plans:1") == 3
+
+
+class TestTieredCache:
+    """Тесты для двухуровневого кэша"""
+
+    def test_second_get_served_locally(self, tiered_cache, redis_client):
+        """Тест чтения из L1 без обращения к Redis"""
+        redis_client.store["funds:catalog"] = json.dumps("catalog")
+
+        assert tiered_cache.get("catalog", "funds") == "catalog"
+        assert tiered_cache.get("catalog", "funds") == "catalog"
+        assert redis_client.pipeline.call_count == 1
+
+        gauges = collector.get_metrics()['gauges']
+        assert gauges['cache_hit_ratio{namespace=funds,tier=l1}'] > 0
+        assert gauges['cache_hit_ratio{namespace=funds,tier=total}'] == 1.0
+
+    def test_local_values_are_copies(self, tiered_cache):
+        """Тест: изменение результата не портит закэшированное значение"""
+        tiered_cache.set("plans", [{"name": "basic"}], ttl=60, namespace="plans")
+
+        tiered_cache.get("plans", "plans").append({"name": "premium"})
+        assert tiered_cache.get("plans", "plans") == [{"name": "basic"}]
+
+    def test_set_invalidates_other_workers(self, tiered_cache, redis_client):
+        """Тест публикации инвалидации при записи"""
+        tiered_cache.set("nisab", 85, namespace="zakat")
+
+        redis_client.publish.assert_called_once()
+        channel, message = redis_client.publish.call_args.args
+        assert channel == "cache:invalidate"
+        assert json.loads(message) == {
+            "origin": tiered_cache.instance_id, "key": "zakat:nisab", "prefix": None
+        }
+
+    def test_invalidation_from_other_worker(self, tiered_cache, redis_client):
+        """Тест удаления из L1 по сообщению другого воркера"""
+        redis_client.store["funds:1"] = json.dumps("old")
+        redis_client.store["funds:2"] = json.dumps("old")
+        tiered_cache.get("1", "funds")
+        tiered_cache.get("2", "funds")
+
+        tiered_cache._handle_invalidation({"data": json.dumps({"origin": tiered_cache.instance_id, "key": "funds:1"})})
+        assert tiered_cache.local.get("funds:1") is not MISSING
+
+        tiered_cache._handle_invalidation({"data": json.dumps({"origin": "other", "key": "funds:1"})})
+        assert tiered_cache.local.get("funds:1") is MISSING
+
+        tiered_cache._handle_invalidation({"data": json.dumps({"origin": "other", "prefix": "funds:"})})
+        assert len(tiered_cache.local) == 0
+
+    def test_invalidation_listener_survives_redis_outage(self, tiered_cache, redis_client):
+        """Тест: подписка восстанавливается после сбоя Redis, L1 после переподписки очищается"""
+        import redis
+
+        subscribed = threading.Event()
+        outages = iter([redis.ConnectionError("subscribe failed"), redis.ConnectionError("connection lost")])
+
+        def make_pubsub(ignore_subscribe_messages=True):
+            pubsub = MagicMock()
+            outage = next(outages, None)
+
+            def subscribe(**handlers):
+                if outage is not None and str(outage) == "subscribe failed":
+                    raise outage
+                tiered_cache.local.set("funds:1", json.dumps("stale"))
+
+            def get_message(timeout):
+                if outage is not None:
+                    raise outage
+                subscribed.set()
+                time.sleep(0.01)
+
+            pubsub.subscribe.side_effect = subscribe
+            pubsub.get_message.side_effect = get_message
+            return pubsub
+
+        redis_client.pubsub.side_effect = make_pubsub
+        with patch.multiple(TieredCache, LISTENER_POLL_INTERVAL=0.01, LISTENER_MIN_BACKOFF=0.01):
+            assert tiered_cache.start_invalidation_listener()
+            try:
+                assert subscribed.wait(2)
+                assert tiered_cache._listener.is_alive()
+            finally:
+                tiered_cache.stop_invalidation_listener()
+
+        assert redis_client.pubsub.call_count == 3
+        # L1, заполненный до переподписки, очищен: пропущенные сообщения не оставят устаревших записей
+        assert tiered_cache.local.get("funds:1") is MISSING
+        assert tiered_cache._listener is None
+
+    def test_cache_result_uses_local_tier(self, tiered_cache, redis_client):
+        """Тест прозрачной работы cache_result поверх двухуровневого кэша"""
+        calls = []
+
+        @CacheManager(tiered_cache).cache_result(ttl=60, namespace="funds")
+        def get_catalog():
+            calls.append(1)
+            return ["fund"]
+
+        assert get_catalog() == ["fund"]
+        assert get_catalog() == ["fund"]
+        assert get_catalog() == ["fund"]
+        assert len(calls) == 1
+        # Промах и заполнение L1 после записи; дальше - только L1
+        assert redis_client.pipeline.call_count == 2
+
+
+class TestAsyncCache:
+    """Тесты для асинхронного клиента кэша"""
+
+    def test_async_get_set(self, async_redis_client):
+        """Тест асинхронных get/set с тем же форматом значений"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+
+        async def scenario():
+            assert await async_cache.set("nisab", {"gold_grams": 85}, ttl=60, namespace="zakat")
+            return await async_cache.get("nisab", "zakat")
+
+        assert asyncio.run(scenario()) == {"gold_grams": 85}
+        async_redis_client.setex.assert_awaited_once()
+
+    def test_redis_errors_handled_alike(self, redis_client, async_redis_client):
+        """Тест: ошибки Redis обрабатываются одинаково в синхронном и асинхронном кэше"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        for client in (redis_client, async_redis_client):
+            client.get.side_effect = ConnectionError("redis is down")
+        redis_client.exists.side_effect = ConnectionError("redis is down")
+        async_redis_client.exists = AsyncMock(side_effect=ConnectionError("redis is down"))
+
+        async def scenario():
+            return await async_cache.get("nisab", "zakat", default=85), await async_cache.exists("nisab", "zakat")
+
+        assert cache.get("nisab", "zakat", default=85) == 85
+        assert cache.exists("nisab", "zakat") is False
+        assert asyncio.run(scenario()) == (85, False)
+
+    def test_coroutine_uses_async_client(self, tiered_cache, redis_client, async_redis_client):
+        """Тест: декоратор выбирает асинхронный клиент для корутин"""
+        async_cache = AsyncTieredCache(
+            CacheConfig(), tiered_cache.local, "cache:invalidate", tiered_cache.instance_id
+        )
+        async_cache._client = async_redis_client
+        manager = CacheManager(tiered_cache, async_cache)
+        calls = []
+
+        @manager.cache_result(ttl=60, namespace="plans")
+        async def get_plans():
+            calls.append(1)
+            return [{"name": "basic"}]
+
+        async def scenario():
+            return [await get_plans() for _ in range(3)]
+
+        assert asyncio.run(scenario()) == [[{"name": "basic"}]] * 3
+        assert len(calls) == 1
+        redis_client.get.assert_not_called()
+        redis_client.pipeline.assert_not_called()
+        async_redis_client.publish.assert_awaited_once()
+
+        # L1 общий с синхронным кэшем
+        assert tiered_cache.get(get_plans.cache_key(), "plans") == [{"name": "basic"}]
+        redis_client.pipeline.assert_not_called()
+
+    def test_coroutine_without_async_client(self, tiered_cache):
+        """Тест: без асинхронного клиента синхронный вызывается вне event loop"""
+        manager = CacheManager(tiered_cache)
+
+        @manager.cache_result(ttl=60, namespace="plans")
+        async def get_plans():
+            return ["basic"]
+
+        with patch("app.core.cache.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            assert asyncio.run(get_plans()) == ["basic"]
+        assert to_thread.call_count == 2
+
+
+class TestBatchOperations:
+    """Тесты пакетных операций и пайплайна"""
+
+    def test_get_many_single_round_trip(self, redis_client):
+        """Тест: get_many читает все ключи одним MGET"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        for fund_id in range(5):
+            cache.set(f"fund:{fund_id}", {"id": fund_id}, ttl=60, namespace="funds")
+
+        result = cache.get_many([f"fund:{fund_id}" for fund_id in range(7)], "funds")
+
+        assert result == {f"fund:{fund_id}": {"id": fund_id} for fund_id in range(5)}
+        redis_client.mget.assert_called_once()
+        redis_client.get.assert_not_called()
+
+    def test_set_many_and_delete_many(self, redis_client):
+        """Тест: set_many и delete_many выполняются одним пайплайном"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+
+        assert cache.set_many({"a": 1, "b": [2], "c": {"v": 3}}, ttl=60, namespace="warm")
+        assert redis_client.pipeline.call_count == 1
+        assert set(redis_client.store) == {"warm:a", "warm:b", "warm:c"}
+
+        assert cache.delete_many(["a", "b", "missing"], "warm") == 2
+        assert redis_client.pipeline.call_count == 2
+        assert list(redis_client.store) == ["warm:c"]
+        assert cache.delete_many([], "warm") == 0
+
+    def test_pipeline_results(self, redis_client):
+        """Тест: пайплайн возвращает десериализованные ответы в порядке команд"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        cache.set("fund:1", {"id": 1}, namespace="funds")
+
+        with cache.pipeline() as pipe:
+            pipe.set("fund:2", {"id": 2}, ttl=60, namespace="funds")
+            pipe.get("fund:1", "funds")
+            pipe.get_many(["fund:1", "fund:3"], "funds")
+            pipe.delete("fund:1", "funds")
+
+        assert pipe.results == [True, {"id": 1}, [{"id": 1}, None], True]
+        assert redis_client.pipeline.call_count == 1
+
+    def test_pipeline_error_is_logged(self, redis_client):
+        """Тест: ошибка Redis не выходит из пайплайна, результаты - None"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        broken = MagicMock()
+        broken.execute.side_effect = ConnectionError("redis is down")
+        redis_client.pipeline.side_effect = None
+        redis_client.pipeline.return_value = broken
+
+        assert not cache.set_many({"a": 1, "b": 2}, namespace="warm")
+        assert cache.delete_many(["a"], "warm") == 0
+
+    def test_tiered_get_many_uses_local_tier(self, tiered_cache, redis_client):
+        """Тест: get_many берет из L1 то, что есть, остальное - одним пайплайном"""
+        tiered_cache.set("fund:1", {"id": 1}, ttl=60, namespace="funds")
+        tiered_cache.set("fund:2", {"id": 2}, ttl=60, namespace="funds")
+        assert tiered_cache.get("fund:1", "funds") == {"id": 1}
+        redis_client.pipeline.reset_mock()
+
+        result = tiered_cache.get_many(["fund:1", "fund:2", "fund:3"], "funds")
+
+        assert result == {"fund:1": {"id": 1}, "fund:2": {"id": 2}}
+        assert redis_client.pipeline.call_count == 1
+        assert tiered_cache.local.get("funds:fund:2") is not MISSING
+
+    def test_tiered_pipeline_publishes_invalidation(self, tiered_cache, redis_client):
+        """Тест: записи пайплайна удаляются из L1 и публикуются тем же запросом"""
+        tiered_cache.set("fund:1", {"id": 1}, ttl=60, namespace="funds")
+        assert tiered_cache.get("fund:1", "funds") == {"id": 1}
+        redis_client.pipeline.reset_mock()
+        redis_client.publish.reset_mock()
+
+        assert tiered_cache.set_many({"fund:1": {"id": 10}, "fund:2": {"id": 2}}, ttl=60, namespace="funds")
+
+        assert redis_client.pipeline.call_count == 1
+        redis_client.publish.assert_not_called()
+        assert tiered_cache.local.get("funds:fund:1") is MISSING
+        assert tiered_cache.get("fund:1", "funds") == {"id": 10}
+
+    def test_invalidation_message_with_keys(self, tiered_cache):
+        """Тест: сообщение о пакетной инвалидации удаляет все ключи из L1"""
+        tiered_cache.local.set("funds:fund:1", b"1")
+        tiered_cache.local.set("funds:fund:2", b"2")
+
+        tiered_cache._handle_invalidation({
+            "data": json.dumps({"origin": "other", "keys": ["funds:fund:1", "funds:fund:2"]})
+        })
+
+        assert len(tiered_cache.local) == 0
+
+    def test_async_batch_operations(self, async_redis_client):
+        """Тест асинхронных get_many/set_many/pipeline"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+
+        async def scenario():
+            assert await async_cache.set_many({"a": 1, "b": {"v": 2}}, ttl=60, namespace="warm")
+            values = await async_cache.get_many(["a", "b", "c"], "warm")
+            async with async_cache.pipeline() as pipe:
+                pipe.get("b", "warm")
+                pipe.delete_many(["a", "b"], "warm")
+            return values, pipe.results
+
+        values, results = asyncio.run(scenario())
+        assert values == {"a": 1, "b": {"v": 2}}
+        assert results == [{"v": 2}, 2]
+        async_redis_client.mget.assert_awaited_once()
+
+    def test_invalidate_pattern_deletes_in_one_command(self, redis_client):
+        """Тест: invalidate_pattern удаляет найденные ключи одной командой"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        cache.set_many({"list:1": 1, "list:2": 2, "detail:1": 3}, namespace="funds")
+        redis_client.pipeline.reset_mock()
+
+        assert CacheManager(cache).invalidate_pattern("list:*", "funds") == 2
+        assert redis_client.pipeline.call_count == 1
+        assert list(redis_client.store) == ["funds:detail:1"]
+
+
+class TestNamespaceScan:
+    """Тесты очистки namespace и списка ключей без KEYS"""
+
+    def test_clear_namespace_unlinks_in_batches(self, redis_client):
+        """Тест: clear_namespace обходит ключи через SCAN и удаляет пачками UNLINK"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        cache.SCAN_COUNT = 4
+        cache.set_many({f"fund:{fund_id}": fund_id for fund_id in range(10)}, namespace="funds")
+        cache.set("plan:1", 1, namespace="plans")
+
+        assert cache.clear_namespace("funds")
+
+        assert list(redis_client.store) == ["plans:plan:1"]
+        assert redis_client.unlink.call_count == 3
+        assert redis_client.scan.call_args_list[0] == call(0, match="funds:*", count=4)
+        redis_client.keys.assert_not_called()
+
+    def test_get_keys_strips_only_namespace_prefix(self, redis_client):
+        """Тест: get_keys убирает только префикс namespace и повторы SCAN"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        pages = {0: (7, [b"funds:list:funds:1", b"funds:list:2"]), 7: (0, [b"funds:list:2"])}
+        redis_client.scan.side_effect = lambda cursor, match, count: pages[cursor]
+
+        assert cache.get_keys("list:*", "funds") == ["list:funds:1", "list:2"]
+        redis_client.keys.assert_not_called()
+
+    def test_async_clear_namespace(self, async_redis_client):
+        """Тест асинхронных clear_namespace и get_keys через SCAN"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+
+        async def scenario():
+            await async_cache.set_many({"a": 1, "b": 2}, namespace="warm")
+            keys = await async_cache.get_keys("*", "warm")
+            assert await async_cache.clear_namespace("warm")
+            return sorted(keys)
+
+        assert asyncio.run(scenario()) == ["a", "b"]
+        assert async_redis_client.store == {}
+        async_redis_client.keys.assert_not_called()
+
+
+class TestCacheTags:
+    """Тесты тегов записей кэша"""
+
+    def test_cache_result_tags_and_invalidation(self, redis_client):
+        """Тест: записи с тегом удаляются invalidate_tags, остальные остаются"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        manager = CacheManager(cache)
+        calls = []
+
+        @manager.cache_result(ttl=60, namespace="funds", tags=["fund:{fund_id}", "funds:list"])
+        def get_fund(fund_id, locale="ru"):
+            calls.append(fund_id)
+            return {"id": fund_id}
+
+        for fund_id in (1, 2):
+            get_fund(fund_id)
+        assert redis_client.store["tags:fund:1"] == {"funds:" + get_fund.cache_key(1)}
+        assert len(redis_client.store["tags:funds:list"]) == 2
+
+        assert manager.invalidate_tags(["fund:1"]) == 1
+        get_fund(1)
+        get_fund(2)
+        assert calls == [1, 2, 1]
+        # Удаленный ключ убран из множеств тегов
+        assert len(redis_client.store["tags:fund:1"]) == 1
+
+    def test_callable_tags(self, redis_client):
+        """Тест: теги, вычисляемые функцией от аргументов"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        manager = CacheManager(cache)
+
+        @manager.cache_result(ttl=60, namespace="campaigns", tags=lambda ids: [f"campaign:{i}" for i in ids])
+        def get_campaigns(ids):
+            return list(ids)
+
+        get_campaigns((3, 4))
+        assert "tags:campaign:3" in redis_client.store
+        assert "tags:campaign:4" in redis_client.store
+        assert manager.invalidate_tags(["campaign:4", "campaign:404"]) == 1
+
+    def test_tiered_invalidation_evicts_local_tier(self, tiered_cache, redis_client):
+        """Тест: инвалидация по тегу удаляет значение из L1 и оповещает воркеры"""
+        with tiered_cache.pipeline() as pipe:
+            pipe.set("fund:1", {"id": 1}, 60, "funds").add_tags("fund:1", ["fund:1"], 60, "funds")
+        assert tiered_cache.get("fund:1", "funds") == {"id": 1}
+
+        assert tiered_cache.invalidate_tags(["fund:1"]) == 1
+        assert tiered_cache.local.get("funds:fund:1") is MISSING
+        assert tiered_cache.get("fund:1", "funds") is None
+
+    def test_async_invalidate_tags(self, async_redis_client):
+        """Тест асинхронной записи с тегами и инвалидации"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+
+        @manager.cache_result(ttl=60, namespace="plans", tags=["plans:list"])
+        async def get_plans():
+            return ["basic"]
+
+        async def scenario():
+            await get_plans()
+            return await async_cache.invalidate_tags(["plans:list"])
+
+        assert asyncio.run(scenario()) == 1
+        assert [key for key in async_redis_client.store if key.startswith("plans:")] == []
+
+
+@pytest.fixture
+def router_db():
+    """SQLite в памяти с фондом и кампанией для вызова обработчиков роутеров"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessions() as session:
+            fund = Fund(name="Закят", country_code="RU")
+            session.add(fund)
+            await session.flush()
+            session.add(Campaign(
+                owner_id=1, fund_id=fund.id, title="Колодец", description="...", category="water",
+                goal_amount=1000, collected_amount=250, country_code="RU", status="active"
+            ))
+            await session.commit()
+
+    with patch("app.core.cache_tags.async_cache", AsyncMock()):
+        asyncio.run(setup())
+    yield sessions
+    asyncio.run(engine.dispose())
+
+
+def counted(func, calls):
+    """Обертка, считающая вызовы обработчика (сигнатура сохраняется)"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        calls.append(kwargs)
+        return await func(*args, **kwargs)
+    return wrapper
+
+
+class TestCacheKeys:
+    """Тесты построения ключей кэша"""
+
+    def test_injected_parameters_are_skipped(self):
+        """Тест: сессия БД и ответ не входят в ключ, аргументы связываются с сигнатурой"""
+        async def handler(fund_id: int, response: Response, limit: int = 20, db: AsyncSession = None):
+            pass
+
+        build = CacheKeyBuilder(handler)
+        key = build((1, Response()), {"db": MagicMock()})
+
+        assert build((), {"fund_id": 1, "response": Response(), "limit": 20, "db": MagicMock()}) == key
+        assert build((2, Response()), {}) != key
+        assert build((1, Response(), 50), {}) != key
+        assert key.startswith(f"{__name__}.TestCacheKeys.test_injected_parameters_are_skipped.<locals>.handler:v")
+
+    def test_versions_and_exclude(self):
+        """Тест: версия схемы меняет ключ, exclude убирает параметр"""
+        def handler(fund_id, trace_id=None):
+            pass
+
+        base = CacheKeyBuilder(handler)((1,), {})
+        assert CacheKeyBuilder(handler, version=2)((1,), {}) != base
+        with patch.object(settings, "cache_key_version", settings.cache_key_version + 1):
+            assert CacheKeyBuilder(handler)((1,), {}) != base
+
+        excluded = CacheKeyBuilder(handler, exclude=["trace_id"])
+        assert excluded((1,), {"trace_id": "a"}) == excluded((1,), {"trace_id": "b"})
+
+    def test_canonical_arguments(self):
+        """Тест: эквивалентные значения дают один ключ, неподдерживаемые - TypeError"""
+        def handler(filters, when=None, amount=None):
+            pass
+
+        build = CacheKeyBuilder(handler)
+        assert build(({"b": 1, "a": {2, 1}},), {}) == build(({"a": {1, 2}, "b": 1},), {})
+        assert build(({}, date(2026, 1, 1), Decimal("1.50")), {}) == build(({}, date(2026, 1, 1), Decimal("1.50")), {})
+        assert build((Query(None),), {}) == build((None,), {})
+        with pytest.raises(TypeError):
+            build((object(),), {})
+
+    def test_unsupported_argument_bypasses_cache(self, redis_client):
+        """Тест: без стабильного ключа функция вызывается напрямую"""
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        manager = CacheManager(cache)
+        calls = []
+
+        @manager.cache_result(ttl=60)
+        def handler(payload):
+            calls.append(payload)
+            return "ok"
+
+        assert handler(object()) == "ok"
+        assert handler(object()) == "ok"
+        assert len(calls) == 2
+        assert redis_client.store == {}
+
+    def test_router_handlers_hit_rate(self, router_db, async_redis_client):
+        """Тест: обработчики роутеров с новой сессией на каждый запрос попадают в кэш"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+        calls = {"get_fund": [], "get_funds": [], "get_campaign_report": []}
+
+        cached_get_fund = manager.cache_result(ttl=60, namespace="funds")(
+            counted(funds_api.get_fund, calls["get_fund"])
+        )
+        cached_get_funds = manager.cache_result(ttl=60, namespace="funds")(
+            counted(funds_api.get_funds, calls["get_funds"])
+        )
+        cached_report = manager.cache_result(ttl=60, namespace="campaigns")(
+            counted(campaigns_api.get_campaign_report, calls["get_campaign_report"])
+        )
+        requests = 20
+
+        async def scenario():
+            for _ in range(requests):
+                # Как FastAPI: новая сессия, новые Request и Response на каждый запрос
+                async with router_db() as db:
+                    fund = await cached_get_fund(fund_id=1, db=db)
+                    assert fund.name == "Закят"
+                async with router_db() as db:
+                    page = await cached_get_funds(
+                        response=Response(), country_code="RU", purpose=None, verified_only=False,
+                        active_only=True, limit=20, offset=0, cursor=None, db=db
+                    )
+                    assert [fund.id for fund in page] == [1]
+                async with router_db() as db:
+                    report = await cached_report(campaign_id=1, request=Request({"type": "http"}), db=db)
+                    assert report["collected_amount"] == 250.0
+
+        asyncio.run(scenario())
+        for name, handler_calls in calls.items():
+            hit_rate = 1 - len(handler_calls) / requests
+            assert hit_rate == (requests - 1) / requests, name
+
+
+class TestStampedeProtection:
+    """Тесты защиты от одновременного пересчета ключа"""
+
+    @staticmethod
+    def make_cache(redis_client):
+        cache = RedisCache(CacheConfig())
+        cache._client = redis_client
+        return cache
+
+    def test_single_flight_coroutines(self, async_redis_client):
+        """Тест: одновременные промахи в одном процессе вызывают функцию один раз"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+        calls = []
+
+        @manager.cache_result(ttl=60, namespace="campaigns", single_flight=True)
+        async def list_campaigns():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return [{"id": 1}]
+
+        async def scenario():
+            return await asyncio.gather(*(list_campaigns() for _ in range(200)))
+
+        assert asyncio.run(scenario()) == [[{"id": 1}]] * 200
+        assert len(calls) == 1
+
+    def test_single_flight_threads(self, redis_client):
+        """Тест: одновременные промахи из потоков вызывают функцию один раз"""
+        manager = CacheManager(self.make_cache(redis_client))
+        calls = []
+        barrier = threading.Barrier(20)
+        results = []
+
+        @manager.cache_result(ttl=60, namespace="funds", single_flight=True)
+        def list_funds():
+            calls.append(1)
+            time.sleep(0.1)
+            return ["fund"]
+
+        def worker():
+            barrier.wait()
+            results.append(list_funds())
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [["fund"]] * 20
+        assert len(calls) == 1
+
+    def test_single_flight_propagates_errors(self, async_redis_client):
+        """Тест: ошибка общего вызова получают все ожидающие, в кэш ничего не пишется"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+
+        @manager.cache_result(ttl=60, namespace="campaigns", single_flight=True)
+        async def list_campaigns():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db is down")
+
+        async def scenario():
+            return await asyncio.gather(*(list_campaigns() for _ in range(5)), return_exceptions=True)
+
+        errors = asyncio.run(scenario())
+        assert all(isinstance(error, RuntimeError) for error in errors)
+        assert async_redis_client.store == {}
+
+    def test_single_flight_survives_leader_cancellation(self):
+        """Тест: отмена первого вызывающего не отменяет общий вызов для остальных"""
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ["campaign"]
+
+        async def scenario():
+            leader = asyncio.create_task(flight.do("campaigns", load))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flight.do("campaigns", load))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            result = await follower
+            return leader.cancelled(), result, flight.in_flight("campaigns")
+
+        assert asyncio.run(scenario()) == (True, (["campaign"], True), False)
+        assert len(calls) == 1
+
+    def test_lock_across_workers(self, redis_client):
+        """Тест: с блокировкой в Redis пересчитывает только один воркер"""
+        managers = [CacheManager(self.make_cache(redis_client)) for _ in range(2)]
+        calls = []
+        barrier = threading.Barrier(10)
+        results = []
+
+        def make_func(manager):
+            @manager.cache_result(
+                ttl=60, namespace="funds", key_func=lambda: "catalog", single_flight=True, lock_ttl=2
+            )
+            def list_funds():
+                calls.append(1)
+                time.sleep(0.2)
+                return ["fund"]
+            return list_funds
+
+        funcs = [make_func(manager) for manager in managers]
+
+        def worker(func):
+            barrier.wait()
+            results.append(func())
+
+        threads = [threading.Thread(target=worker, args=(funcs[i % 2],)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [["fund"]] * 10
+        assert len(calls) == 1
+        # Блокировка снята
+        assert not any(key.startswith("lock:") for key in redis_client.store)
+
+    def test_stale_value_refreshed_once(self, async_redis_client):
+        """Тест: устаревшее значение отдается сразу и обновляется в фоне один раз"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+        calls = []
+
+        @manager.cache_result(ttl=60, namespace="campaigns", stale_ttl=300)
+        async def list_campaigns():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"version": len(calls)}
+
+        async def scenario():
+            assert await list_campaigns() == {"version": 1}
+
+            with patch("app.core.cache_stampede.time.time", return_value=time.time() + 120):
+                stale = await asyncio.gather(*(list_campaigns() for _ in range(50)))
+                assert stale == [{"version": 1}] * 50
+                await asyncio.gather(*manager._background_tasks)
+
+                return await list_campaigns()
+
+        assert asyncio.run(scenario()) == {"version": 2}
+        assert len(calls) == 2
+        # Redis хранит значение дольше мягкого срока
+        assert async_redis_client.setex.await_args.args[1] == 360
+
+    def test_background_refresh_does_not_reuse_request_session(self, async_redis_client):
+        """Тест: фоновое обновление обработчика идет через refresh без сессии запроса"""
+        async_cache = AsyncRedisCache(CacheConfig())
+        async_cache._client = async_redis_client
+        manager = CacheManager(MagicMock(), async_cache)
+        refreshed = []
+
+        async def get_fund(fund_id: int, db: AsyncSession):
+            return {"id": fund_id, "version": 1}
+
+        with pytest.raises(ValueError, match="refresh"):
+            manager.cache_result(ttl=60, namespace="funds", stale_ttl=300)(get_fund)
+
+        async def refresh_fund(**kwargs):
+            # Здесь обработчик открыл бы собственную сессию
+            refreshed.append(kwargs)
+            return {"id": kwargs["fund_id"], "version": 2}
+
+        cached_get_fund = manager.cache_result(
+            ttl=60, namespace="funds", stale_ttl=300, refresh=refresh_fund
+        )(get_fund)
+
+        async def scenario():
+            request_db = MagicMock(spec=AsyncSession)
+            assert await cached_get_fund(fund_id=1, db=request_db) == {"id": 1, "version": 1}
+
+            with patch("app.core.cache_stampede.time.time", return_value=time.time() + 120):
+                assert await cached_get_fund(fund_id=1, db=request_db) == {"id": 1, "version": 1}
+                await asyncio.gather(*manager._background_tasks)
+                return await cached_get_fund(fund_id=1, db=request_db)
+
+        assert asyncio.run(scenario()) == {"id": 1, "version": 2}
+        assert refreshed == [{"fund_id": 1}]
+
+    def test_xfetch_entry_state(self):
+        """Тест: XFetch обновляет заранее с вероятностью, зависящей от времени вычисления"""
+        entry = {"expires_at": 100.0, "delta": 10.0}
+
+        with patch("app.core.cache_stampede.random.random", return_value=0.9):
+            assert entry_state(entry, 1.0, now=95.0) == EARLY
+            assert entry_state(entry, None, now=95.0) == FRESH
+            assert entry_state({"expires_at": 100.0, "delta": 0.01}, 1.0, now=95.0) == FRESH
+        assert entry_state(entry, 1.0, now=101.0) == STALE
+
+
+class TestCacheCodec:
+    """Тесты для кодека значений кэша"""
+
+    FUND = {
+        "id": 1,
+        "name": "Фонд помощи",
+        "purposes": ["mosque", "orphans"],
+        "verified": True,
+        "rating": 4.5,
+        "created_at": datetime(2025, 1, 15, 10, 30, tzinfo=timezone.utc),
+        "goal_amount": Decimal("100000.00"),
+        "end_date": date(2025, 12, 31),
+        "logo_url": None,
+    }
+
+    def test_json_values_use_orjson(self):
+        """Тест записи значений из JSON-типов через orjson"""
+        codec = CacheCodec("orjson")
+        value = [{"id": 1, "name": "Фонд", "purposes": ["mosque"], "rating": 4.5, "logo_url": None}]
+        encoded = codec.encode(value)
+
+        assert encoded[:3] == b"\x01J-"
+        assert codec.decode(encoded) == value
+
+    def test_typed_values_keep_types(self):
+        """Тест: datetime и Decimal не превращаются в строки, а пишутся через pickle"""
+        codec = CacheCodec("orjson")
+        encoded = codec.encode([self.FUND])
+
+        assert encoded[:3] == b"\x01P-"
+        assert codec.decode(encoded) == [self.FUND]
+
+    def test_unsupported_value_falls_back_to_pickle(self):
+        """Тест записи через pickle значений с не-строковыми ключами и множествами"""
+        codec = CacheCodec("orjson")
+        value = {1: {"a", "b"}}
+        encoded = codec.encode(value)
+
+        assert encoded[1:2] == b"P"
+        assert codec.decode(encoded) == value
+
+    def test_compression_above_threshold(self):
+        """Тест сжатия только крупных значений"""
+        codec = CacheCodec("orjson", compression="zlib", compression_threshold=256)
+        page = [{"id": i, "name": f"Фонд {i}", "purposes": ["mosque", "orphans"]} for i in range(50)]
+        small = codec.encode({"name": "Фонд"})
+        large = codec.encode(page)
+
+        assert small[2:3] == b"-"
+        assert large[:3] == b"\x01JD"
+        assert len(large) < len(CacheCodec("orjson").encode(page)) / 4
+        assert codec.decode(large) == page
+
+    def test_unavailable_dependency_falls_back(self):
+        """Тест настройки с неустановленной библиотекой"""
+        with patch.dict("app.core.cache_codec.COMPRESSORS", {"zstd": (None, False)}):
+            codec = CacheCodec("orjson", compression="zstd")
+        assert codec.compressor is None
+        assert codec.decode(codec.encode({"a": 1})) == {"a": 1}
+
+    def test_integers_stay_incrementable(self):
+        """Тест: целые числа хранятся текстом для INCRBY"""
+        codec = CacheCodec()
+        assert codec.encode(42) == b"42"
+        assert codec.decode(b"43") == 43
+
+    def test_reads_legacy_values(self):
+        """Тест чтения значений старого формата (JSON и pickle-hex)"""
+        codec = CacheCodec()
+        assert codec.decode(json.dumps("текст").encode()) == "текст"
+        assert codec.decode(pickle.dumps({"goal": Decimal("5")}).hex()) == {"goal": Decimal("5")}
+
+    def test_migrate_legacy_values(self):
+        """Тест перекодирования ключей старого формата с сохранением TTL"""
+        new_value = CacheCodec().encode({"id": 1})
+        store = {
+            b"funds:1": pickle.dumps({"id": 1}).hex().encode(),
+            b"funds:2": new_value,
+            b"funds:count": b"7",
+        }
+        client = MagicMock()
+        client.scan_iter.return_value = list(store)
+        client.mget.side_effect = lambda keys: [store[key] for key in keys]
+        pipe = client.pipeline.return_value
+
+        cache = RedisCache(CacheConfig())
+        cache._client = client
+
+        assert cache.migrate_legacy_values("funds") == 1
+        client.scan_iter.assert_called_once_with(match="funds:*", count=500, _type="string")
+        pipe.set.assert_called_once_with(b"funds:1", new_value, keepttl=True, xx=True)
+        assert is_encoded(pipe.set.call_args.args[1])
+
+
+class FakeResponseStore:
+    """Хранилище ответов для ResponseCacheMiddleware"""
+
+    def __init__(self):
+        self.values = {}
+        self.writes = []
+
+    async def async_get(self, key, namespace):
+        return self.values.get((namespace, key))
+
+    async def async_set_with_tags(self, key, value, ttl, namespace, tags):
+        self.values[(namespace, key)] = value
+        self.writes.append((key, ttl, namespace, tags))
+        return True
+
+
+@pytest.fixture
+def response_cache_app():
+    """Приложение с кэшируемыми эндпоинтами и счетчиком вызовов"""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.testclient import TestClient
+    from fastapi.responses import JSONResponse
+    from app.core.response_cache import add_response_cache_tags, cache_response
+    from app.middleware import ETagMiddleware, ResponseCacheMiddleware
+
+    calls = []
+    store = FakeResponseStore()
+    app = FastAPI()
+
+    @app.get("/funds/{fund_id}")
+    @cache_response(ttl="cache_ttl_fund_data", tags=["fund:{fund_id}", "funds"])
+    async def get_fund(fund_id: int, limit: int = 10, offset: int = 0):
+        calls.append(fund_id)
+        if fund_id == 404:
+            raise HTTPException(status_code=404, detail="Fund not found")
+        return {"id": fund_id, "limit": limit, "offset": offset}
+
+    @app.get("/funds/{fund_id}/description")
+    @cache_response(ttl=60)
+    async def get_description(fund_id: int):
+        calls.append("description")
+        return {"description": "Описание фонда " * 100}
+
+    @app.get("/session")
+    @cache_response(ttl=60)
+    async def get_session(response: Response):
+        calls.append("session")
+        response.set_cookie("sid", "1")
+        return {"ok": True}
+
+    @app.get("/campaigns/{campaign_id}/report")
+    @cache_response(ttl=60, tags=["campaign:{campaign_id}"])
+    async def get_report(campaign_id: int, request: Request):
+        calls.append("report")
+        add_response_cache_tags(request, "fund:7")
+        return {"campaign_id": campaign_id}
+
+    @app.get("/search")
+    @cache_response(ttl=60)
+    async def search():
+        calls.append("search")
+        return JSONResponse({"results": []}, headers={"Cache-Control": "no-store"})
+
+    @app.get("/private")
+    async def get_private():
+        calls.append("private")
+        return {"ok": True}
+
+    app.add_middleware(ResponseCacheMiddleware, manager=store)
+    app.add_middleware(ETagMiddleware)
+    return TestClient(app), calls, store
+
+
+class TestResponseCache:
+    """Тесты кэша HTTP-ответов"""
+
+    def test_hit_skips_endpoint(self, response_cache_app):
+        """Тест: повторный запрос отдается из кэша без вызова эндпоинта"""
+        client, calls, store = response_cache_app
+
+        first = client.get("/funds/1")
+        second = client.get("/funds/1")
+
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == first.json() == {"id": 1, "limit": 10, "offset": 0}
+        assert second.headers["content-type"] == "application/json"
+        assert "accept-language" in second.headers["vary"].lower()
+        assert calls == [1]
+        assert store.writes[0][1:] == (settings.cache_ttl_fund_data, "http", ["fund:1", "funds"])
+
+    def test_query_order_is_normalized(self, response_cache_app):
+        """Тест: порядок query-параметров не влияет на ключ"""
+        client, calls, _ = response_cache_app
+
+        client.get("/funds/1?limit=5&offset=10")
+        response = client.get("/funds/1?offset=10&limit=5")
+
+        assert response.headers["x-cache"] == "HIT"
+        assert client.get("/funds/1?limit=6&offset=10").headers["x-cache"] == "MISS"
+        assert calls == [1, 1]
+
+    def test_locale_varies_key(self, response_cache_app):
+        """Тест: разные языки кэшируются отдельно, регион не учитывается"""
+        client, calls, _ = response_cache_app
+
+        client.get("/funds/1", headers={"Accept-Language": "en-US,en;q=0.9"})
+        assert client.get("/funds/1", headers={"Accept-Language": "en-GB"}).headers["x-cache"] == "HIT"
+        assert client.get("/funds/1", headers={"Accept-Language": "ar"}).headers["x-cache"] == "MISS"
+        assert client.get("/funds/1").headers["x-cache"] == "MISS"
+        assert client.get("/funds/1", headers={"Accept-Language": "ru-RU"}).headers["x-cache"] == "HIT"
+        assert calls == [1, 1, 1]
+
+    def test_errors_and_cookies_not_cached(self, response_cache_app):
+        """Тест: ответы не 200 и ответы с Set-Cookie не кэшируются"""
+        client, calls, store = response_cache_app
+
+        assert client.get("/funds/404").status_code == 404
+        assert client.get("/funds/404").headers["x-cache"] == "MISS"
+        client.get("/session")
+        assert client.get("/session").headers["x-cache"] == "MISS"
+
+        assert calls == [404, 404, "session", "session"]
+        assert store.writes == []
+
+    def test_no_store_not_cached(self, response_cache_app):
+        """Тест: ответы с Cache-Control: no-store не кэшируются"""
+        client, calls, store = response_cache_app
+
+        client.get("/search")
+        assert client.get("/search").headers["x-cache"] == "MISS"
+
+        assert calls == ["search", "search"]
+        assert store.writes == []
+
+    def test_endpoint_adds_tags(self, response_cache_app):
+        """Тест: теги, добавленные эндпоинтом, сохраняются вместе с шаблонными"""
+        client, _, store = response_cache_app
+
+        client.get("/campaigns/3/report")
+
+        assert store.writes[0][3] == ["campaign:3", "fund:7"]
+
+    def test_search_failure_not_cached(self):
+        """Тест: ошибка Elasticsearch дает 500 и не попадает в кэш ответов"""
+        from fastapi.testclient import TestClient
+        from app.api import search as search_api
+        from app.main import app
+
+        with patch.object(search_api.es_service.client, "search", side_effect=ConnectionError("down")) as search, \
+                patch.object(settings, "response_cache_enabled", True):
+            client = TestClient(app)
+            first = client.get("/api/v1/search/funds/search?q=test")
+            second = client.get("/api/v1/search/funds/search?q=test")
+
+        assert first.status_code == second.status_code == 500
+        assert second.headers["x-cache"] == "MISS"
+        assert search.call_count == 2
+
+    def test_unmarked_and_non_get_requests_bypass(self, response_cache_app):
+        """Тест: эндпоинты без @cache_response и не GET-запросы идут мимо кэша"""
+        client, calls, store = response_cache_app
+
+        client.get("/private")
+        response = client.get("/private")
+        assert "x-cache" not in response.headers
+        client.head("/funds/1")
+
+        assert calls.count("private") == 2
+        assert store.writes == []
+
+    def test_large_body_not_cached(self, response_cache_app):
+        """Тест: ответы больше response_cache_max_body_size не кэшируются"""
+        client, calls, store = response_cache_app
+
+        with patch.object(settings, "response_cache_max_body_size", 10):
+            client.get("/funds/1")
+            assert client.get("/funds/1").headers["x-cache"] == "MISS"
+
+        assert store.writes == []
+
+    def test_disabled_by_setting(self, response_cache_app):
+        """Тест отключения кэша ответов настройкой"""
+        client, calls, _ = response_cache_app
+
+        with patch.object(settings, "response_cache_enabled", False):
+            client.get("/funds/1")
+            response = client.get("/funds/1")
+
+        assert "x-cache" not in response.headers
+        assert calls == [1, 1]
+
+    def test_cached_etag_answers_not_modified(self, response_cache_app):
+        """Тест: ETag хранится с ответом, попадание с If-None-Match дает 304"""
+        client, calls, store = response_cache_app
+
+        etag = client.get("/funds/1").headers["etag"]
+        stored = dict(next(iter(store.values.values()))["headers"])
+        assert stored["etag"] == etag
+
+        response = client.get("/funds/1", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["x-cache"] == "HIT"
+        assert calls == [1]
+
+    def test_precompressed_variants_served_on_hit(self, response_cache_app):
+        """Тест: сжатые варианты сохраняются с ответом и отдаются без повторного сжатия"""
+        client, calls, store = response_cache_app
+
+        client.get("/funds/1/description")
+        with patch("app.core.compression.GzipEncoding.compress") as compress:
+            compressed = client.get("/funds/1/description", headers={"Accept-Encoding": "gzip"})
+            plain = client.get("/funds/1/description", headers={"Accept-Encoding": "identity"})
+
+        assert "gzip" in next(iter(store.values.values()))["variants"]
+        compress.assert_not_called()
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["x-cache"] == "HIT"
+        assert compressed.headers["etag"].startswith('W/"')
+        assert compressed.json() == plain.json()
+        assert "content-encoding" not in plain.headers
+        assert "accept-encoding" in plain.headers["vary"].lower()
+        assert calls == ["description"]
+
+    def test_cache_hit_keeps_route_label(self, response_cache_app):
+        """Тест: ответ из кэша попадает в метрики с шаблоном маршрута"""
+        from app.core.metrics import APIMetrics, MetricsCollector
+        from app.middleware import RequestMetricsMiddleware
+
+        client, _, _ = response_cache_app
+        metrics_collector = MetricsCollector()
+        client.app.add_middleware(RequestMetricsMiddleware, metrics=APIMetrics(metrics_collector))
+
+        client.get("/funds/1")
+        assert client.get("/funds/2").headers["x-cache"] == "MISS"
+        assert client.get("/funds/1").headers["x-cache"] == "HIT"
+
+        counters = metrics_collector.get_metrics()["counters"]
+        assert counters["api_requests_total{endpoint=/funds/{fund_id},method=GET,status_code=200}"] == 3
+
+    def test_public_endpoints_are_marked(self):
+        """Тест: публичные GET-эндпоинты фондов и кампаний кэшируются с тегами"""
+        from app.core.response_cache import policy_for
+
+        assert policy_for(funds_api.get_fund).resolve_tags({"fund_id": "7"}) == ["fund:7", "funds"]
+        assert policy_for(funds_api.get_funds).tags == ["funds:list"]
+        assert policy_for(campaigns_api.get_campaign).resolve_ttl() == settings.cache_ttl_campaign_data
+        assert policy_for(campaigns_api.get_campaign_report).tags == ["campaign:{campaign_id}"]
+        assert policy_for(funds_api.create_fund) is None
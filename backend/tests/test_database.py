@@ -0,0 +1,292 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, exc, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+import tempfile
+import os
+
+from app.core.config import settings
+from app.core.database import Base, InstrumentedQueuePool
+from app.core.metrics import collector
+from app.models.models import Campaign, CampaignDonation, Fund, PartnerApplication
+from app.core.query_metrics import (
+    RequestQueryStats, current_query_stats, current_request_scope,
+    fingerprint_statement, instrument_engine, normalize_statement, report_request_queries
+)
+
+
+@pytest.fixture
+def pooled_engine():
+    """Создает engine с маленьким инструментированным пулом"""
+    db_path = os.path.join(tempfile.gettempdir(), "sadaka_pass_pool_test.db")
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+class TestConnectionPoolMetrics:
+    """Тесты для метрик пула подключений"""
+
+    def test_pool_status_gauges(self, pooled_engine):
+        """Тест gauges выданных и свободных подключений"""
+        with pooled_engine.connect():
+            gauges = collector.get_metrics()['gauges']
+            assert gauges['database_connection_pool_checked_out{pool=sync}'] == 1
+            assert gauges['database_connection_pool_size{pool=sync}'] == 1
+
+        gauges = collector.get_metrics()['gauges']
+        assert gauges['database_connection_pool_checked_out{pool=sync}'] == 0
+        assert gauges['database_connection_pool_checked_in{pool=sync}'] == 1
+
+    def test_pool_exhaustion_recorded(self, pooled_engine):
+        """Тест фиксации исчерпания пула"""
+        key = 'database_connection_pool_timeouts_total{pool=sync}'
+        before = collector.get_metrics()['counters'].get(key, 0)
+
+        with pooled_engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                pooled_engine.connect()
+
+        metrics = collector.get_metrics()
+        assert metrics['counters'][key] == before + 1
+        assert metrics['histograms']['database_connection_pool_wait_seconds{pool=sync}']['max'] >= 0.1
+
+
+@pytest.fixture
+def instrumented_engine():
+    """Создает in-memory engine с замером времени запросов"""
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    instrument_engine(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+class TestQueryTiming:
+    """Тесты для замера времени запросов к БД"""
+
+    def test_normalize_statement(self):
+        """Тест нормализации SQL без литералов и списков параметров"""
+        statement = "SELECT * FROM funds WHERE id IN (1, 2, 3) AND name = 'Фонд' LIMIT ?"
+        assert normalize_statement(statement) == "SELECT * FROM funds WHERE id IN (?) AND name = ? LIMIT ?"
+        assert fingerprint_statement(statement) == fingerprint_statement(
+            "SELECT *  FROM funds WHERE id IN (7) AND name = 'x' LIMIT ?"
+        )
+
+    def test_query_recorded_with_route(self, instrumented_engine):
+        """Тест записи гистограммы с отпечатком запроса и маршрутом"""
+        route = SimpleNamespace(path="/api/v1/funds/{fund_id}")
+        token = current_request_scope.set({"type": "http", "path": "/api/v1/funds/1", "route": route})
+        try:
+            with instrumented_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        finally:
+            current_request_scope.reset(token)
+
+        fingerprint = fingerprint_statement("SELECT 1")
+        key = (
+            "database_query_duration_seconds{"
+            f"fingerprint={fingerprint},query_type=SELECT,"
+            "route=/api/v1/funds/{fund_id},success=True}"
+        )
+        assert collector.get_metrics()['histograms'][key]['count'] >= 1
+
+    def test_slow_query_logged(self, instrumented_engine):
+        """Тест логирования медленных запросов с параметрами"""
+        with patch.object(settings, "database_slow_query_threshold", 0.0), \
+                patch("app.core.query_metrics.performance_logger") as perf_logger:
+            with instrumented_engine.connect() as conn:
+                conn.execute(text("SELECT :value"), {"value": 42})
+
+        perf_logger.log_slow_query.assert_called_once()
+        query, duration, params = perf_logger.log_slow_query.call_args.args
+        assert query == "SELECT ?"
+        assert params == {"0": "42"}
+        assert perf_logger.log_slow_query.call_args.kwargs["route"] == "none"
+
+    def test_failed_query_recorded(self, instrumented_engine):
+        """Тест записи запроса, завершившегося ошибкой"""
+        with pytest.raises(exc.OperationalError):
+            with instrumented_engine.connect() as conn:
+                conn.execute(text("SELECT * FROM missing_table"))
+
+        counters = collector.get_metrics()['counters']
+        assert any(
+            key.startswith("database_queries_total{") and "success=False" in key
+            for key in counters
+        )
+
+
+class TestNPlusOneDetector:
+    """Тесты для счетчика запросов и детектора N+1"""
+
+    def test_queries_counted_per_request(self, instrumented_engine):
+        """Тест подсчета запросов в контексте HTTP-запроса"""
+        stats = RequestQueryStats()
+        token = current_query_stats.set(stats)
+        try:
+            with instrumented_engine.connect() as conn:
+                for user_id in range(6):
+                    conn.execute(text(f"SELECT {user_id}"))
+                conn.execute(text("SELECT 'other', 1"))
+        finally:
+            current_query_stats.reset(token)
+
+        assert stats.count == 7
+        assert stats.repeated(5) == {fingerprint_statement("SELECT 0"): 6}
+
+    def test_n_plus_one_reported(self):
+        """Тест метрики и лога для вероятного N+1"""
+        stats = RequestQueryStats()
+        for user_id in range(5):
+            stats.record(fingerprint_statement("SELECT * FROM users WHERE id = ?"), "SELECT * FROM users WHERE id = ?")
+        stats.record(fingerprint_statement("SELECT 1"), "SELECT 1")
+
+        with patch("app.core.query_metrics.performance_logger") as perf_logger:
+            report_request_queries(stats, "/api/v1/campaigns/{campaign_id}/donations")
+
+        fingerprint = fingerprint_statement("SELECT * FROM users WHERE id = ?")
+        metrics = collector.get_metrics()
+        assert metrics['counters'][
+            f"database_n_plus_one_total{{fingerprint={fingerprint},route=/api/v1/campaigns/{{campaign_id}}/donations}}"
+        ] >= 1
+        assert metrics['histograms'][
+            "database_queries_per_request{route=/api/v1/campaigns/{campaign_id}/donations}"
+        ]['max'] >= 6
+        perf_logger.log_n_plus_one.assert_called_once()
+        assert perf_logger.log_n_plus_one.call_args.args[1] == 5
+
+
+@pytest.fixture
+def tag_session():
+    """Синхронная сессия SQLite в памяти и фиктивные клиенты кэша"""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    sync_cache = MagicMock()
+    with patch("app.core.cache_tags.cache", sync_cache):
+        with sessionmaker(bind=engine, expire_on_commit=False)() as session:
+            yield session, sync_cache
+    engine.dispose()
+
+
+def invalidated(sync_cache) -> set:
+    """Все теги, сброшенные синхронным клиентом"""
+    return {tag for call in sync_cache.invalidate_tags.call_args_list for tag in call.args[0]}
+
+
+class TestCacheTagInvalidation:
+    """Тесты сброса кэша по тегам после коммита"""
+
+    def test_insert_and_update_invalidate_after_commit(self, tag_session):
+        """Тест: изменения фонда сбрасывают его теги только после коммита"""
+        session, sync_cache = tag_session
+        fund = Fund(name="Закят", country_code="RU")
+        session.add(fund)
+        session.flush()
+        sync_cache.invalidate_tags.assert_not_called()
+
+        session.commit()
+        assert invalidated(sync_cache) == {f"fund:{fund.id}", "funds:list"}
+
+        sync_cache.reset_mock()
+        fund.name = "Садака"
+        session.commit()
+        assert f"fund:{fund.id}" in invalidated(sync_cache)
+
+    def test_rollback_discards_tags(self, tag_session):
+        """Тест: откат не сбрасывает кэш, а следующий коммит не наследует его теги"""
+        session, sync_cache = tag_session
+        session.add(Fund(name="Закят", country_code="RU"))
+        session.flush()
+        session.rollback()
+
+        session.commit()
+        sync_cache.invalidate_tags.assert_not_called()
+
+    def test_unmodified_objects_are_ignored(self, tag_session):
+        """Тест: присвоение того же значения не сбрасывает кэш"""
+        session, sync_cache = tag_session
+        fund = Fund(name="Закят", country_code="RU")
+        session.add(fund)
+        session.commit()
+        sync_cache.reset_mock()
+
+        fund.name = "Закят"
+        session.commit()
+        sync_cache.invalidate_tags.assert_not_called()
+
+    def test_related_rows_invalidate_parent(self, tag_session):
+        """Тест: пожертвование в кампанию сбрасывает теги кампании"""
+        session, sync_cache = tag_session
+        session.add(CampaignDonation(campaign_id=7, user_id=1, amount=100, payment_method="card"))
+        session.commit()
+
+        assert {"campaign:7", "campaigns:list"} <= invalidated(sync_cache)
+
+    def test_bulk_update_by_id(self, tag_session):
+        """Тест: массовый UPDATE по id сбрасывает теги этих записей"""
+        session, sync_cache = tag_session
+        session.execute(
+            update(Campaign)
+            .where(Campaign.id == 5, Campaign.status == "active")
+            .values(participants_count=Campaign.participants_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+        assert invalidated(sync_cache) == {"campaign:5", "campaigns:list"}
+
+    def test_bulk_update_without_id(self, tag_session):
+        """Тест: массовый UPDATE без условия по id сбрасывает теги всей таблицы"""
+        session, sync_cache = tag_session
+        session.execute(
+            update(Campaign).where(Campaign.status == "active").values(status="completed")
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+        assert invalidated(sync_cache) == {"campaigns", "campaigns:list"}
+
+    def test_async_session_uses_async_client(self):
+        """Тест: в AsyncSession сброс ждет асинхронный клиент, синхронный не вызывается"""
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async_client = MagicMock()
+        async_client.invalidate_tags = AsyncMock(return_value=1)
+        sync_cache = MagicMock()
+
+        async def scenario():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                partner = PartnerApplication(
+                    organization_name="Фонд", contact_person="Али", email="a@example.com", description="..."
+                )
+                session.add(partner)
+                await session.commit()
+                # Кэш сброшен к возврату из commit
+                async_client.invalidate_tags.assert_awaited_once()
+            await engine.dispose()
+            return partner.id
+
+        with patch("app.core.cache_tags.async_cache", async_client), patch("app.core.cache_tags.cache", sync_cache):
+            partner_id = asyncio.run(scenario())
+
+        assert f"partner_application:{partner_id}" in async_client.invalidate_tags.await_args.args[0]
+        sync_cache.invalidate_tags.assert_not_called()